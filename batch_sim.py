@@ -0,0 +1,562 @@
+# batch_sim.py
+"""Thousands of fights at once: game_sim's rules over struct-of-arrays NumPy state.
+
+Every Player/World field becomes one array with a row per match (and a
+column per player), and step() advances all matches with a fixed sequence
+of array operations. It follows step_game() statement by statement, masks
+standing in for the ifs, so each match ends up exactly where the scalar
+simulation would (`python batch_sim.py` checks this on random input
+traces, then measures throughput). Meant for balance testing; the server
+keeps using game_sim.
+
+Tuning knobs (speed, dash_speed, shockwave_height_multiplier, ...) are
+attributes copied from a scalar Player, so they can be changed per run.
+"""
+import random
+import sys
+import time
+import numpy as np
+from game_sim import (World, Player, step_game, state_values, first_difference,
+                      initial_width, initial_height, REFERENCE_RATE, SIM_DT)
+from sim_primitives import _round
+from shared_protocol import INPUT_BUTTONS, unpack_buttons
+
+SPECIALS = ("heal", "joker", "fireball", "dash", "shockwave")
+HEAL, JOKER, FIREBALL, DASH, SHOCKWAVE = range(len(SPECIALS))
+ATTACK_TYPES = ("normal", "fireball", "dash", "shockwave")
+AT_NORMAL, AT_FIREBALL, AT_DASH, AT_SHOCKWAVE = range(len(ATTACK_TYPES))
+JOKER_DECK = ("fireball", "dash", "heal", "shockwave")     # before the per-match shuffle
+FIREBALL_SIZE = 30
+MAX_FIREBALLS = 16      # live fireballs per match; a spawn beyond this is dropped (fireball_overflow)
+
+# Player attributes that never change during a fight
+_TUNING = (
+    "speed", "max_health", "max_special", "special_cost", "special_cooldown_time",
+    "max_block_stamina", "block_drain_rate", "block_recover_rate", "combo_reset_time",
+    "shockwave_base_damage", "shockwave_height_multiplier", "max_jumps", "dash_speed",
+    "dash_time", "max_dash_charges", "width_ratio", "height_ratio",
+)
+
+# Rect coordinates are kept as integral float64s: Rect() truncates its
+# arguments (np.trunc) and movement goes through _move (game_sim.move_px).
+def _set(a, m, v):
+    """a[m] = v[m] (or = v for a scalar) without building index arrays."""
+    np.copyto(a, v, where=m, casting="unsafe")
+
+def _move(pos, carry, m, per_frame, frames, quantize=True):
+    """game_sim.move_px on the masked entries: whole pixels into pos, the remainder into carry."""
+    if quantize:
+        per_frame = np.floor(per_frame + 0.5)
+    moved = per_frame * frames + carry
+    whole = np.trunc(moved)
+    _set(carry, m, moved - whole)
+    _set(pos, m, pos + whole)
+
+def _collide(ax, ay, aw, ah, bx, by, bw, bh):
+    """Rect.colliderect, elementwise."""
+    return ((aw != 0) & (ah != 0) & (bw != 0) & (bh != 0) &
+            (ax < bx + bw) & (bx < ax + aw) & (ay < by + bh) & (by < ay + ah))
+
+class BatchSim:
+    """N independent matches stepped together.
+
+    specials is one (p1, p2) pair of special names for every match, or an
+    (n, 2) array of indices into SPECIALS. seeds seed each match's joker
+    deck shuffle like World(seed=...).
+    """
+    def __init__(self, n: int, width: int = initial_width, height: int = initial_height,
+                 specials=("heal", "joker"), seeds=None):
+        self.n = n
+        self.width, self.height = width, height
+        template = Player(0.2, None, {}, "heal")
+        for name in _TUNING:
+            setattr(self, name, getattr(template, name))
+
+        if isinstance(specials[0], str):
+            specials = [[SPECIALS.index(s) for s in specials]] * n
+        self.special_type = np.array(specials, dtype=np.int8).reshape(n, 2)
+
+        i8, f8, b1 = np.int64, np.float64, np.bool_
+        shape = (n, 2)
+        # World
+        self.time = np.zeros(n, f8)
+        self.ko = np.zeros(n, b1)
+        self.ko_y = np.zeros(n, f8)
+        self.seed = np.zeros(n, np.uint32)
+        # Players: rect, hitbox, then Player.STATE_FIELDS
+        self.x, self.y, self.w, self.h = (np.zeros(shape, f8) for _ in range(4))
+        self.hb_on = np.zeros(shape, b1)
+        self.hbx, self.hby, self.hbw, self.hbh = (np.zeros(shape, f8) for _ in range(4))
+        self.hit = np.zeros(shape, b1)              # opponent is in hit_opponents
+        self.gravity = np.zeros(shape, f8)
+        self.attacking = np.zeros(shape, b1)
+        self.attack_timer = np.zeros(shape, f8)
+        self.blocking = np.zeros(shape, b1)
+        self.facing_left = np.zeros(shape, b1)
+        self.health = np.zeros(shape, f8)
+        self.special_attack = np.zeros(shape, f8)
+        self.can_special = np.zeros(shape, b1)
+        self.special_cooldown_timer = np.zeros(shape, f8)
+        self.block_stamina = np.zeros(shape, f8)
+        self.combo_count = np.zeros(shape, i8)
+        self.last_hit_time = np.zeros(shape, f8)
+        self.stunned = np.zeros(shape, b1)
+        self.stun_timer = np.zeros(shape, f8)
+        self.knockback_velocity = np.zeros(shape, f8)
+        self.attack_type = np.zeros(shape, np.int8)
+        self.jump_count = np.zeros(shape, i8)
+        self.dashing = np.zeros(shape, b1)
+        self.dash_timer = np.zeros(shape, f8)
+        self.dash_charges = np.zeros(shape, i8)
+        self.dash_hit_this_dash = np.zeros(shape, b1)
+        self.display_health = np.zeros(shape, f8)
+        self.joker_index = np.zeros(shape, i8)
+        self.carry_x, self.carry_y = np.zeros(shape, f8), np.zeros(shape, f8)
+        self.joker_deck = np.zeros((n, 2, len(JOKER_DECK)), np.int8)
+        self.buttons = np.zeros(shape, np.uint8)    # pack_buttons() bits held
+        # Fireballs: live ones always fill the leading slots, in spawn order
+        k = MAX_FIREBALLS
+        self.fb_alive = np.zeros((n, k), b1)
+        self.fb_x, self.fb_y = np.zeros((n, k), f8), np.zeros((n, k), f8)
+        self.fb_dir = np.zeros((n, k), i8)          # +1 right, -1 left
+        self.fb_owner = np.zeros((n, k), i8)        # player column
+        self.fb_carry = np.zeros((n, k), f8)
+        self.fireball_speed, self.fireball_damage = 500, 25
+        self.fireball_overflow = 0
+
+        self.reset(seeds=seeds)
+
+    # ---------------- Reset ----------------
+    def reset(self, mask=None, seeds=None):
+        """Start fresh fights (like a new World) in the masked matches (all by default)."""
+        idx = np.arange(self.n) if mask is None else np.flatnonzero(mask)
+        if seeds is None:
+            seeds = [random.getrandbits(32) for _ in idx]
+        W, H = self.width, self.height
+        w, h = int(W * self.width_ratio), int(H * self.height_ratio)
+        floor = 0.8 * H
+        for col, x_ratio in ((0, 0.2), (1, 0.8)):
+            self.x[idx, col] = int(W * x_ratio) - w // 2
+            self.facing_left[idx, col] = x_ratio >= 0.5
+        self.y[idx] = _round(floor) - h
+        self.w[idx], self.h[idx] = w, h
+        for a in (self.hb_on, self.hit, self.attacking, self.blocking, self.stunned, self.dashing,
+                  self.dash_hit_this_dash, self.gravity, self.attack_timer, self.special_cooldown_timer,
+                  self.combo_count, self.last_hit_time, self.stun_timer, self.knockback_velocity,
+                  self.attack_type, self.jump_count, self.dash_timer, self.dash_charges,
+                  self.joker_index, self.carry_x, self.carry_y, self.buttons, self.fb_alive):
+            a[idx] = 0
+        self.health[idx] = self.display_health[idx] = 100
+        self.special_attack[idx] = 300
+        self.block_stamina[idx] = self.max_block_stamina
+        self.can_special[idx] = True
+        self.time[idx] = 0.0
+        self.ko[idx] = False
+        self.ko_y[idx] = -200
+        # Joker decks: shuffled by each match's seeded rng, player 1 first (as World does)
+        for i, seed in zip(idx, seeds):
+            self.seed[i] = seed
+            rng = random.Random(seed)
+            for col in (0, 1):
+                if self.special_type[i, col] == JOKER:
+                    deck = list(JOKER_DECK)
+                    rng.shuffle(deck)
+                    self.joker_deck[i, col] = [SPECIALS.index(c) for c in deck]
+
+    # ---------------- Step ----------------
+    def step(self, buttons=None, dt: float = SIM_DT):
+        """Advance every match one tick; buttons is an (n, 2) array of pack_buttons() bits."""
+        if buttons is not None:
+            self.buttons[:] = buttons
+        W, H = self.width, self.height
+        floor = 0.8 * H
+        floor_y = _round(floor) - self.h      # y with rect.bottom on the floor
+        x, y, w, h = self.x, self.y, self.w, self.h
+        self.time += dt
+
+        # ---- Player.update (both players; they don't interact here) ----
+        # update_rect: clamp to the arena
+        _set(y, y + h > floor, floor_y)
+        np.maximum(x, 0, out=x)
+        _set(x, x + w > W, W - w)
+
+        # handle_input
+        b = self.buttons
+        left, right, jump, attack, block, special = ((b >> i) & 1 == 1 for i in range(len(INPUT_BUTTONS)))
+        act = ~self.stunned & ~self.ko[:, None]
+        walk = act & ~self.dashing
+        frames = dt * REFERENCE_RATE
+        m = walk & left
+        _move(x, self.carry_x, m, -self.speed / REFERENCE_RATE, frames)
+        _set(self.facing_left, m, True)
+        m = walk & right
+        _move(x, self.carry_x, m, self.speed / REFERENCE_RATE, frames)
+        _set(self.facing_left, m, False)
+
+        airborne = y + h < floor - 5
+        j = act & jump
+        if j.any():
+            wall_left = x <= 0
+            wall_right = ~wall_left & (x + w >= W)
+            first = j & airborne & (self.jump_count < self.max_jumps)
+            second = j & ~first & ~airborne & (self.jump_count == 0)
+            wall = j & ~first & ~second & (wall_left | wall_right)
+            _set(self.gravity, first | second | wall, H * (-0.036))
+            self.jump_count += first
+            _set(self.jump_count, second, 1)
+            m = wall & wall_left
+            _set(x, m, x + int(0.1 * W))
+            _set(self.facing_left, m, False)
+            m = wall & wall_right
+            _set(x, m, x - int(0.1 * W))
+            _set(self.facing_left, m, True)
+
+        stamina = self.block_stamina
+        _set(self.blocking, act, block & (stamina > 0))
+        drain = act & self.blocking
+        _set(stamina, drain, stamina - self.block_drain_rate * dt)
+        m = drain & (stamina < 0)
+        _set(stamina, m, 0)
+        _set(self.blocking, m, False)
+        recover = act & ~drain
+        _set(stamina, recover, np.minimum(stamina + self.block_recover_rate * dt, self.max_block_stamina))
+
+        m = act & attack & ~self.attacking & ~self.blocking
+        if m.any():
+            self._start_attack(m, airborne)
+        m = (act & special & (self.special_attack >= self.special_cost) & self.can_special
+             & ~self.attacking & ~self.blocking)
+        if m.any():
+            self._start_special(m)
+
+        # Dash movement & hitbox
+        m = self.dashing
+        if m.any():
+            speed = np.where(self.facing_left, -self.dash_speed, self.dash_speed)
+            step_x = speed * dt
+            _move(x, self.carry_x, m, speed / REFERENCE_RATE, frames)
+            _set(self.dash_timer, m, self.dash_timer - dt)
+            cx = x + w // 2
+            _set(self.hbx, m, np.trunc(np.minimum(cx, cx + step_x)))
+            _set(self.hby, m, y)
+            _set(self.hbw, m, np.trunc(w * 0.6 + self.dash_speed * dt))
+            _set(self.hbh, m, h)
+            _set(self.hb_on, m, True)
+            end = m & (self.dash_timer <= 0)
+            for a in (self.dashing, self.hb_on, self.dash_hit_this_dash, self.hit):
+                _set(a, end, False)
+        _set(self.attack_type, ~self.dashing & (self.attack_type == AT_DASH), AT_NORMAL)
+
+        # apply_gravity
+        accel = H * 0.002
+        m = ((x <= 0) | (x + w >= W)) & (y + h < floor - 5)
+        _set(self.gravity, m, np.minimum(self.gravity, accel / 0.5))
+        self.gravity += accel * frames
+        _move(y, self.carry_y, True, self.gravity + accel * (1 - frames) / 2, frames, quantize=frames == 1)
+        m = y + h >= floor
+        _set(y, m, floor_y)
+        _set(self.carry_y, m, 0)
+        _set(self.gravity, m, 0)
+        _set(self.jump_count, m, 0)
+        knock = self.knockback_velocity
+        m = knock != 0
+        if m.any():
+            decay = 0.85 ** frames
+            if frames == 1:
+                _move(x, self.carry_x, m, knock, 1)
+            else:
+                _move(x, self.carry_x, m, knock * (1 - decay) / (0.15 * frames), frames, quantize=False)
+            _set(knock, m, knock * decay)
+            _set(knock, m & (np.abs(knock) < 1), 0)
+        m = self.stunned
+        if m.any():
+            _set(self.stun_timer, m, self.stun_timer - dt)
+            _set(self.stunned, m & (self.stun_timer <= 0), False)
+
+        # update_attack
+        m = self.attacking
+        if m.any():
+            _set(self.attack_timer, m, self.attack_timer - dt)
+            end = m & (self.attack_timer <= 0)
+            for a in (self.attacking, self.hb_on, self.hit):
+                _set(a, end, False)
+        m = ~self.can_special
+        if m.any():
+            _set(self.special_cooldown_timer, m, self.special_cooldown_timer - dt)
+            _set(self.can_special, m & (self.special_cooldown_timer <= 0), True)
+        self.display_health += (self.health - self.display_health) * (1 - 0.88 ** frames)
+
+        # ---- Fireball.update ----
+        # Live fireballs fill the leading slots, so only the first `used` columns matter
+        used = int(self.fb_alive.sum(axis=1).max())
+        alive = self.fb_alive[:, :used]
+        fx, fy = self.fb_x[:, :used], self.fb_y[:, :used]
+        if used:
+            _move(fx, self.fb_carry[:, :used], alive, self.fb_dir[:, :used] * (self.fireball_speed / REFERENCE_RATE),
+                  frames)
+            alive &= (fx + FIREBALL_SIZE >= 0) & (fx <= W)
+
+        # Passive special gain
+        np.minimum(self.special_attack + 10 * dt, self.max_special, out=self.special_attack)
+
+        # Basic attack collisions, player 1's first
+        floor_gap = floor - (y + h)
+        for a in (0, 1):
+            self._handle_attack(a, 1 - a, floor_gap)
+
+        # Fireball collisions. Player rects don't move in here, so every
+        # contact is known up front; only their effects go oldest fireball first.
+        if used:
+            owner = self.fb_owner[:, :used]
+            size = FIREBALL_SIZE
+            hit_p1 = alive & (owner != 0) & _collide(
+                fx, fy, size, size, x[:, :1], y[:, :1], w[:, :1], h[:, :1])
+            hit_p2 = alive & ~hit_p1 & (owner != 1) & _collide(
+                fx, fy, size, size, x[:, 1:], y[:, 1:], w[:, 1:], h[:, 1:])
+            for k in np.flatnonzero((hit_p1 | hit_p2).any(axis=0)):
+                for m, d in ((hit_p1[:, k], 0), (hit_p2[:, k], 1)):
+                    if m.any():
+                        self._land_hit(1 - d, d, m, self.fireball_damage, 0.9, 35)
+            alive &= ~(hit_p1 | hit_p2)
+            self._compact_fireballs()
+
+        # KO
+        m = ~self.ko & ((self.health[:, 0] <= 0) | (self.health[:, 1] <= 0))
+        if m.any():
+            _set(self.ko, m, True)
+            _set(self.ko_y, m, -0.4 * H)
+        ko = self.ko
+        if ko.any():
+            _set(self.ko_y, ko, np.minimum(self.ko_y + 600 * dt, 0.3 * H))
+
+    def _start_attack(self, m, airborne):
+        x, y, w, h = self.x, self.y, self.w, self.h
+        _set(self.attack_type, m, AT_NORMAL)
+        _set(self.attacking, m, True)
+        _set(self.attack_timer, m, 0.2)
+        air = m & airborne
+        ground = m & ~airborne
+        cx = x + w // 2
+        _set(self.hbx, air, np.trunc(cx - 0.2 * w))
+        _set(self.hby, air, np.trunc(y - 0.5 * h))
+        _set(self.hbw, air, np.trunc(0.4 * w))
+        _set(self.hbh, air, np.trunc(0.5 * h))
+        _set(self.hbx, ground, np.where(self.facing_left, np.trunc(x - 0.35 * w), x + w))
+        _set(self.hby, ground, np.trunc(y + 0.2 * h))
+        _set(self.hbw, ground, np.trunc(0.35 * w))
+        _set(self.hbh, ground, np.trunc(0.6 * h))
+        _set(self.hb_on, m, True)
+        _set(self.hit, m, False)
+
+    def _start_special(self, m):
+        x, y, w, h = self.x, self.y, self.w, self.h
+        _set(self.special_attack, m, self.special_attack - self.special_cost)
+        _set(self.can_special, m, False)
+        _set(self.special_cooldown_timer, m, self.special_cooldown_time)
+
+        joker = self.special_type == JOKER
+        drawn = np.take_along_axis(self.joker_deck, self.joker_index[:, :, None], axis=2)[:, :, 0]
+        chosen = np.where(joker, drawn, self.special_type)
+        cx, cy = x + w // 2, y + h // 2
+
+        c = m & (chosen == FIREBALL)
+        if c.any():
+            _set(self.attack_type, c, AT_FIREBALL)
+            for col in (0, 1):      # player 1's fireball joins the group first
+                rows = np.flatnonzero(c[:, col])
+                slot = self.fb_alive[rows].sum(axis=1)
+                ok = slot < MAX_FIREBALLS
+                self.fireball_overflow += int((~ok).sum())
+                rows, slot = rows[ok], slot[ok]
+                self.fb_alive[rows, slot] = True
+                self.fb_x[rows, slot] = cx[rows, col] - FIREBALL_SIZE // 2
+                self.fb_y[rows, slot] = cy[rows, col] - 10 - FIREBALL_SIZE // 2
+                self.fb_dir[rows, slot] = np.where(self.facing_left[rows, col], -1, 1)
+                self.fb_owner[rows, slot] = col
+                self.fb_carry[rows, slot] = 0.0
+
+        c = m & (chosen == DASH)
+        if c.any():
+            _set(self.attack_type, c, AT_DASH)
+            _set(self.dashing, c, True)
+            _set(self.dash_timer, c, self.dash_time)
+            _set(self.dash_charges, c, self.max_dash_charges)
+            _set(self.dash_hit_this_dash, c, False)
+            _set(self.hit, c, False)
+
+        c = m & (chosen == HEAL)
+        _set(self.health, c, np.minimum(self.health + 20, self.max_health))
+
+        c = m & (chosen == SHOCKWAVE)
+        if c.any():
+            radius = np.maximum(w, h) * 1.85
+            _set(self.attack_type, c, AT_SHOCKWAVE)
+            _set(self.hbx, c, np.trunc(cx - radius / 2))
+            _set(self.hby, c, np.trunc(cy - radius / 2))
+            _set(self.hbw, c, np.trunc(radius))
+            _set(self.hbh, c, np.trunc(radius))
+            _set(self.hb_on, c, True)
+            _set(self.attacking, c, True)
+            _set(self.attack_timer, c, 0.3)
+            _set(self.hit, c, False)
+
+        c = m & joker
+        _set(self.joker_index, c, (self.joker_index + 1) % len(JOKER_DECK))
+
+    def _gain_special(self, col, m, amount):
+        """Player.gain_special on column col of the masked rows."""
+        s = self.special_attack[:, col]
+        _set(s, m, np.minimum(s + amount, self.max_special))
+
+    def _deal_damage(self, col, m, amount):
+        """Player.deal_damage on column col of the masked rows."""
+        hp = self.health[:, col]
+        _set(hp, m, np.maximum(hp - amount, 0))
+        self._gain_special(col, m, amount * 0.5)
+
+    def _stun(self, a, d, m, stun, knock):
+        _set(self.stunned[:, d], m, True)
+        _set(self.stun_timer[:, d], m, stun)
+        _set(self.knockback_velocity[:, d], m, np.where(self.facing_left[:, a], -knock, knock))
+
+    def _land_hit(self, a, d, m, damage, stun, knock):
+        """Combo bookkeeping of a basic attack or fireball from column a landing on column d."""
+        now = self.time
+        combo = self.combo_count[:, a]
+        _set(combo, m & (now - self.last_hit_time[:, a] > self.combo_reset_time), 0)
+        combo += m
+        _set(self.last_hit_time[:, a], m, now)
+        self._deal_damage(d, m & ~self.blocking[:, d], damage)
+        self._gain_special(a, m, damage * 1.5)
+        self._gain_special(d, m, damage * 0.5)
+        s = m & (combo >= 4)
+        if s.any():
+            self._stun(a, d, s, stun, knock)
+            _set(combo, s, 0)
+
+    def _handle_attack(self, a, d, floor_gap):
+        hb_on = self.hb_on[:, a]
+        if not hb_on.any():
+            return
+        contact = hb_on & ~self.hit[:, a] & _collide(
+            self.hbx[:, a], self.hby[:, a], self.hbw[:, a], self.hbh[:, a],
+            self.x[:, d], self.y[:, d], self.w[:, d], self.h[:, d])
+        if not contact.any():
+            return
+        dash = (self.attack_type[:, a] == AT_DASH) & self.dashing[:, a]
+        m = dash & contact
+        if m.any():
+            self._deal_damage(d, m, 30)
+            self._stun(a, d, m, 0.4, 15)
+            _set(self.hit[:, a], m, True)
+            _set(self.dash_hit_this_dash[:, a], m, True)
+        m = ~dash & contact
+        if m.any():
+            damage = np.where(self.attack_type[:, a] == AT_SHOCKWAVE,
+                              self.shockwave_base_damage
+                              + np.maximum(0, floor_gap[:, a]) * self.shockwave_height_multiplier, 5)
+            _set(self.hit[:, a], m, True)
+            self._land_hit(a, d, m, damage, 0.7, 18)
+
+    def _compact_fireballs(self):
+        """Keep live fireballs in the leading slots, in spawn order."""
+        alive = self.fb_alive
+        rows = np.flatnonzero((alive[:, 1:] & ~alive[:, :-1]).any(axis=1))
+        if len(rows):
+            order = np.argsort(~alive[rows], axis=1, kind="stable")
+            for a in (self.fb_alive, self.fb_x, self.fb_y, self.fb_dir, self.fb_owner, self.fb_carry):
+                a[rows] = np.take_along_axis(a[rows], order, axis=1)
+
+    # ---------------- Results ----------------
+    def winner(self):
+        """Per match: 1 or 2 when that player won by KO, 0 while nobody has."""
+        p1_down = self.health[:, 0] <= 0
+        p2_down = self.health[:, 1] <= 0
+        return np.where(p2_down & ~p1_down, 1, np.where(p1_down & ~p2_down, 2, 0))
+
+    def state_values(self, i: int) -> tuple:
+        """Match i in the layout of game_sim.state_values(), for comparing with a World."""
+        vals = [float(self.time[i]), bool(self.ko[i]), float(self.ko_y[i]), self.width, self.height]
+        for col in (0, 1):
+            p = lambda a: a[i, col].item()
+            q = lambda a: int(a[i, col])
+            vals += [q(self.x), q(self.y), q(self.w), q(self.h)]
+            if p(self.hb_on):
+                vals += [q(self.hbx), q(self.hby), q(self.hbw), q(self.hbh)]
+            else:
+                vals += [None] * 4
+            vals.append((2 - col,) if p(self.hit) else ())
+            joker = p(self.special_type) == JOKER
+            deck = tuple(SPECIALS[c] for c in self.joker_deck[i, col]) if joker else None
+            vals += [
+                p(self.gravity), p(self.attacking), p(self.attack_timer), p(self.blocking),
+                "left" if p(self.facing_left) else "right", p(self.health), p(self.special_attack),
+                p(self.can_special), p(self.special_cooldown_timer), p(self.block_stamina),
+                p(self.combo_count), p(self.last_hit_time), p(self.stunned), p(self.stun_timer),
+                p(self.knockback_velocity), ATTACK_TYPES[p(self.attack_type)], p(self.jump_count), False,
+                p(self.dashing), p(self.dash_timer), p(self.dash_charges), p(self.dash_hit_this_dash),
+                p(self.display_health), p(self.joker_index) if joker else None,
+                deck[p(self.joker_index)] if joker else None, p(self.carry_x), p(self.carry_y),
+            ]
+            bits = p(self.buttons)
+            vals += [(bits >> k) & 1 for k in range(len(INPUT_BUTTONS))]
+            vals.append(deck)
+        for k in np.flatnonzero(self.fb_alive[i]):
+            vals += [int(self.fb_x[i, k]), int(self.fb_y[i, k]), FIREBALL_SIZE, FIREBALL_SIZE,
+                     "right" if self.fb_dir[i, k] > 0 else "left", self.fb_owner[i, k].item() + 1,
+                     self.fireball_speed, self.fireball_damage, self.fb_carry[i, k].item()]
+        return tuple(vals)
+
+# ---------------- Equivalence check and benchmark ----------------
+def random_buttons(rng, n):
+    """(n, 2) button bits: each player holds a random combination for a while."""
+    return np.array([[rng.randrange(64) for _ in range(2)] for _ in range(n)], np.uint8)
+
+def check_equivalence(matches: int = 40, ticks: int = 1800, seed: int = 1) -> bool:
+    """Step World/step_game and BatchSim side by side on random traces; report the first mismatch."""
+    rng = random.Random(seed)
+    specials = [[rng.randrange(len(SPECIALS)) for _ in range(2)] for _ in range(matches)]
+    seeds = [rng.getrandbits(32) for _ in range(matches)]
+    batch = BatchSim(matches, specials=specials, seeds=seeds)
+    worlds = [World(p1_special=SPECIALS[a], p2_special=SPECIALS[b], seed=s)
+              for (a, b), s in zip(specials, seeds)]
+    buttons = random_buttons(rng, matches)
+    for t in range(ticks):
+        for i in range(matches):
+            if rng.random() < 0.08:
+                buttons[i, rng.randrange(2)] = rng.randrange(64)
+        batch.step(buttons)
+        for i, world in enumerate(worlds):
+            step_game(world, SIM_DT, {1: unpack_buttons(int(buttons[i, 0])), 2: unpack_buttons(int(buttons[i, 1]))})
+            diff = first_difference(state_values(world), batch.state_values(i))
+            if diff:
+                name, ours, theirs = diff
+                print(f"[BATCH] mismatch in match {i} ({SPECIALS[specials[i][0]]} vs {SPECIALS[specials[i][1]]}) "
+                      f"at tick {t + 1}: {name} step_game={ours!r} batch={theirs!r}")
+                return False
+    kos = int(batch.ko.sum())
+    print(f"[BATCH] {matches} matches x {ticks} ticks identical to step_game ({kos} ended in a KO)")
+    return True
+
+def benchmark(matches: int = 4096, ticks: int = 600):
+    rng = random.Random(2)
+    batch = BatchSim(matches, specials=[[rng.randrange(len(SPECIALS)) for _ in range(2)] for _ in range(matches)])
+    presses = [random_buttons(rng, matches) for _ in range(16)]
+    t0 = time.perf_counter()
+    for t in range(ticks):
+        batch.step(presses[t // 15 % len(presses)])
+    batch_rate = matches * ticks / (time.perf_counter() - t0)
+
+    world = World()
+    t0 = time.perf_counter()
+    for t in range(ticks):
+        bits = presses[t // 15 % len(presses)][0]
+        step_game(world, SIM_DT, {1: unpack_buttons(int(bits[0])), 2: unpack_buttons(int(bits[1]))})
+    scalar_rate = ticks / (time.perf_counter() - t0)
+    print(f"[BATCH] {matches} matches: {batch_rate:,.0f} match-ticks/s batched vs {scalar_rate:,.0f} with step_game "
+          f"({batch_rate / scalar_rate:.0f}x)")
+
+if __name__ == "__main__":
+    ok = check_equivalence()
+    benchmark()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,74 @@
+# bench_codec.py
+"""Micro-benchmark: bytes per snapshot and encode/decode time, JSON vs binary."""
+import timeit
+from shared_protocol import encode, decode, encode_binary, decode_binary, SnapshotSender, SnapshotReceiver
+
+def sample_player(x, facing, hitbox=True):
+    return {
+        "x": x, "y": 300, "w": 48, "h": 100,
+        "hp": 72.5, "hpMax": 100, "hpDisp": 80.1234,
+        "special": 143.25, "specialMax": 300,
+        "block": 64.5, "blockMax": 100,
+        "facing": facing, "blocking": False,
+        "attacking": hitbox, "attackType": "normal",
+        "stunned": False,
+        "hitbox": {"x": x + 48, "y": 320, "w": 16, "h": 60} if hitbox else None,
+    }
+
+def server_state():
+    """Same shape as server.py pack_state(), mid-fight with two fireballs."""
+    return {
+        "p1": sample_player(160, "right"),
+        "p2": sample_player(610, "left", hitbox=False),
+        "fireballs": [{"x": 250, "y": 340, "dir": "right"}, {"x": 520, "y": 340, "dir": "left"}],
+        "ko": False,
+        "width": 800, "height": 500,
+    }
+
+def online_state():
+    """Same shape as OnlineServer.pack_state()."""
+    s = server_state()
+    for p in (s["p1"], s["p2"]):
+        del p["attacking"], p["attackType"], p["stunned"]
+        p["anim"] = "run"; p["frame"] = 3
+    del s["width"], s["height"]
+    s.update({
+        "started": True, "joined": {"p1": True, "p2": True},
+        "sim": {"w": 800, "h": 500}, "bg_index": 2,
+        "p1_char": "Pink_Monster", "p2_char": "Owl_Monster",
+    })
+    return s
+
+def bench(name, state, number=20000):
+    json_pkt = encode(state)
+    bin_pkt = encode_binary(state)
+    t_je = timeit.timeit(lambda: encode(state), number=number) / number * 1e6
+    t_jd = timeit.timeit(lambda: decode(json_pkt), number=number) / number * 1e6
+    t_be = timeit.timeit(lambda: encode_binary(state), number=number) / number * 1e6
+    t_bd = timeit.timeit(lambda: decode_binary(bin_pkt), number=number) / number * 1e6
+
+    print(f"{name}")
+    print(f"  {'codec':<8}{'bytes':>8}{'encode us':>12}{'decode us':>12}")
+    print(f"  {'json':<8}{len(json_pkt):>8}{t_je:>12.2f}{t_jd:>12.2f}")
+    print(f"  {'binary':<8}{len(bin_pkt):>8}{t_be:>12.2f}{t_bd:>12.2f}")
+
+def bench_delta(name, make_state, ticks=600):
+    """Steady-state stream: P1 walks right, everything else idles, client acks every tick."""
+    sender, receiver = SnapshotSender(), SnapshotReceiver()
+    total = 0
+    for tick in range(1, ticks + 1):
+        state = make_state()
+        state["p1"]["x"] = 100 + tick % 500
+        pkt = sender.encode(state, tick)
+        total += len(pkt)
+        receiver.decode(pkt)
+        sender.ack(receiver.last_tick)
+    full = len(encode_binary(make_state()))
+    print(f"{name} delta stream: {total / ticks:.1f} bytes/snapshot avg "
+          f"(keyframe {full}, {sender.keyframes_sent} keyframes / {sender.deltas_sent} deltas)")
+
+if __name__ == "__main__":
+    bench("server.py pack_state", server_state())
+    bench("OnlineServer.pack_state", online_state())
+    bench_delta("server.py", server_state)
+    bench_delta("OnlineServer", online_state)
@@ -0,0 +1,116 @@
+# bench_handoff.py
+"""Benchmark: the client render loop's per-frame cost of getting at the latest snapshot.
+
+Compares the old path (take state_lock, copy.deepcopy(state), interpolate)
+with SnapshotHandoff (drain into the SnapshotBuffer, shallow frame(),
+interpolate) on snapshots of a recorded fight, decoded the way the client
+decodes them. Reports time per frame and the memory each frame allocates
+(tracemalloc peak above the frame's start) and how much of that the
+frame dict it hands to drawing holds. SnapshotHandoff's time includes the
+SnapshotBuffer.push() calls, which moved from the network thread to the loop.
+"""
+import copy
+import threading
+import time
+import tracemalloc
+
+from bench_suite import combo_bot, play
+from game_sim import World, pack_state, SIM_RATE
+from shared_protocol import SnapshotSender, SnapshotReceiver, flatten_snapshot
+from interpolation import SnapshotBuffer, SnapshotHandoff
+
+CLIENT_FPS = 120
+LATENCY = 0.03      # s from server tick to arrival, constant so both paths see the same timeline
+OWN, REMOTE = "p1", "p2"
+
+def recorded_snapshots(ticks=600):
+    """(arrival time, decoded snapshot) for every tick of a combo fight, delta-coded and acked like online."""
+    world = World(seed=1)
+    sender, receiver = SnapshotSender(), SnapshotReceiver()
+    out = []
+    for tick in range(1, ticks + 1):
+        play(world, 1, combo_bot)
+        state = pack_state(world)
+        s = receiver.decode(sender.encode(state, tick, flatten_snapshot(state)))
+        sender.ack(receiver.last_tick)
+        out.append((tick / SIM_RATE + LATENCY, s))
+    return out
+
+def deepcopy_frames(snaps, frames):
+    """Render loop before SnapshotHandoff: the net thread pushes under the lock, the loop deep-copies under it."""
+    lock = threading.Lock()
+    interp = SnapshotBuffer(REMOTE, tick_rate=SIM_RATE)
+    state = snaps[0][1]
+    i = 0
+    for f in range(frames):
+        now = f / CLIENT_FPS
+        while i < len(snaps) and snaps[i][0] <= now:     # network thread, not timed
+            with lock:
+                state = snaps[i][1]
+                interp.push(state, snaps[i][0])
+            i += 1
+
+        def frame():
+            with lock:
+                s = copy.deepcopy(state)
+                interp.apply(s, now)
+            s[OWN]["x"], s[OWN]["y"] = 100, 350
+            return s
+        yield frame
+
+def handoff_frames(snaps, frames):
+    """Render loop with SnapshotHandoff: the net thread publishes, the loop drains and shallow-copies."""
+    handoff = SnapshotHandoff(snaps[0][1])
+    interp = SnapshotBuffer(REMOTE, tick_rate=SIM_RATE)
+    i = 0
+    for f in range(frames):
+        now = f / CLIENT_FPS
+        while i < len(snaps) and snaps[i][0] <= now:     # network thread, not timed
+            handoff.publish(snaps[i][1], snaps[i][0])
+            i += 1
+
+        def frame():
+            for s, arrived in handoff.drain():
+                interp.push(s, arrived)
+            s = handoff.frame()
+            interp.apply(s, now)
+            s[OWN] = dict(s[OWN], x=100, y=350)
+            return s
+        yield frame
+
+def run(frames_of, snaps, frames):
+    """(us per frame, KiB allocated per frame, KiB held by the frame), averaged over the frames."""
+    us = 0.0
+    for frame in frames_of(snaps, frames):
+        t0 = time.perf_counter()
+        frame()
+        us += time.perf_counter() - t0
+
+    peak = kept = 0
+    tracemalloc.start()
+    for frame in frames_of(snaps, frames):
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        s = frame()
+        current, top = tracemalloc.get_traced_memory()
+        peak += top - base
+        kept += current - base
+        del s
+    tracemalloc.stop()
+    return us / frames * 1e6, peak / frames / 1024, kept / frames / 1024
+
+def main(ticks=600):
+    snaps = recorded_snapshots(ticks)
+    frames = ticks * CLIENT_FPS // SIM_RATE
+    print(f"{frames} render frames over {ticks} snapshots ({CLIENT_FPS} fps, {SIM_RATE} Hz)")
+    print(f"{'path':10} {'us/frame':>9} {'KiB alloc/frame':>16} {'KiB held/frame':>15}")
+    results = {}
+    for name, frames_of in (("deepcopy", deepcopy_frames), ("handoff", handoff_frames)):
+        results[name] = run(frames_of, snaps, frames)
+        us, peak, kept = results[name]
+        print(f"{name:10} {us:9.1f} {peak:16.2f} {kept:15.2f}")
+    (us0, peak0, _), (us1, peak1, _) = results["deepcopy"], results["handoff"]
+    print(f"handoff: {us0 / us1:.1f}x faster, {peak0 / peak1:.1f}x less allocated per frame")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# bench_rollback.py
+"""Benchmark: save/restore and worst-case rollback re-simulation cost per frame."""
+import time
+
+from game_sim import World, step_game
+from rollback import ROLLBACK_DT, MAX_ROLLBACK
+from shared_protocol import unpack_buttons
+
+FRAME_BUDGET_US = ROLLBACK_DT * 1e6
+
+def heavy_inputs(f):
+    """Fighters walk in, trade attacks/specials/jumps, back off, repeat."""
+    phase = f % 180
+    p1 = {"right": phase < 45, "left": 90 <= phase < 135,
+          "attack": f % 6 == 0, "special": f % 50 == 0, "jump": f % 90 == 60}
+    p2 = {"left": phase < 45, "right": 90 <= phase < 135,
+          "attack": f % 7 == 0, "special": f % 40 == 0, "block": f % 120 > 100}
+    return {1: unpack_buttons(0) | p1, 2: unpack_buttons(0) | p2}
+
+def timed(fn, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+def main(frames=600, depth=MAX_ROLLBACK):
+    world = World(seed=1)
+    states = []
+    step_us = []
+    for f in range(frames):
+        states.append(world.save_state())
+        t0 = time.perf_counter()
+        step_game(world, ROLLBACK_DT, heavy_inputs(f))
+        step_us.append((time.perf_counter() - t0) * 1e6)
+
+    save_us = timed(world.save_state, 2000)
+    mid = states[frames // 2]
+    load_us = timed(lambda: world.load_state(mid), 2000)
+
+    # Worst case: every frame rolls back `depth` frames and re-simulates them
+    worst = 0.0
+    total = 0.0
+    for f in range(depth, frames):
+        t0 = time.perf_counter()
+        world.load_state(states[f - depth])
+        for g in range(f - depth, f):
+            world.save_state()
+            step_game(world, ROLLBACK_DT, heavy_inputs(g))
+        dt_us = (time.perf_counter() - t0) * 1e6
+        total += dt_us
+        worst = max(worst, dt_us)
+    avg = total / (frames - depth)
+
+    print(f"step_game          avg {sum(step_us) / len(step_us):8.1f} us   max {max(step_us):8.1f} us")
+    print(f"save_state         avg {save_us:8.1f} us")
+    print(f"load_state         avg {load_us:8.1f} us")
+    print(f"rollback {depth} frames  avg {avg:8.1f} us   max {worst:8.1f} us   "
+          f"({worst / FRAME_BUDGET_US * 100:.1f}% of a {FRAME_BUDGET_US / 1000:.1f} ms frame)")
+
+if __name__ == "__main__":
+    main()
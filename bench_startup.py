@@ -0,0 +1,88 @@
+# bench_startup.py
+"""Benchmark: dedicated server startup time and resident memory, and game_sim import cost.
+
+Also times importing server.py with and without what the server used to do
+before it dropped pygame (import pygame, pg.init() on the dummy SDL drivers),
+each in a fresh interpreter, so the saving can be re-measured on any machine.
+"""
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TRIALS = 5
+SETTLE = 0.5    # s after "listening" before RSS is sampled
+
+def rss_kb(pid):
+    """Resident set size of a live process in KiB (Linux /proc, else psutil if installed)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss // 1024
+    except Exception:
+        return None
+
+def time_server():
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-u", "server.py"], cwd=HERE,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    try:
+        for line in proc.stdout:
+            if "listening" in line:
+                break
+        startup = time.perf_counter() - t0
+        time.sleep(SETTLE)
+        return startup, rss_kb(proc.pid)
+    finally:
+        proc.kill()
+        proc.wait()
+
+def time_import():
+    code = ("import time; t = time.perf_counter(); import game_sim; w = game_sim.World(); "
+            "print(time.perf_counter() - t)")
+    out = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+# Prints the seconds taken and the RSS (KiB) at the end; {setup} runs inside the timed part
+SERVER_IMPORT = ("import os, time; t = time.perf_counter(); {setup}import server; "
+                 "print(time.perf_counter() - t); from bench_startup import rss_kb; print(rss_kb(os.getpid()))")
+PYGAME_SETUP = ('os.environ["SDL_VIDEODRIVER"] = "dummy"; os.environ["SDL_AUDIODRIVER"] = "dummy"; '
+                "import pygame; pygame.init(); ")
+
+def time_server_import(setup=""):
+    """(s to import server.py, RSS KiB after) in a fresh interpreter."""
+    out = subprocess.run([sys.executable, "-c", SERVER_IMPORT.format(setup=setup)], cwd=HERE,
+                         capture_output=True, text=True).stdout.strip().splitlines()
+    return float(out[-2]), None if out[-1] == "None" else int(out[-1])
+
+def median(xs):
+    xs = sorted(xs)
+    return xs[len(xs) // 2]
+
+def main():
+    runs = [time_server() for _ in range(TRIALS)]
+    imports = [time_import() for _ in range(TRIALS)]
+    rss = [r for _, r in runs if r is not None]
+    bare = [time_server_import() for _ in range(TRIALS)]
+    with_pygame = [time_server_import(PYGAME_SETUP) for _ in range(TRIALS)]
+    print(f"server startup   median {median([s for s, _ in runs]) * 1000:8.1f} ms   (until 'listening')")
+    if rss:
+        print(f"server RSS       median {median(rss) / 1024:8.1f} MiB")
+    print(f"game_sim import  median {median(imports) * 1000:8.1f} ms   (import + World())")
+    for name, rows in (("server import", bare), ("  + pygame", with_pygame)):
+        line = f"{name:16} median {median([s for s, _ in rows]) * 1000:8.1f} ms"
+        rss = [r for _, r in rows if r is not None]
+        if rss:
+            line += f"   RSS {median(rss) / 1024:6.1f} MiB"
+        print(line)
+    print("                 ('+ pygame' adds the old server's import pygame + pg.init() on dummy SDL drivers)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+# bench_suite.py
+"""Benchmark suite: simulation, codec and render hot paths, compared against a stored baseline.
+
+    python bench_suite.py [--only NAME[,NAME...]] [--quick] [--json OUT]
+                          [--baseline FILE] [--save-baseline [FILE]] [--tolerance PCT]
+
+Every case reports the best and median time per operation over at least
+ROUNDS rounds and MIN_TIME seconds (gc off, like timeit). The best round is what gets compared, since
+noise only ever adds time. Results are compared with the baseline file
+(BASELINE_FILE by default, if it exists) and any case slower than the
+tolerance is flagged; the exit status is 1 if something regressed, so this
+can gate a merge. --json writes the results (plus the machine they came
+from) in the same format as the baseline; --save-baseline makes this run
+the new baseline. Baselines are only comparable on the same machine, so
+the machine is recorded and a mismatch is pointed out. The suite re-runs
+itself with a fixed PYTHONHASHSEED, since string hash randomisation alone
+moves some cases by tens of percent between processes.
+"""
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")    # render cases draw offscreen
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from game_sim import World, step_game, reset_game, pack_state, SIM_DT
+from shared_protocol import encode, decode, encode_binary, decode_binary, unpack_buttons
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(HERE, "bench_baseline.json")
+ROUNDS = 9
+MIN_TIME = 1.5       # s per case; short rounds, many of them, give a clean best round
+TOLERANCE = 20.0        # % slower than baseline before a case counts as a regression
+FORMAT_VERSION = 1
+
+# ---------------- Scripted fights ----------------
+# Scripts are bots: (world, frame) -> inputs. Each case records its bot's
+# inputs once, then every round replays them from the same start state, so
+# rounds do identical work and the bot's own cost isn't timed.
+NO_INPUT = unpack_buttons(0)
+
+def idle_bot(world, f):
+    return {1: NO_INPUT, 2: NO_INPUT}
+
+def combo_bot(world, f):
+    """Both fighters walk into range and trade attack strings, jumps, blocks and specials."""
+    p1, p2 = world.player1.rect, world.player2.rect
+    apart = p2.left - p1.right > 4 or p1.left - p2.right > 4
+    toward = p1.centerx < p2.centerx
+    phase = f % 120
+    i1 = {"right": apart and toward, "left": apart and not toward,
+          "attack": f % 13 == 0, "jump": phase == 40, "special": phase == 60}
+    i2 = {"left": apart and toward, "right": apart and not toward,
+          "attack": f % 14 == 7, "jump": phase == 20, "block": 100 <= phase < 112, "special": phase == 90}
+    return {1: NO_INPUT | i1, 2: NO_INPUT | i2}
+
+def fireball_bot(world, f):
+    return {1: NO_INPUT | {"special": f % 2 == 0}, 2: NO_INPUT | {"special": f % 2 == 1}}
+
+def play(world, ticks, bot=None, inputs=None, refill=False):
+    """Step `ticks` frames from `bot` (returns the inputs used) or a recorded `inputs` list."""
+    p1, p2 = world.player1, world.player2
+    used = []
+    for f in range(ticks):
+        if refill:      # fireball spam: keep the meter full so every press fires
+            p1.special_attack = p2.special_attack = p1.max_special
+        inp = bot(world, f) if bot else inputs[f]
+        used.append(inp)
+        step_game(world, SIM_DT, inp)
+        if world.ko_triggered:      # rematch straight away, like a long session
+            reset_game(world)
+    return used
+
+def fight(bot, ticks, p1_special="heal", p2_special="joker", refill=False):
+    """Case factory: `ticks` steps of `bot`'s fight per round."""
+    def setup():
+        world = World(p1_special=p1_special, p2_special=p2_special, seed=1)
+        start = world.save_state()
+        inputs = play(world, ticks, bot=bot, refill=refill)
+
+        def run():
+            world.load_state(start)
+            play(world, ticks, inputs=inputs, refill=refill)
+        return run, ticks
+    return setup
+
+# ---------------- Codec ----------------
+def mid_fight_world():
+    """A world in a busy moment of a fireball fight: a hitbox out, a fireball flying, both hurt."""
+    world = World(p1_special="fireball", p2_special="fireball", seed=1)
+    for f in range(3600):
+        world.player1.special_attack = world.player2.special_attack = world.player1.max_special
+        step_game(world, SIM_DT, combo_bot(world, f))
+        p1, p2 = world.player1, world.player2
+        if (world.fireballs and (p1.active_hitbox or p2.active_hitbox)
+                and 0 < p1.health < p1.max_health and 0 < p2.health < p2.max_health):
+            break
+        if world.ko_triggered:
+            reset_game(world)
+    return world
+
+def codec_case(op, repeat=500):
+    def setup():
+        world = mid_fight_world()
+        state = pack_state(world)
+        json_pkt, bin_pkt = encode(state), encode_binary(state, 1)
+        fn = {
+            "pack_state": lambda: pack_state(world),
+            "encode": lambda: encode(state),
+            "decode": lambda: decode(json_pkt),
+            "encode_binary": lambda: encode_binary(state, 1),
+            "decode_binary": lambda: decode_binary(bin_pkt),
+        }[op]
+
+        def run():
+            for _ in range(repeat):
+                fn()
+        return run, repeat
+    return setup
+
+# ---------------- Render ----------------
+def render_case(what, repeat=20, size=(1280, 720)):
+    def setup():
+        import pygame as pg
+        from client_render import draw_state, draw_bars
+        pg.display.init()
+        pg.font.init()
+        surface = pg.Surface(size)
+        world = mid_fight_world()
+        world.player2.blocking = True       # exercise the shield overlay too
+        state = pack_state(world)
+        if what == "draw_state":
+            fn = lambda: draw_state(surface, state)
+        else:
+            fn = lambda: draw_bars(surface, size[0], size[1], state["p1"], state["p2"])
+
+        def run():
+            for _ in range(repeat):
+                fn()
+        return run, repeat
+    return setup
+
+def frame_case(mode, frames=240, size=(1280, 720)):
+    """One client frame of a recorded fight, drawn and presented: full redraw + flip, or DirtyRenderer.
+
+    The dummy SDL driver has no real screen, so this times the drawing side
+    (fill vs repainting dirty rects); the saving in the present itself only
+    shows on a real display.
+    """
+    def setup():
+        import pygame as pg
+        from client_render import draw_state, DirtyRenderer
+        pg.display.init()
+        pg.font.init()
+        screen = pg.display.set_mode(size)
+        world = World(p1_special="fireball", p2_special="fireball", seed=1)
+        states = []
+        for f in range(frames):
+            step_game(world, SIM_DT, combo_bot(world, f))
+            states.append(pack_state(world))
+        renderer = DirtyRenderer()
+
+        def run():
+            for s in states:
+                if mode == "full":
+                    draw_state(screen, s)
+                    pg.display.flip()
+                else:
+                    rects = renderer.draw(screen, s)
+                    if rects is None:
+                        pg.display.flip()
+                    else:
+                        pg.display.update(rects)
+        return run, frames
+    return setup
+
+# ---------------- Assets ----------------
+# Sheet layout of the monster sprite pack the game ships with (32 px frames,
+# one row per animation); the art itself lives outside the repo, so the
+# benchmark generates sheets with the same sizes.
+SHEET_FRAMES = (4, 6, 6, 8, 5, 4, 6, 4, 8, 4)
+SPRITE_PX = 32
+CHARACTERS = 3
+
+def load_animation(path, frame_count, size):
+    """Same steps as the game's load_animation(): load, convert, slice, scale each frame."""
+    import pygame as pg
+    sheet = pg.image.load(path).convert_alpha()
+    sheet_width, sheet_height = sheet.get_size()
+    frame_width = sheet_width // frame_count
+
+    frames = []
+    for i in range(frame_count):
+        frame = sheet.subsurface(pg.Rect(i * frame_width, 0, frame_width, sheet_height))
+        frame = pg.transform.scale(frame, size)
+        frames.append(frame)
+    return frames
+
+def asset_case(screen=(1280, 720)):
+    """Load every character's animations, as the game does at startup (one op = one sheet)."""
+    def setup():
+        import pygame as pg
+        pg.display.init()
+        pg.display.set_mode((1, 1))         # convert_alpha() needs a display surface
+        tmp = tempfile.mkdtemp(prefix="bench_sheets_")
+        paths = []
+        for i, n in enumerate(SHEET_FRAMES):
+            sheet = pg.Surface((n * SPRITE_PX, SPRITE_PX), pg.SRCALPHA)
+            for k in range(n):
+                pg.draw.circle(sheet, (40 * i % 256, 25 * k % 256, 200, 255),
+                               (k * SPRITE_PX + SPRITE_PX // 2, SPRITE_PX // 2), SPRITE_PX // 3)
+            path = os.path.join(tmp, f"sheet_{i}_{n}.png")
+            pg.image.save(sheet, path)
+            paths.append((path, n))
+        size = (int(screen[0] * 0.12), int(screen[1] * 0.28))   # PLAYER_WIDTH, PLAYER_HEIGHT
+
+        def run():
+            for _ in range(CHARACTERS):
+                for path, n in paths:
+                    load_animation(path, n, size)
+        return run, CHARACTERS * len(paths)
+    return setup
+
+CASES = {
+    "step_game.idle": fight(idle_bot, 600),
+    "step_game.combo": fight(combo_bot, 600),
+    "step_game.fireball_spam": fight(fireball_bot, 600, "fireball", "fireball", refill=True),
+    "codec.pack_state": codec_case("pack_state"),
+    "codec.encode_json": codec_case("encode"),
+    "codec.decode_json": codec_case("decode"),
+    "codec.encode_binary": codec_case("encode_binary"),
+    "codec.decode_binary": codec_case("decode_binary"),
+    "render.draw_state": render_case("draw_state"),
+    "render.draw_bars": render_case("draw_bars"),
+    "render.frame_full": frame_case("full"),
+    "render.frame_dirty": frame_case("dirty"),
+    "assets.load_animation": asset_case(),
+}
+
+# ---------------- Running and comparing ----------------
+def measure(setup, rounds, min_time):
+    run, ops = setup()
+    run()       # warm-up (imports, caches, first-touch allocations)
+    times = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        t_end = time.perf_counter() + min_time
+        while len(times) < rounds or time.perf_counter() < t_end:
+            t0 = time.perf_counter()
+            run()
+            times.append((time.perf_counter() - t0) / ops * 1e6)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return {"us_per_op": round(min(times), 4), "median_us": round(statistics.median(times), 4),
+            "ops": ops, "rounds": len(times)}
+
+def machine():
+    try:
+        import pygame
+        pygame_version = pygame.version.ver
+    except ImportError:
+        pygame_version = None
+    return {"python": platform.python_version(), "implementation": platform.python_implementation(),
+            "system": platform.system(), "machine": platform.machine(), "processor": platform.processor(),
+            "cpus": os.cpu_count(), "pygame": pygame_version, "hashseed": os.environ.get("PYTHONHASHSEED")}
+
+def compare(results, baseline, tolerance):
+    """Print each case against the baseline; return the names that regressed."""
+    regressed = []
+    base = baseline.get("results", {}) if baseline else {}
+    print(f"{'case':<26}{'us/op':>12}{'median':>12}{'baseline':>12}{'change':>10}")
+    for name, r in results.items():
+        b = base.get(name)
+        if b is None:
+            print(f"{name:<26}{r['us_per_op']:>12.2f}{r['median_us']:>12.2f}{'-':>12}")
+            continue
+        change = (r["us_per_op"] / b["us_per_op"] - 1) * 100
+        flag = ""
+        if change > tolerance:
+            flag = "  REGRESSED"
+            regressed.append(name)
+        print(f"{name:<26}{r['us_per_op']:>12.2f}{r['median_us']:>12.2f}{b['us_per_op']:>12.2f}{change:>+9.1f}%{flag}")
+    return regressed
+
+def arg(argv, name, default=None):
+    if name in argv:
+        i = argv.index(name)
+        if i + 1 < len(argv) and not argv[i + 1].startswith("--"):
+            return argv[i + 1]
+        return default
+    return None
+
+def main(argv):
+    only = arg(argv, "--only")
+    names = [n for n in CASES if not only or any(n.startswith(o) for o in only.split(","))]
+    rounds, min_time = (3, 0.2) if "--quick" in argv else (ROUNDS, MIN_TIME)
+    tolerance = float(arg(argv, "--tolerance") or TOLERANCE)
+    baseline_path = arg(argv, "--baseline") or BASELINE_FILE
+
+    results = {}
+    for name in names:
+        results[name] = measure(CASES[name], rounds, min_time)
+    report = {"version": FORMAT_VERSION, "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+              "machine": machine(), "results": results}
+
+    baseline = None
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != report["machine"]:
+            print(f"[BENCH] note: baseline {baseline_path} is from a different machine/setup; "
+                  f"compare with care ({baseline.get('machine')})")
+    regressed = compare(results, baseline, tolerance)
+
+    out = arg(argv, "--json")
+    if out:
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+    if "--save-baseline" in argv:
+        path = arg(argv, "--save-baseline", BASELINE_FILE)
+        if only and baseline:       # partial run: keep the other cases' baseline numbers
+            report["results"] = dict(baseline.get("results", {}), **results)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[BENCH] baseline saved to {path}")
+        return 0
+    if regressed:
+        print(f"[BENCH] {len(regressed)} regressed by more than {tolerance:g}%: {', '.join(regressed)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    if "PYTHONHASHSEED" not in os.environ:
+        os.environ["PYTHONHASHSEED"] = "0"
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+    sys.exit(main(sys.argv[1:]))
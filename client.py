@@ -1,23 +1,46 @@
 # client.py
+import sys
 import socket
+import selectors
 import threading
 import time
-import copy
+from collections import deque
 import pygame as pg
-from shared_protocol import encode, decode
+from shared_protocol import encode, SnapshotReceiver, encode_inputs, pack_buttons, INPUT_HISTORY, INPUT_RATE
+from game_sim import SIM_RATE
+from prediction import LocalPredictor
+from interpolation import SnapshotBuffer, SnapshotHandoff, RESTART_TIME
+from client_render import get_inputs, draw_state, DirtyRenderer
+from render_cache import resources
+import tracing
 
 SERVER_IP = input("Enter server IP: ").strip()
 SERVER_PORT = 5000
+if ":" in SERVER_IP:    # host:port, e.g. a netem.py proxy
+    SERVER_IP, port = SERVER_IP.rsplit(":", 1)
+    SERVER_PORT = int(port)
 player_id = int(input("Player number (1 or 2): ").strip())
+room_id = input("Room [default]: ").strip() or "default"
+# `--sim-rate N` when the server runs with the same flag; prediction and ticks depend on it
+sim_rate = int(sys.argv[sys.argv.index("--sim-rate") + 1]) if "--sim-rate" in sys.argv else SIM_RATE
 
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 sock.setblocking(False)
-sock.sendto(encode({"join": player_id}), (SERVER_IP, SERVER_PORT))
+sock.sendto(encode({"join": player_id, "room": room_id}), (SERVER_IP, SERVER_PORT))
 
 # Networking thread shares
-state_lock = threading.Lock()
 inputs_lock = threading.Lock()
 latest_inputs = {"left":0,"right":0,"jump":0,"attack":0,"special":0,"block":0}
+# Delta snapshot baselines; last_tick is acked back with every input packet
+snapshots = SnapshotReceiver()
+# Input sequence number and the last few frames resent with every packet
+input_seq = 0
+input_history = deque(maxlen=INPUT_HISTORY)
+# Our own fighter is simulated locally and corrected by the server
+predictor = LocalPredictor(player_id, sim_rate)
+# The opponent and fireballs are drawn this far in the past, lerped between snapshots
+CLIENT_INTERP_DELAY = 0.05
+interp = SnapshotBuffer("p2" if player_id == 1 else "p1", tick_rate=sim_rate, delay=CLIENT_INTERP_DELAY)
 
 pg.init()
 # Desired client render framerate (increase for smoother rendering)
@@ -34,12 +57,23 @@ pg.display.set_caption(f"Fighter Client - Player {player_id}")
 clock = pg.time.Clock()
 
 # Diagnostics / safety
-MAX_RECV_PER_FRAME = 50
+# Datagrams read per select() wakeup before checking whether an input frame is due
+MAX_RECV_PER_WAKE = 50
 CLIENT_HEARTBEAT_MS = 2000
 DEBUG_CLIENT = True
-
-# Latest state from server
-state = {
+# `python client.py --trace`: span tracing (tracing.py) dumped to CLIENT_TRACE_DIR
+# on F9 and whenever a frame's work takes longer than CLIENT_SLOW_FRAME_MS
+CLIENT_TRACE_DIR = "traces"
+CLIENT_SLOW_FRAME_MS = 2000 / CLIENT_FPS
+tr = tracing.enable("client", CLIENT_TRACE_DIR) if "--trace" in sys.argv else None
+# `--dirty-rects`: repaint and present only what changed (client_render.DirtyRenderer)
+# instead of redrawing and flipping the whole window every frame
+dirty_renderer = DirtyRenderer() if "--dirty-rects" in sys.argv else None
+if tr:
+    TRACK_MAIN, TRACK_NET = tr.track("main"), tr.track("network")
+
+# Latest state from server, handed to the render loop by reference (SnapshotHandoff)
+handoff = SnapshotHandoff({
     "p1": {"x":100,"y":350,"w":40,"h":80,"hp":100,"hpMax":100,"hpDisp":100,
            "special":0,"specialMax":300,"block":100,"blockMax":100,
            "facing":"right","blocking":False,"attacking":False,"attackType":"normal","stunned":False,"hitbox":None},
@@ -49,191 +83,110 @@ state = {
     "fireballs": [],
     "ko": False,
     "width": 800, "height": 500
-}
-
-def get_inputs(keys, pid: int) -> dict:
-    """Use your original control scheme depending on player id."""
-    if pid == 1:
-        return {
-            "left":   int(keys[pg.K_a]),
-            "right":  int(keys[pg.K_d]),
-            "jump":   int(keys[pg.K_w]),
-            "attack": int(keys[pg.K_e]),
-            "special":int(keys[pg.K_r]),
-            "block":  int(keys[pg.K_t]),
-        }
-    else:
-        return {
-            "left":   int(keys[pg.K_LEFT]),
-            "right":  int(keys[pg.K_RIGHT]),
-            "jump":   int(keys[pg.K_UP]),
-            "attack": int(keys[pg.K_KP1]),
-            "special":int(keys[pg.K_KP2]),
-            "block":  int(keys[pg.K_KP3]),
-        }
-
-def draw_block_shield(surface, player_dict):
-    if player_dict["blocking"]:
-        w, h = player_dict["w"], player_dict["h"]
-        shield_w = int(w * 2.1)
-        shield_h = int(h * 1.3)
-
-        shield_surface = pg.Surface((shield_w, shield_h), pg.SRCALPHA)
-        pg.draw.ellipse(shield_surface, (50, 50, 255, 150), shield_surface.get_rect())
-
-        rect = shield_surface.get_rect(center=(player_dict["x"] + w//2, player_dict["y"] + h//2))
-        surface.blit(shield_surface, rect)
-
-def draw_bars(surface, width, height, p1, p2):
-    bar_height = 0.05 * height
-    seg_width = width * 0.03
-    special_segments = 3
-    block_bar_height = bar_height / 2
-    spacing = 5
-
-    # P1 HP (chip + real)
-    pg.draw.rect(surface, (60, 60, 60), (0, 0, width * 0.35, bar_height))
-    pg.draw.rect(surface, (230, 230, 230), (0, 0, (width*0.35) * (p1["hpDisp"]/p1["hpMax"]), bar_height))
-    color_hp1 = (255,0,0) if p1["hp"]/p1["hpMax"] >= 0.3 else (255,80,80)
-    pg.draw.rect(surface, color_hp1, (0, 0, (width*0.35) * (p1["hp"]/p1["hpMax"]), bar_height))
-
-    # P1 Special
-    bar_y_special = bar_height + spacing
-    special_bar_width = seg_width * special_segments
-    bar_x = 0
-    pg.draw.rect(surface, (50,0,50), (bar_x, bar_y_special, special_bar_width, bar_height))
-    filled_width = special_bar_width * (p1["special"]/p1["specialMax"])
-    pg.draw.rect(surface, (255,0,0), (bar_x, bar_y_special, filled_width, bar_height))
-    for j in range(1, special_segments):
-        line_x = bar_x + j * seg_width
-        pg.draw.line(surface, (255,255,255), (line_x, bar_y_special), (line_x, bar_y_special+bar_height), 2)
-
-    # P1 Block stamina
-    bar_y_block = bar_y_special + bar_height + spacing
-    block_bar_width = seg_width * 3
-    bar_x = 0
-    pg.draw.rect(surface, (20,20,70), (bar_x, bar_y_block, block_bar_width, block_bar_height))
-    filled_width = block_bar_width * (p1["block"]/p1["blockMax"])
-    pg.draw.rect(surface, (0,200,255), (bar_x, bar_y_block, filled_width, block_bar_height))
-
-    # P2 HP (chip + real)
-    bar_width_p2 = width * 0.35
-    pg.draw.rect(surface, (60,60,60), (width - bar_width_p2, 0, bar_width_p2, bar_height))
-    chip_width = bar_width_p2 * (p2["hpDisp"]/p2["hpMax"])
-    pg.draw.rect(surface, (230,230,230), (width - chip_width, 0, chip_width, bar_height))
-    real_width = bar_width_p2 * (p2["hp"]/p2["hpMax"])
-    color_hp2 = (0,0,255) if p2["hp"]/p2["hpMax"] >= 0.3 else (255,80,80)
-    pg.draw.rect(surface, color_hp2, (width - real_width, 0, real_width, bar_height))
-
-    # P2 Special
-    bar_y_special = bar_height + spacing
-    special_bar_width = seg_width * special_segments
-    bar_x = width - special_bar_width
-    pg.draw.rect(surface, (50,0,50), (bar_x, bar_y_special, special_bar_width, bar_height))
-    filled_width = special_bar_width * (p2["special"]/p2["specialMax"])
-    pg.draw.rect(surface, (0,0,255), (bar_x + special_bar_width - filled_width, bar_y_special, filled_width, bar_height))
-    for j in range(1, special_segments):
-        line_x = bar_x + j * seg_width
-        pg.draw.line(surface, (255,255,255), (line_x, bar_y_special), (line_x, bar_y_special+bar_height), 2)
-
-    # P2 Block stamina
-    bar_y_block = bar_y_special + bar_height + spacing
-    block_bar_width = seg_width * 3
-    bar_x = width - block_bar_width
-    pg.draw.rect(surface, (20,20,70), (bar_x, bar_y_block, block_bar_width, block_bar_height))
-    filled_width = block_bar_width * (p2["block"]/p2["blockMax"])
-    pg.draw.rect(surface, (0,200,255), (bar_x + block_bar_width - filled_width, bar_y_block, filled_width, block_bar_height))
-
-def draw_state(surface, s):
-    # Size from server (we'll just render with current window size)
-    w, h = surface.get_size()
-    p1, p2 = s["p1"], s["p2"]
-
-    surface.fill((30, 30, 30))
-
-    # Players
-    pg.draw.rect(surface, (255,0,0), (p1["x"], p1["y"], p1["w"], p1["h"]))
-    pg.draw.rect(surface, (0,0,255), (p2["x"], p2["y"], p2["w"], p2["h"]))
-
-    # Shields
-    draw_block_shield(surface, p1)
-    draw_block_shield(surface, p2)
-
-    # Hitboxes
-    if p1["hitbox"]:
-        hb = p1["hitbox"]
-        pg.draw.rect(surface, (255,0,0), pg.Rect(hb["x"], hb["y"], hb["w"], hb["h"]), 2)
-    if p2["hitbox"]:
-        hb = p2["hitbox"]
-        pg.draw.rect(surface, (0,0,255), pg.Rect(hb["x"], hb["y"], hb["w"], hb["h"]), 2)
-
-    # Fireballs
-    for f in s["fireballs"]:
-        pg.draw.circle(surface, (255,165,0), (int(f["x"]), int(f["y"])), 10)
-
-    # UI bars
-    draw_bars(surface, w, h, p1, p2)
-
-    # KO overlay
-    if s["ko"]:
-        font = pg.font.SysFont("Arial", int(0.18*h), bold=True)
-        text = font.render("KO", True, (255,255,255))
-        rect = text.get_rect(center=(w//2, int(0.3*h)))
-        surface.blit(text, rect)
-
-        font2 = pg.font.SysFont("Arial", int(0.06*h), bold=True)
-        winner_str = "WINNER PLAYER 2" if p1["hp"] <= 0 else "WINNER PLAYER 1"
-        winner = font2.render(winner_str, True, (255,255,0))
-        surface.blit(winner, winner.get_rect(center=(w//2, int(0.45*h))))
+})
 
 def send_inputs_now(inputs: dict):
+    global input_seq
+    input_seq += 1
+    input_history.appendleft(pack_buttons(inputs))
     try:
-        sock.sendto(encode({"player": player_id, "inputs": inputs}), (SERVER_IP, SERVER_PORT))
+        sock.sendto(encode_inputs(player_id, input_seq, input_history, snapshots.last_tick), (SERVER_IP, SERVER_PORT))
     except Exception:
         pass
+    predictor.apply_input(input_seq, inputs)
+
+# Newest server tick handed to the render loop as its latest. A snapshot this far
+# or further behind it isn't a late packet, the server started the room over
+published_tick = -1
+RESTART_TICKS = round(RESTART_TIME * sim_rate)
+# Network thread metric: snapshots that arrived after a newer one was published
+late_snapshots = 0
+
+def receive_snapshots():
+    """Read every datagram waiting on the socket; return the decoded snapshots, oldest tick first."""
+    received = []
+    for _ in range(MAX_RECV_PER_WAKE):
+        try:
+            data, addr = sock.recvfrom(8192)
+        except BlockingIOError:
+            break
+        except OSError:     # e.g. ICMP port unreachable while the server is down
+            continue
+        t0 = time.perf_counter()
+        s = snapshots.decode(data)
+        if tr:
+            tr.add("decode", t0, time.perf_counter(), TRACK_NET, {"bytes": len(data)})
+        if s:
+            received.append(s)
+    received.sort(key=lambda s: s["tick"])
+    return received
 
 def network_thread_func():
-    """Runs in background: periodically sends latest inputs and receives server state."""
-    global state
-    TICK = 1.0 / 60.0
+    """Runs in background: sleeps in select() until a snapshot arrives or the next input frame is due.
+
+    Inputs go out on a fixed INPUT_RATE deadline schedule; each input frame is
+    one step of the server's input clock, so they aren't sent early on change.
+    Snapshots are read the moment they arrive and handed over in tick order.
+    Only one newer than everything published so far becomes the render loop's
+    latest and is reconciled; a late (reordered) one still goes to the
+    SnapshotBuffer, which slots it into its timeline.
+    """
+    global published_tick, late_snapshots
+    input_dt = 1.0 / INPUT_RATE
+    selector = selectors.DefaultSelector()
+    selector.register(sock, selectors.EVENT_READ)
+    next_send = time.perf_counter()
     while True:
-        start = time.time()
-        # send latest inputs
-        with inputs_lock:
-            to_send = dict(latest_inputs)
-        send_inputs_now(to_send)
+        now = time.perf_counter()
+        if now >= next_send:
+            with inputs_lock:
+                to_send = dict(latest_inputs)
+            send_inputs_now(to_send)
+            next_send += input_dt
+            if next_send <= now:    # stalled for a whole frame or more: don't burst to catch up
+                next_send = now + input_dt
+            continue
 
-        # receive up to a few packets
         try:
-            for _ in range(10):
-                try:
-                    data, addr = sock.recvfrom(8192)
-                except BlockingIOError:
-                    break
-                s = decode(data)
-                if s:
-                    with state_lock:
-                        state = s
+            if not selector.select(next_send - now):
+                continue
+            arrived = time.perf_counter()
+            newest = None
+            for s in receive_snapshots():
+                newer = not published_tick - RESTART_TICKS < s["tick"] <= published_tick
+                if newer:
+                    newest = s
+                    published_tick = s["tick"]
+                else:
+                    late_snapshots += 1
+                handoff.publish(s, arrived, latest=newer)
+            if newest:
+                t1 = time.perf_counter()
+                predictor.reconcile(newest)
+                if tr:
+                    tr.add("reconcile", t1, time.perf_counter(), TRACK_NET)
         except Exception:
             pass
 
-        elapsed = time.time() - start
-        sleep_for = TICK - elapsed
-        if sleep_for > 0:
-            time.sleep(sleep_for)
-
 # Start networking thread
 nt = threading.Thread(target=network_thread_func, daemon=True)
 nt.start()
 
 running = True
 last_heartbeat = 0
+# Age of the newest snapshot when a frame draws it (SnapshotBuffer.age), in ms
+snapshot_age = snapshot_age_avg = snapshot_age_max = 0.0
 while running:
     dt = clock.tick(CLIENT_FPS)
+    t_frame = time.perf_counter()
     now_ms = pg.time.get_ticks()
     if DEBUG_CLIENT and now_ms - last_heartbeat > CLIENT_HEARTBEAT_MS:
-        print("[CLIENT] main loop alive — draining up to", MAX_RECV_PER_FRAME, "pkts/frame")
+        print(f"[CLIENT] main loop alive | snapshot age last={snapshot_age:.1f}ms avg={snapshot_age_avg:.1f}ms "
+              f"max={snapshot_age_max:.1f}ms late={late_snapshots}",
+              f"| prediction error last={predictor.last_error:.1f}px avg={predictor.avg_error:.1f}px corrections={predictor.corrections}",
+              f"| interp depth={interp.depth} underruns={interp.underruns} starved={interp.starved}")
         last_heartbeat = now_ms
+        snapshot_age_max = 0.0
 
     # Process events first (keeps window responsive)
     for event in pg.event.get():
@@ -242,17 +195,15 @@ while running:
         elif event.type == pg.VIDEORESIZE:
             # Recreate surface to the new size so OS window stays responsive
             screen = pg.display.set_mode((event.w, event.h), display_flags)
-            # Recreate fonts sized for the new window
-            w, h = screen.get_size()
-            try:
-                font_ko_large = pg.font.SysFont("Arial", int(0.18 * h), bold=True)
-                font_ko_small = pg.font.SysFont("Arial", int(0.06 * h), bold=True)
-            except Exception:
-                font_ko_large = None
-                font_ko_small = None
+            # Fonts and text are sized from the window; rebuild them on next use
+            resources.invalidate()
+            if dirty_renderer:
+                dirty_renderer.invalidate()
         elif event.type == pg.KEYDOWN:
+            if event.key == pg.K_F9 and tr:
+                tr.dump("f9")
             # Ask server to reset after KO
-            if state.get("ko") and event.key == pg.K_RETURN:
+            if handoff.latest.get("ko") and event.key == pg.K_RETURN:
                 try:
                     sock.sendto(encode({"replay": 1}), (SERVER_IP, SERVER_PORT))
                 except Exception:
@@ -266,12 +217,43 @@ while running:
     with inputs_lock:
         latest_inputs = get_inputs(keys, player_id)
 
-    # Use thread-updated state (copy under lock to avoid races)
-    with state_lock:
-        s_copy = copy.deepcopy(state)
+    # Newest snapshots from the network thread; the frame only replaces entries, never edits them
+    t0 = time.perf_counter()
+    for s, arrived in handoff.drain():
+        interp.push(s, arrived)
+    s_copy = handoff.frame()
+    interp.apply(s_copy, t0)
+    snapshot_age = interp.age(handoff.latest, t0) * 1000
+    snapshot_age_avg += (snapshot_age - snapshot_age_avg) * 0.05
+    snapshot_age_max = max(snapshot_age_max, snapshot_age)
 
-    # Draw
-    draw_state(screen, s_copy)
-    pg.display.flip()
+    # Draw our own fighter where we predict it, not where the server last saw it
+    px, py = predictor.render_pos()
+    s_copy[predictor.key] = dict(s_copy[predictor.key], x=round(px), y=round(py))
 
+    # Draw
+    t1 = time.perf_counter()
+    if dirty_renderer:
+        rects = dirty_renderer.draw(screen, s_copy)
+    else:
+        draw_state(screen, s_copy)
+        rects = None
+    t2 = time.perf_counter()
+    if rects is None:
+        pg.display.flip()
+    else:
+        pg.display.update(rects)
+
+    if tr:
+        t3 = time.perf_counter()
+        tr.add("events+inputs", t_frame, t0, TRACK_MAIN)
+        tr.add("handoff+interp", t0, t1, TRACK_MAIN, {"snapshot_age_ms": round(snapshot_age, 2)})
+        tr.add("draw_state", t1, t2, TRACK_MAIN)
+        tr.add("present", t2, t3, TRACK_MAIN)
+        tr.add("frame", t_frame, t3, TRACK_MAIN, {"dt_ms": dt})
+        if (t3 - t_frame) * 1000 > CLIENT_SLOW_FRAME_MS:
+            tr.auto_dump("slow-frame", t3)
+
+if tr:
+    tr.dump("exit", background=False)
 pg.quit()
\ No newline at end of file
@@ -0,0 +1,185 @@
+# client_render.py
+"""Keyboard mapping and snapshot drawing shared by client.py, rollback_client.py and spectate_client.py."""
+import pygame as pg
+from render_cache import resources
+from hud import HudLayer
+
+# P1 red, P2 blue
+hud = HudLayer((255, 0, 0), (0, 0, 255))
+
+def get_inputs(keys, pid: int) -> dict:
+    """Use your original control scheme depending on player id."""
+    if pid == 1:
+        return {
+            "left":   int(keys[pg.K_a]),
+            "right":  int(keys[pg.K_d]),
+            "jump":   int(keys[pg.K_w]),
+            "attack": int(keys[pg.K_e]),
+            "special":int(keys[pg.K_r]),
+            "block":  int(keys[pg.K_t]),
+        }
+    else:
+        return {
+            "left":   int(keys[pg.K_LEFT]),
+            "right":  int(keys[pg.K_RIGHT]),
+            "jump":   int(keys[pg.K_UP]),
+            "attack": int(keys[pg.K_KP1]),
+            "special":int(keys[pg.K_KP2]),
+            "block":  int(keys[pg.K_KP3]),
+        }
+
+BG_COLOR = (30, 30, 30)
+SHIELD_COLOR = (50, 50, 255, 150)
+
+def shield_rect(player_dict) -> pg.Rect:
+    w, h = player_dict["w"], player_dict["h"]
+    rect = pg.Rect(0, 0, int(w * 2.1), int(h * 1.3))
+    rect.center = (player_dict["x"] + w//2, player_dict["y"] + h//2)
+    return rect
+
+def draw_block_shield(surface, player_dict):
+    if player_dict["blocking"]:
+        rect = shield_rect(player_dict)
+        surface.blit(resources.ellipse(rect.w, rect.h, SHIELD_COLOR), rect)
+
+def draw_bars(surface, width, height, p1, p2):
+    """HP (chip + real), segmented special and block stamina for both players; returns the rects that changed."""
+    return hud.draw(surface, width, height, p1, p2)
+
+def scene_items(s, w, h) -> list:
+    """Everything draw_state puts on screen, in drawing order, as (signature, rect, draw(surface)).
+
+    Equal signatures draw the same pixels, and nothing draws outside its rect;
+    DirtyRenderer relies on both.
+    """
+    p1, p2 = s["p1"], s["p2"]
+    items = []
+
+    # Players
+    for p, color in ((p1, (255,0,0)), (p2, (0,0,255))):
+        rect = pg.Rect(p["x"], p["y"], p["w"], p["h"])
+        items.append((("player", color, tuple(rect)), rect, lambda surf, c=color, r=rect: pg.draw.rect(surf, c, r)))
+
+    # Shields
+    for p in (p1, p2):
+        if p["blocking"]:
+            rect = shield_rect(p)
+            items.append((("shield", tuple(rect)), rect,
+                          lambda surf, r=rect: surf.blit(resources.ellipse(r.w, r.h, SHIELD_COLOR), r)))
+
+    # Hitboxes
+    for p, color in ((p1, (255,0,0)), (p2, (0,0,255))):
+        if p["hitbox"]:
+            hb = p["hitbox"]
+            rect = pg.Rect(hb["x"], hb["y"], hb["w"], hb["h"])
+            items.append((("hitbox", color, tuple(rect)), rect,
+                          lambda surf, c=color, r=rect: pg.draw.rect(surf, c, r, 2)))
+
+    # Fireballs
+    for f in s["fireballs"]:
+        center = (int(f["x"]), int(f["y"]))
+        rect = pg.Rect(center[0] - 11, center[1] - 11, 23, 23)
+        items.append((("fireball", center), rect, lambda surf, c=center: pg.draw.circle(surf, (255,165,0), c, 10)))
+
+    # UI bars
+    hud.update(w, h, p1, p2)
+    for bar, rect in hud.rects.items():
+        items.append((("hud", bar, hud.keys[bar]), rect, lambda surf, r=rect: hud.blit(surf, (r,))))
+
+    # KO overlay
+    if s["ko"]:
+        text = resources.text("KO", "Arial", int(0.18*h), (255,255,255), bold=True)
+        winner_str = "WINNER PLAYER 2" if p1["hp"] <= 0 else "WINNER PLAYER 1"
+        winner = resources.text(winner_str, "Arial", int(0.06*h), (255,255,0), bold=True)
+        for img, center in ((text, (w//2, int(0.3*h))), (winner, (w//2, int(0.45*h)))):
+            rect = img.get_rect(center=center)
+            items.append((("text", id(img), tuple(rect)), rect, lambda surf, i=img, r=rect: surf.blit(i, r)))
+    return items
+
+def draw_state(surface, s):
+    # Size from server (we'll just render with current window size)
+    w, h = surface.get_size()
+    surface.fill(BG_COLOR)
+    for _, _, draw in scene_items(s, w, h):
+        draw(surface)
+
+# ---------------- Dirty-rect presentation ----------------
+# Past this share of the window, repainting and pushing rects costs more than a full redraw + flip
+DIRTY_FULL_THRESHOLD = 0.35
+
+class DirtyRenderer:
+    """draw_state() that repaints only what changed since the last frame.
+
+    Items whose signature appeared or went away mark their rect dirty, and
+    so does every item overlapping a dirty rect (it gets repainted whole,
+    once, so alpha shields never stack). Dirty rects are restored from the
+    cached background and the items in them redrawn in the usual order.
+    draw() returns the rects for pg.display.update(), or None after a full
+    redraw (first frame, resize, or more than `threshold` of the window
+    dirty), when the caller should flip.
+    """
+    def __init__(self, threshold: float = DIRTY_FULL_THRESHOLD, background: pg.Surface = None):
+        self.threshold = threshold
+        self.background_image = background      # scaled to the window; BG_COLOR if None
+        self.background = None
+        self.size = None
+        self.prev = {}          # signature -> rect, as drawn last frame
+
+        # Metrics
+        self.frames = 0
+        self.full_frames = 0
+        self.dirty_share = 0.0  # share of the window repainted, summed over frames
+
+    def invalidate(self):
+        """Next frame is a full redraw (the window was resized or drawn over)."""
+        self.size = None
+
+    def _full(self, surface, items):
+        size = surface.get_size()
+        if size != self.size:
+            self.size = size
+            if self.background_image is None:
+                self.background = pg.Surface(size)
+                self.background.fill(BG_COLOR)
+            else:
+                self.background = pg.transform.scale(self.background_image, size)
+        surface.blit(self.background, (0, 0))
+        for _, _, draw in items:
+            draw(surface)
+        self.full_frames += 1
+        self.dirty_share += 1.0
+
+    def draw(self, surface, s):
+        w, h = surface.get_size()
+        items = scene_items(s, w, h)
+        cur = {sig: rect for sig, rect, _ in items}
+        prev, self.prev = self.prev, cur
+        self.frames += 1
+        if (w, h) != self.size:
+            self._full(surface, items)
+            return None
+
+        dirty = [rect for sig, rect in prev.items() if sig not in cur]
+        dirty += [rect for sig, rect in cur.items() if sig not in prev]
+        redraw = [False] * len(items)
+        grew = bool(dirty)
+        while grew:
+            grew = False
+            for i, (_, rect, _) in enumerate(items):
+                if not redraw[i] and rect.collidelist(dirty) != -1:
+                    redraw[i] = grew = True
+                    dirty.append(rect)
+
+        screen = surface.get_rect()
+        dirty = [r for r in (rect.clip(screen) for rect in dirty) if r.w and r.h]
+        share = sum(r.w * r.h for r in dirty) / (w * h)     # overlaps count twice; errs toward flipping
+        if share > self.threshold:
+            self._full(surface, items)
+            return None
+        for rect in dirty:
+            surface.blit(self.background, rect, rect)
+        for i, (_, _, draw) in enumerate(items):
+            if redraw[i]:
+                draw(surface)
+        self.dirty_share += share
+        return dirty
@@ -0,0 +1,103 @@
+# desync.py
+"""Rolling per-tick state hashes: record ours, compare the peer's, report the first split."""
+from collections import deque
+from game_sim import state_hash, first_difference
+
+DESYNC_KEEP = 240       # ticks of hashes/values kept for late comparisons and dumps (~4 s)
+
+class DesyncDetector:
+    """Chain of state_hash() over the ticks passed to record().
+
+    Each hash covers every recorded tick up to it, so the first tick whose
+    hash differs from the peer's is where the simulations split; later ticks
+    all differ too and aren't reported again. The values of recent ticks are
+    kept so the peer's values for the split tick can be diffed field by field.
+    """
+    def __init__(self, keep: int = DESYNC_KEEP, tag: str = "DESYNC"):
+        self.keep = keep
+        self.tag = tag
+        self.hashes = {}        # tick -> rolling hash
+        self.values = {}        # tick -> state_values() at that tick
+        self.remote = {}        # tick -> peer's hash for a tick we haven't recorded yet
+        self.order = deque()    # recorded ticks, oldest first
+        self.last_tick = None
+        self.last_hash = 0
+        self.checked = 0        # ticks compared with the peer
+        self.checked_tick = -1  # newest of them; the chain vouches for everything older
+        self.desync_tick = None
+        self.wanted = None      # tick whose values we still need from the peer
+
+    def record(self, tick: int, values: tuple) -> int:
+        """Hash this tick's values onto the chain; returns the new hash."""
+        h = self.last_hash = state_hash(values, self.last_hash)
+        self.last_tick = tick
+        self.hashes[tick] = h
+        self.values[tick] = values
+        self.order.append(tick)
+        while len(self.order) > self.keep:
+            old = self.order.popleft()
+            del self.hashes[old], self.values[old]
+        if tick in self.remote:
+            self._compare(tick, self.remote.pop(tick))
+        return h
+
+    def recent(self, count: int):
+        """(newest tick, newest-first hashes) to send to the peer, or (None, [])."""
+        if self.last_tick is None:
+            return None, []
+        hashes = []
+        for t in range(self.last_tick, self.last_tick - count, -1):
+            if t not in self.hashes:
+                break
+            hashes.append(self.hashes[t])
+        return self.last_tick, hashes
+
+    def add_remote(self, tick: int, hashes):
+        """Take the peer's newest-first hashes ending at `tick`.
+
+        After a mismatch, `wanted` is the tick the caller should ask the peer
+        for values of (and keep asking until compare_values() gets them).
+        """
+        for k in range(len(hashes) - 1, -1, -1):     # oldest first
+            t, h = tick - k, hashes[k]
+            if t <= self.checked_tick:
+                continue
+            if t in self.hashes:
+                self._compare(t, h)
+            elif self.last_tick is None or t > self.last_tick:
+                self.remote[t] = h
+        while len(self.remote) > self.keep:
+            del self.remote[min(self.remote)]
+
+    def _compare(self, tick: int, remote_hash: int):
+        self.checked += 1
+        self.checked_tick = max(self.checked_tick, tick)
+        if self.hashes[tick] == remote_hash:
+            return
+        if self.desync_tick is not None and self.desync_tick <= tick:
+            return
+        self.desync_tick = self.wanted = tick
+        print(f"[{self.tag}] first mismatching tick {tick}: "
+              f"ours {self.hashes[tick]:08x} theirs {remote_hash:08x}")
+
+    def compare_values(self, tick: int, remote_values):
+        """Log the first field where the peer's values at `tick` differ from ours."""
+        if tick == self.wanted:
+            self.wanted = None
+        ours = self.values.get(tick)
+        if ours is None:
+            print(f"[{self.tag}] tick {tick}: no longer have our values to compare")
+            return None
+        diff = first_difference(ours, _tuples(remote_values))
+        if diff is None:
+            print(f"[{self.tag}] tick {tick}: values match (desync is earlier than kept history)")
+        else:
+            name, a, b = diff
+            print(f"[{self.tag}] tick {tick}: first differing field {name}: ours {a!r} theirs {b!r}")
+        return diff
+
+def _tuples(v):
+    """Lists back to tuples, so values that went through JSON compare equal to ours."""
+    if isinstance(v, list):
+        return tuple(_tuples(x) for x in v)
+    return v
@@ -0,0 +1,65 @@
+# fanout.py
+"""Encode-once spectator broadcast, sent in small batches between server ticks."""
+import time
+from collections import deque
+
+FANOUT_BATCH = 64       # sendto calls between deadline checks
+
+class Fanout:
+    """Queue of (packet, viewer addresses) drained only when the tick loop is idle.
+
+    The server sends to its players first and hands spectator frames to
+    broadcast(). send() works through the queue until a deadline (the next
+    tick), so a big audience delays spectators, never the players. If a
+    room's next frame arrives before the previous one reached everybody,
+    the rest of the old frame is dropped.
+    """
+    def __init__(self):
+        self.queue = deque()    # [key, packet, addrs, next index]
+        self.current = {}       # key -> its unfinished queue entry
+
+        # Metrics
+        self.sent = 0           # sendto calls that succeeded
+        self.dropped_stale = 0  # superseded by a newer frame before we got to them
+        self.dropped_full = 0   # socket buffer full (EWOULDBLOCK)
+        self.errors = 0
+        self.send_time = 0.0
+
+    def __bool__(self):
+        return bool(self.queue)
+
+    def broadcast(self, key, packet: bytes, addrs: list):
+        old = self.current.get(key)
+        if old is not None:
+            self.dropped_stale += len(old[2]) - old[3]
+            old[3] = len(old[2])
+        entry = [key, packet, addrs, 0]
+        self.current[key] = entry
+        self.queue.append(entry)
+
+    def send(self, sock, deadline: float):
+        """Send queued frames until done or perf_counter() passes `deadline`."""
+        t0 = time.perf_counter()
+        now = t0
+        while self.queue and now < deadline:
+            entry = self.queue[0]
+            key, packet, addrs, i = entry
+            end = min(i + FANOUT_BATCH, len(addrs))
+            failed = 0
+            for addr in addrs[i:end]:
+                try:
+                    sock.sendto(packet, addr)
+                except BlockingIOError:
+                    self.dropped_full += 1
+                    failed += 1
+                except OSError:
+                    self.errors += 1
+                    failed += 1
+            self.sent += end - i - failed
+            entry[3] = end
+            if end >= len(addrs):
+                self.queue.popleft()
+                if self.current.get(key) is entry:
+                    del self.current[key]
+            now = time.perf_counter()
+        self.send_time += now - t0
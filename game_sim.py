@@ -0,0 +1,777 @@
+# game_sim.py
+"""Server-authoritative fight simulation, shared by server.py and client prediction."""
+import math
+import random as r
+import zlib
+from operator import attrgetter
+from sim_primitives import Rect, Sprite, Group
+
+# ---------------- Game constants ----------------
+BG_COLOR = (30, 30, 30)
+PLAYER1_COLOR = (255, 0, 0)
+PLAYER2_COLOR = (0, 0, 255)
+FIREBALL_COLOR = (255, 165, 0)  # Orange
+BLOCK_SHIELD_COLOR = (50, 50, 255, 150)
+
+initial_width, initial_height = 800, 500
+
+# ---------------- Timing ----------------
+# The simulation always advances in fixed SIM_DT steps (see server.py).
+# Velocities like gravity and knockback are in px per REFERENCE_RATE frame
+# and get scaled by dt, so changing SIM_RATE doesn't change the physics.
+SIM_RATE = 60
+SIM_DT = 1.0 / SIM_RATE
+REFERENCE_RATE = 60
+
+def move_px(sprite, axis: str, per_frame: float, frames: float, quantize: bool = True):
+    """Move sprite.rect along axis ("x" or "y") at per_frame px per REFERENCE_RATE frame, for `frames` of them.
+
+    Rect positions are whole pixels. One reference frame moves exactly what
+    the 60 Hz game always did (per_frame rounded half up); at other rates the
+    fraction of a pixel a step leaves over is carried in sprite.carry_<axis>
+    to the next, so the distance covered is the same at every SIM_RATE.
+    quantize=False skips the per-frame rounding, for a velocity that changes
+    every step (rounding it per step would depend on the step size).
+    """
+    if quantize:
+        per_frame = math.floor(per_frame + 0.5)
+    rect = sprite.rect
+    if axis == "x":
+        moved = per_frame * frames + sprite.carry_x
+        whole = int(moved)
+        sprite.carry_x = moved - whole
+        rect.x = rect.x + whole
+    else:
+        moved = per_frame * frames + sprite.carry_y
+        whole = int(moved)
+        sprite.carry_y = moved - whole
+        rect.y = rect.y + whole
+
+# Buttons NetPlayer.handle_input acts on every step they are held. An input
+# frame lasts SIM_RATE / INPUT_RATE steps, so above 60 Hz only its first step
+# may see them, or one tap of jump would use up both jumps.
+PRESS_BUTTONS = ("jump", "attack", "special")
+
+def held_inputs(inputs: dict) -> dict:
+    """inputs for the steps of an input frame after its first: PRESS_BUTTONS released."""
+    return dict(inputs, **dict.fromkeys(PRESS_BUTTONS, 0))
+
+# ---------------- Classes ----------------
+class Fireball(Sprite):
+    def __init__(self, start_x, start_y, direction, color, screen_width):
+        super().__init__()
+        self.direction = direction  # "left" or "right"
+        self.speed = 500
+        self.damage = 25
+        self.screen_width = screen_width
+        self.owner = None
+
+        self.rect = Rect(0, 0, 30, 30)
+        self.rect.center = (start_x, start_y)
+        self.carry_x = 0.0      # sub-pixel movement left over (see move_px)
+
+    def update(self, dt, *args):
+        per_frame = self.speed / REFERENCE_RATE
+        move_px(self, "x", per_frame if self.direction == "right" else -per_frame, dt * REFERENCE_RATE)
+
+        if self.rect.right < 0 or self.rect.left > self.screen_width:
+            self.kill()
+
+    def save_state(self):
+        return (tuple(self.rect), self.direction, self.owner, self.speed, self.damage, self.screen_width, self.carry_x)
+
+    @classmethod
+    def from_state(cls, st):
+        rect, direction, owner, speed, damage, screen_width, carry_x = st
+        fireball = cls(0, 0, direction, FIREBALL_COLOR, screen_width)
+        fireball.rect.update(rect)
+        fireball.owner, fireball.speed, fireball.damage, fireball.carry_x = owner, speed, damage, carry_x
+        return fireball
+
+class Player(Sprite):
+    # Everything that changes during a fight (see save_state/load_state)
+    STATE_FIELDS = (
+        "gravity", "attacking", "attack_timer", "blocking", "facing",
+        "health", "special_attack", "can_special", "special_cooldown_timer",
+        "block_stamina", "combo_count", "last_hit_time",
+        "stunned", "stun_timer", "knockback_velocity", "attack_type",
+        "jump_count", "jump_pressed", "dashing", "dash_timer", "dash_charges",
+        "dash_hit_this_dash", "display_health", "joker_index", "joker_current",
+        "carry_x", "carry_y",
+    )
+
+    def __init__(self, x_ratio, color, controls, typeofspecial, world=None, rng=None):
+        super().__init__()
+        self.world = world
+        self.color = color
+        self.x_ratio = x_ratio
+        self.width_ratio = 0.06
+        self.height_ratio = 0.2
+
+        self.rect = Rect(0, 0, 50, 100)
+        self.controls = controls
+        self.speed = 300
+        self.gravity = 0
+        self.attacking = False
+        self.attack_timer = 0
+        self.blocking = False
+        self.active_hitbox = None
+        self.hit_opponents = []
+        self.facing = "right" if x_ratio < 0.5 else "left"
+        self.health = 100
+        self.max_health = 100
+
+        self.typeofspecial = typeofspecial
+        self.special_attack = 300
+        self.max_special = 300
+        self.special_cost = 100
+        self.can_special = True
+        self.special_cooldown_timer = 0
+        self.special_cooldown_time = 0.5
+
+        self.block_stamina = 100
+        self.max_block_stamina = 100
+        self.block_drain_rate = 100
+        self.block_recover_rate = 30
+
+        self.combo_count = 0
+        self.last_hit_time = 0
+        self.combo_reset_time = 0.8
+
+        self.stunned = False
+        self.stun_timer = 0
+        self.knockback_velocity = 0
+
+        self.shockwave_damage = 30
+        self.shockwave_base_damage = 15
+        self.shockwave_height_multiplier = 0.08
+
+        self.attack_type = "normal"
+
+        self.max_jumps = 2
+        self.jump_count = 0
+        self.jump_pressed = False
+
+        self.dashing = False
+        self.dash_speed = 3000
+        self.dash_time = 0.08
+        self.dash_timer = 0
+        self.dash_trail = []   # trail visuals not used on server
+
+        # Sub-pixel movement left over from the last step (see move_px)
+        self.carry_x = 0.0
+        self.carry_y = 0.0
+        self.dash_trail_max = 10
+
+        self.max_dash_charges = 3
+        self.dash_charges = 0
+        self.dash_hit_this_dash = False
+
+        self.display_health = self.health
+
+        if self.typeofspecial == "joker":
+            self.joker_deck = ["fireball", "dash", "heal", "shockwave"]
+            (rng or r).shuffle(self.joker_deck)
+            self.joker_index = 0
+            self.joker_current = self.joker_deck[self.joker_index]
+        else:
+            self.joker_deck = None
+            self.joker_index = None
+            self.joker_current = None
+
+    def initial_setup(self, screen_width, screen_height):
+        w = int(screen_width * self.width_ratio)
+        h = int(screen_height * self.height_ratio)
+        floor = 0.8 * screen_height
+        self.rect = Rect(0, 0, w, h)
+        self.rect.midbottom = (int(screen_width * self.x_ratio), floor)
+
+    def update_rect(self, screen_width, screen_height):
+        w = int(screen_width * self.width_ratio)
+        h = int(screen_height * self.height_ratio)
+        floor = 0.8 * screen_height
+        old_midbottom = self.rect.midbottom
+
+        self.rect = Rect(0, 0, w, h)
+        self.rect.midbottom = old_midbottom
+
+        if self.rect.bottom > floor:
+            self.rect.bottom = floor
+        if self.rect.left < 0:
+            self.rect.left = 0
+        if self.rect.right > screen_width:
+            self.rect.right = screen_width
+
+    def handle_input(self, dt, screen_height, screen_width):
+        # Overridden in NetPlayer; server doesn't read keyboard
+        return
+
+    def apply_gravity(self, screen_height, screen_width=None, dt=1.0 / REFERENCE_RATE):
+        frames = dt * REFERENCE_RATE
+        floor = 0.8 * screen_height
+        GRAVITY_ACCELERATION_RATIO = 0.002
+        GRAVITY_ACCELERATION = screen_height * GRAVITY_ACCELERATION_RATIO
+        WALL_SLIDE_SPEED_RATIO = 0.5
+
+        wall_touch = self.is_touching_wall(screen_width) if screen_width else None
+        if wall_touch and self.is_airborne(screen_height):
+            self.gravity = min(self.gravity, GRAVITY_ACCELERATION / WALL_SLIDE_SPEED_RATIO)
+
+        self.gravity += GRAVITY_ACCELERATION * frames
+        # The second term makes a jump's arc the same at every rate as the 60 Hz one (it's 0 there),
+        # which rounds per frame as it always did
+        move_px(self, "y", self.gravity + GRAVITY_ACCELERATION * (1 - frames) / 2, frames, quantize=frames == 1)
+
+        if self.rect.bottom >= floor:
+            self.rect.bottom = floor
+            self.carry_y = 0.0      # the floor took the rest of the move
+            self.gravity = 0
+            self.jump_count = 0
+
+        if self.knockback_velocity != 0:
+            decay = 0.85 ** frames
+            if frames == 1:
+                move_px(self, "x", self.knockback_velocity, 1)
+            else:
+                # What the 60 Hz game's per-frame decay covers in this step, so the slide is as long at any rate
+                move_px(self, "x", self.knockback_velocity * (1 - decay) / (0.15 * frames), frames, quantize=False)
+            self.knockback_velocity *= decay
+            if abs(self.knockback_velocity) < 1:
+                self.knockback_velocity = 0
+
+        if self.stunned:
+            self.stun_timer -= dt
+            if self.stun_timer <= 0:
+                self.stunned = False
+
+    def start_attack(self, screen_height):
+        self.attack_type = "normal"
+        self.attacking = True
+        self.attack_timer = 0.2
+        w, h = self.rect.width, self.rect.height
+        airborne = self.is_airborne(screen_height)
+
+        # Keep deterministic; use grounded/airborne branches
+        if airborne:
+            self.active_hitbox = Rect(self.rect.centerx - 0.2*w, self.rect.top - 0.5*h, 0.4*w, 0.5*h)
+        else:
+            if self.facing == "right":
+                self.active_hitbox = Rect(self.rect.right, self.rect.top + 0.2*h, 0.35*w, 0.6*h)
+            else:
+                self.active_hitbox = Rect(self.rect.left - 0.35*w, self.rect.top + 0.2*h, 0.35*w, 0.6*h)
+        self.hit_opponents = []
+
+    def start_special(self, screen_width):
+        self.special_attack -= self.special_cost
+        self.can_special = False
+        self.special_cooldown_timer = self.special_cooldown_time
+
+        if self.typeofspecial == "joker":
+            chosen = self.joker_current
+        else:
+            chosen = self.typeofspecial
+
+        if chosen == "fireball":
+            self.attack_type = "fireball"
+            start_x = self.rect.centerx
+            start_y = self.rect.centery - 10
+            fireball = Fireball(start_x, start_y, self.facing, FIREBALL_COLOR, screen_width)
+            fireball.owner = self
+            self.world.all_sprites.add(fireball)
+            self.world.fireballs.add(fireball)
+
+        elif chosen == "dash":
+            self.attack_type = "dash"
+            self.dashing = True
+            self.dash_timer = self.dash_time
+            self.dash_charges = self.max_dash_charges
+            self.dash_hit_this_dash = False
+            self.hit_opponents = []
+
+        elif chosen == "heal":
+            self.health += 20
+            if self.health > self.max_health:
+                self.health = self.max_health
+
+        elif chosen == "shockwave":
+            self.attack_type = "shockwave"
+            w, h = self.rect.width, self.rect.height
+            shockwave_radius = max(w, h) * 1.85
+            self.active_hitbox = Rect(self.rect.centerx - shockwave_radius/2, self.rect.centery - shockwave_radius/2, shockwave_radius, shockwave_radius)
+            self.attacking = True
+            self.attack_timer = 0.3
+            self.hit_opponents = []
+
+        if self.typeofspecial == "joker":
+            self.joker_index += 1
+            if self.joker_index >= len(self.joker_deck):
+                self.joker_index = 0
+            self.joker_current = self.joker_deck[self.joker_index]
+
+    def update_attack(self, dt):
+        if self.attacking:
+            self.attack_timer -= dt
+            if self.attack_timer <= 0:
+                self.attacking = False
+                self.active_hitbox = None
+                self.hit_opponents = []
+        if not self.can_special:
+            self.special_cooldown_timer -= dt
+            if self.special_cooldown_timer <= 0:
+                self.can_special = True
+
+    def gain_special(self, amount):
+        self.special_attack += amount
+        if self.special_attack > self.max_special:
+            self.special_attack = self.max_special
+
+    def deal_damage(self, amount):
+        self.health -= amount
+        if self.health < 0:
+            self.health = 0
+        self.gain_special(amount * 0.5)
+
+    def update(self, dt, screen_width, screen_height):
+        # Ensure rect size & floor clamping uses current screen size.
+        self.update_rect(screen_width, screen_height)
+
+        # >>> APPLY INPUTS HERE <<<
+        # NetPlayer overrides handle_input; base Player's is a no-op, so this is safe.
+        self.handle_input(dt, screen_height, screen_width)
+
+        # Dash movement & hitbox
+        if self.dashing:
+            direction = 1 if self.facing == "right" else -1
+            move_px(self, "x", direction * self.dash_speed / REFERENCE_RATE, dt * REFERENCE_RATE)
+            self.dash_timer -= dt
+            self.active_hitbox = Rect(
+                min(self.rect.centerx, self.rect.centerx + direction * self.dash_speed * dt),
+                self.rect.top,
+                self.rect.width * 0.6 + self.dash_speed * dt,
+                self.rect.height
+            )
+            if self.dash_timer <= 0:
+                self.dashing = False
+                self.active_hitbox = None
+                self.dash_hit_this_dash = False
+                self.hit_opponents = []
+        if not self.dashing and self.attack_type == "dash":
+            self.attack_type = "normal"
+
+        self.apply_gravity(screen_height, screen_width, dt)
+        self.update_attack(dt)
+        self.display_health += (self.health - self.display_health) * (1 - 0.88 ** (dt * REFERENCE_RATE))
+
+    def save_state(self):
+        """Cheap tuple copy of the mutable fight state (no Surfaces)."""
+        hb = self.active_hitbox
+        return (
+            tuple(self.rect), tuple(hb) if hb else None, tuple(self.hit_opponents),
+            tuple(getattr(self, f) for f in self.STATE_FIELDS),
+        )
+
+    def load_state(self, st):
+        rect, hb, hit_opponents, values = st
+        self.rect.update(rect)
+        self.active_hitbox = Rect(hb) if hb else None
+        self.hit_opponents = list(hit_opponents)
+        for f, v in zip(self.STATE_FIELDS, values):
+            setattr(self, f, v)
+
+    def is_airborne(self, screen_height):
+        floor = 0.8 * screen_height
+        return self.rect.bottom < floor - 5
+
+    def is_touching_wall(self, screen_width):
+        if self.rect.left <= 0:
+            return "left"
+        elif self.rect.right >= screen_width:
+            return "right"
+        return None
+
+class NetPlayer(Player):
+    """Same as Player, but reads inputs from network dict instead of keyboard."""
+    STATE_FIELDS = Player.STATE_FIELDS + ("input_seq",)
+
+    def __init__(self, x_ratio, color, player_id, typeofspecial, world=None, rng=None):
+        super().__init__(x_ratio, color, controls={}, typeofspecial=typeofspecial, world=world, rng=rng)
+        self.player_id = player_id
+        self.input_seq = 0      # last client input frame applied (for client reconciliation)
+        self.net_inputs = {"left":0,"right":0,"jump":0,"attack":0,"block":0,"special":0}
+
+    def save_state(self):
+        return super().save_state() + (tuple(self.net_inputs.values()),)
+
+    def load_state(self, st):
+        super().load_state(st[:-1])
+        self.net_inputs.update(zip(self.net_inputs, st[-1]))
+
+    def set_inputs(self, inputs: dict):
+        self.net_inputs.update({k:int(bool(inputs.get(k,0))) for k in ["left","right","jump","attack","block","special"]})
+
+    def handle_input(self, dt, screen_height, screen_width):
+        if (self.world and self.world.ko_triggered) or self.stunned:
+            return
+        inp = self.net_inputs
+
+        if not self.dashing:
+            if inp["left"]:
+                move_px(self, "x", -self.speed / REFERENCE_RATE, dt * REFERENCE_RATE)
+                self.facing = "left"
+            if inp["right"]:
+                move_px(self, "x", self.speed / REFERENCE_RATE, dt * REFERENCE_RATE)
+                self.facing = "right"
+
+        # Jump / double-jump / wall-jump
+        JUMP_VELOCITY = screen_height * (-0.036)
+        wall_touch = None
+        if self.rect.left <= 0: wall_touch = "left"
+        elif self.rect.right >= screen_width: wall_touch = "right"
+
+        if inp["jump"]:
+            if self.is_airborne(screen_height) and self.jump_count < self.max_jumps:
+                self.gravity = JUMP_VELOCITY
+                self.jump_count += 1
+            elif not self.is_airborne(screen_height) and self.jump_count == 0:
+                self.gravity = JUMP_VELOCITY
+                self.jump_count = 1
+            elif wall_touch:
+                self.gravity = JUMP_VELOCITY
+                if wall_touch == "left":
+                    self.rect.x += int(0.1 * screen_width); self.facing = "right"
+                else:
+                    self.rect.x -= int(0.1 * screen_width); self.facing = "left"
+
+        # Blocking
+        if inp["block"]:
+            self.blocking = self.block_stamina > 0
+        else:
+            self.blocking = False
+
+        if self.blocking:
+            self.block_stamina -= self.block_drain_rate * dt
+            if self.block_stamina < 0:
+                self.block_stamina = 0
+                self.blocking = False
+        else:
+            self.block_stamina += self.block_recover_rate * dt
+            if self.block_stamina > self.max_block_stamina:
+                self.block_stamina = self.max_block_stamina
+
+        # Attack
+        if inp["attack"] and not self.attacking and not self.blocking:
+            self.start_attack(screen_height)
+
+        # Special
+        if inp["special"] and self.special_attack >= self.special_cost and self.can_special and not self.attacking and not self.blocking:
+            self.start_special(screen_width)
+
+# ---------------- World ----------------
+class World:
+    """Everything one fight needs: both fighters, fireballs and KO state."""
+    def __init__(self, width=initial_width, height=initial_height, p1_special="heal", p2_special="joker", seed=None):
+        self.width, self.height = width, height
+        # Simulation clock (seconds of game time); combos are timed against this
+        self.time = 0.0
+        # Everything random comes from this seed, so (seed, inputs) replays the fight
+        # exactly; peers that must stay in lockstep (rollback) pass the same one
+        self.seed = seed if seed is not None else r.getrandbits(32)
+        self.rng = r.Random(self.seed)
+
+        # Sprite groups
+        self.all_sprites = Group()
+        self.fireballs = Group()
+
+        self.ko_triggered = False
+        self.ko_y = -200
+
+        self.player1 = NetPlayer(0.2, PLAYER1_COLOR, player_id=1, typeofspecial=p1_special, world=self, rng=self.rng)
+        self.player2 = NetPlayer(0.8, PLAYER2_COLOR, player_id=2, typeofspecial=p2_special, world=self, rng=self.rng)
+        self.player1.initial_setup(width, height)
+        self.player2.initial_setup(width, height)
+        self.players = Group(self.player1, self.player2)
+        self.all_sprites.add(self.player1, self.player2)
+
+    def save_state(self):
+        """Snapshot of the whole fight for rollback; restore with load_state()."""
+        return (
+            self.time, self.ko_triggered, self.ko_y,
+            self.player1.save_state(), self.player2.save_state(),
+            tuple(f.save_state() for f in self.fireballs),
+        )
+
+    def load_state(self, st):
+        self.time, self.ko_triggered, self.ko_y, p1, p2, fbs = st
+        self.player1.load_state(p1)
+        self.player2.load_state(p2)
+        for f in list(self.fireballs):
+            f.kill()
+        for fst in fbs:
+            fireball = Fireball.from_state(fst)
+            self.all_sprites.add(fireball)
+            self.fireballs.add(fireball)
+
+def reset_game(world: World):
+    player1, player2 = world.player1, world.player2
+    width, height = world.width, world.height
+    world.ko_triggered = False
+    world.ko_y = -200
+
+    player1.health = 100
+    player2.health = 100
+
+    player1.special_attack = 0
+    player2.special_attack = 0
+
+    player1.block_stamina = player1.max_block_stamina
+    player2.block_stamina = player2.max_block_stamina
+
+    player1.rect.midbottom = (int(width * player1.x_ratio), int(0.8 * height))
+    player2.rect.midbottom = (int(width * player2.x_ratio), int(0.8 * height))
+    player1.carry_x = player1.carry_y = player2.carry_x = player2.carry_y = 0.0
+
+    player1.gravity = 0
+    player2.gravity = 0
+
+    player1.attacking = False
+    player2.attacking = False
+
+    player1.active_hitbox = None
+    player2.active_hitbox = None
+
+    player1.facing = "right"
+    player2.facing = "left"
+
+    player1.stunned = False
+    player2.stunned = False
+    player1.combo_count = 0
+    player2.combo_count = 0
+    player1.knockback_velocity = 0
+    player2.knockback_velocity = 0
+
+    for f in list(world.fireballs):
+        f.kill()
+
+def handle_attack(world: World, attacker: Player, defender: Player):
+    now = world.time
+
+    # Dash contact
+    if attacker.attack_type == "dash" and attacker.dashing and attacker.active_hitbox:
+        if attacker.active_hitbox.colliderect(defender.rect) and defender not in attacker.hit_opponents:
+            defender.deal_damage(30)
+            defender.stunned = True
+            defender.stun_timer = 0.4
+            defender.knockback_velocity = 15 if attacker.facing == "right" else -15
+
+            attacker.hit_opponents.append(defender)
+            attacker.dash_hit_this_dash = True
+        return
+
+    # Normal/shockwave
+    if attacker.active_hitbox and attacker.active_hitbox.colliderect(defender.rect) and defender not in attacker.hit_opponents:
+        if now - attacker.last_hit_time > attacker.combo_reset_time:
+            attacker.combo_count = 0
+
+        attacker.combo_count += 1
+        attacker.last_hit_time = now
+        attacker.hit_opponents.append(defender)
+
+        damage = 5
+        if attacker.attack_type == "shockwave":
+            floor = 0.8 * world.height
+            height_above_ground = max(0, floor - attacker.rect.bottom)
+            damage = attacker.shockwave_base_damage + height_above_ground * attacker.shockwave_height_multiplier
+
+        if not defender.blocking:
+            defender.deal_damage(damage)
+
+        attacker.gain_special(damage * 1.5)
+        defender.gain_special(damage * 0.5)
+
+        if attacker.combo_count >= 4:
+            defender.stunned = True
+            defender.stun_timer = 0.7
+            defender.knockback_velocity = 18 if attacker.facing == "right" else -18
+            attacker.combo_count = 0
+
+def step_game(world: World, dt, inputs=None):
+    apply_inputs(world, inputs)
+    update_world(world, dt)
+    resolve_hits(world, dt)
+
+# step_game() in its three phases, for callers that time them separately (server metrics)
+def apply_inputs(world: World, inputs=None):
+    if inputs is not None:
+        world.player1.set_inputs(inputs[1])
+        world.player2.set_inputs(inputs[2])
+
+def update_world(world: World, dt):
+    player1, player2 = world.player1, world.player2
+    world.time += dt
+
+    # Update world
+    world.players.update(dt, world.width, world.height)
+    world.fireballs.update(dt)
+
+    # Passive special gain
+    player1.gain_special(10 * dt)
+    player2.gain_special(10 * dt)
+
+def resolve_hits(world: World, dt):
+    player1, player2 = world.player1, world.player2
+    height = world.height
+
+    # Basic attack collisions
+    handle_attack(world, player1, player2)
+    handle_attack(world, player2, player1)
+
+    # Fireball collisions
+    for fireball in list(world.fireballs):
+        if fireball.owner != player1 and fireball.rect.colliderect(player1.rect):
+            attacker = fireball.owner; defender = player1
+            now = world.time
+
+            if now - attacker.last_hit_time > attacker.combo_reset_time:
+                attacker.combo_count = 0
+
+            attacker.combo_count += 1
+            attacker.last_hit_time = now
+
+            if not defender.blocking:
+                defender.deal_damage(fireball.damage)
+
+            attacker.gain_special(fireball.damage * 1.5)
+            defender.gain_special(fireball.damage * 0.5)
+
+            if attacker.combo_count >= 4:
+                defender.stunned = True
+                defender.stun_timer = 0.9
+                defender.knockback_velocity = 35 if attacker.facing == "right" else -35
+                attacker.combo_count = 0
+
+            fireball.kill()
+
+        elif fireball.owner != player2 and fireball.rect.colliderect(player2.rect):
+            attacker = fireball.owner; defender = player2
+            now = world.time
+
+            if now - attacker.last_hit_time > attacker.combo_reset_time:
+                attacker.combo_count = 0
+
+            attacker.combo_count += 1
+            attacker.last_hit_time = now
+
+            if not defender.blocking:
+                defender.deal_damage(fireball.damage)
+
+            attacker.gain_special(fireball.damage * 1.5)
+            defender.gain_special(fireball.damage * 0.5)
+
+            if attacker.combo_count >= 4:
+                defender.stunned = True
+                defender.stun_timer = 0.9
+                defender.knockback_velocity = 35 if attacker.facing == "right" else -35
+                attacker.combo_count = 0
+
+            fireball.kill()
+
+    # KO logic (no drawing on server)
+    if not world.ko_triggered and (player1.health <= 0 or player2.health <= 0):
+        world.ko_triggered = True
+        world.ko_y = -0.4 * height
+
+    if world.ko_triggered:
+        world.ko_y += 600 * dt
+        if world.ko_y > 0.3 * height:
+            world.ko_y = 0.3 * height
+
+def pack_state(world: World) -> dict:
+    """Pack minimal full state for clients to render."""
+    fb_list = [{"x": f.rect.centerx, "y": f.rect.centery, "dir": f.direction} for f in world.fireballs]
+
+    def p_to_dict(p: Player):
+        hb = None
+        if p.active_hitbox:
+            rct = p.active_hitbox
+            hb = {"x": rct.x, "y": rct.y, "w": rct.width, "h": rct.height}
+        return {
+            "x": p.rect.x, "y": p.rect.y,
+            "w": p.rect.width, "h": p.rect.height,
+            "hp": p.health, "hpMax": p.max_health,
+            "hpDisp": p.display_health,
+            "special": p.special_attack, "specialMax": p.max_special,
+            "block": p.block_stamina, "blockMax": p.max_block_stamina,
+            "facing": p.facing, "blocking": p.blocking,
+            "attacking": p.attacking, "attackType": p.attack_type,
+            "stunned": p.stunned,
+            "hitbox": hb,
+            "vy": p.gravity, "knock": p.knockback_velocity,
+            "jumps": p.jump_count, "inputSeq": p.input_seq,
+        }
+
+    return {
+        "p1": p_to_dict(world.player1),
+        "p2": p_to_dict(world.player2),
+        "fireballs": fb_list,
+        "ko": world.ko_triggered,
+        "width": world.width, "height": world.height
+    }
+
+# ---------------- Determinism checks ----------------
+_INPUT_KEYS = ("left", "right", "jump", "attack", "block", "special")
+# Per-player part of state_values(), in order (names for desync reports)
+_PLAYER_VALUE_NAMES = (
+    ("rect.x", "rect.y", "rect.w", "rect.h", "hitbox.x", "hitbox.y", "hitbox.w", "hitbox.h", "hit_opponents")
+    + Player.STATE_FIELDS
+    + tuple("input." + k for k in _INPUT_KEYS)
+    + ("joker_deck",)
+)
+_FIREBALL_VALUE_NAMES = ("x", "y", "w", "h", "direction", "owner", "speed", "damage", "carry_x")
+# input_seq is transport bookkeeping, not simulation state
+_player_fields = attrgetter(*Player.STATE_FIELDS)
+_NO_HITBOX = (None, None, None, None)
+
+def state_values(world: World) -> tuple:
+    """Everything that decides the next tick, as plain values in a fixed order."""
+    vals = [world.time, world.ko_triggered, world.ko_y, world.width, world.height]
+    for p in (world.player1, world.player2):
+        vals.extend(p.rect)
+        vals.extend(p.active_hitbox or _NO_HITBOX)
+        vals.append(tuple(o.player_id for o in p.hit_opponents))
+        vals.extend(_player_fields(p))
+        vals.extend(p.net_inputs[k] for k in _INPUT_KEYS)
+        vals.append(tuple(p.joker_deck) if p.joker_deck else None)
+    for f in world.fireballs:
+        vals.extend(f.rect)
+        vals.extend((f.direction, f.owner.player_id if f.owner else 0, f.speed, f.damage, f.carry_x))
+    return tuple(vals)
+
+def state_value_name(i: int) -> str:
+    """Human-readable name of state_values()[i]."""
+    head = ("time", "ko_triggered", "ko_y", "width", "height")
+    if i < len(head):
+        return head[i]
+    i -= len(head)
+    n = len(_PLAYER_VALUE_NAMES)
+    if i < 2 * n:
+        return f"p{i // n + 1}.{_PLAYER_VALUE_NAMES[i % n]}"
+    i -= 2 * n
+    m = len(_FIREBALL_VALUE_NAMES)
+    return f"fireball[{i // m}].{_FIREBALL_VALUE_NAMES[i % m]}"
+
+def state_hash(values: tuple, prev: int = 0) -> int:
+    """Rolling 32-bit hash: this tick's values chained onto the previous tick's hash.
+
+    repr() of ints, floats (shortest round-trip form), bools and strings is
+    the same on every platform, unlike hash().
+    """
+    return zlib.crc32(repr(values).encode(), prev)
+
+def first_difference(a, b):
+    """(name, ours, theirs) of the first differing state value, or None if equal."""
+    for i, (x, y) in enumerate(zip(a, b)):
+        if x != y:
+            return state_value_name(i), x, y
+    if len(a) != len(b):
+        return "fireballs (count)", (len(a) - len(b)) // len(_FIREBALL_VALUE_NAMES), 0
+    return None
@@ -0,0 +1,64 @@
+# histogram.py
+"""Fixed-size log-bucket histogram: constant-time add, mergeable, small enough to send in a packet."""
+import math
+
+class Histogram:
+    """Counts of values in buckets growing by `growth` from `lo` up.
+
+    Percentiles are exact to within one bucket (5% by default), which is
+    plenty for latency numbers, and two processes' histograms can be added.
+    """
+    def __init__(self, lo: float = 0.001, growth: float = 1.05, buckets: int = 300):
+        self.lo, self.growth = lo, growth
+        self.counts = [0] * buckets
+        self._log_growth = math.log(growth)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, v: float):
+        i = int(math.log(v / self.lo) / self._log_growth) + 1 if v > self.lo else 0
+        self.counts[min(i, len(self.counts) - 1)] += 1
+        self.count += 1
+        self.total += v
+        if v > self.max:
+            self.max = v
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q: float) -> float:
+        """Upper edge of the bucket holding the q-th percentile (q in 0..100), capped at max."""
+        if not self.count:
+            return 0.0
+        target = q / 100 * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if c and seen >= target:
+                return min(self.lo * self.growth ** i, self.max)
+        return self.max
+
+    def summary(self, *qs) -> dict:
+        out = {f"p{q:g}": round(self.percentile(q), 4) for q in qs or (50, 90, 99)}
+        out.update(max=round(self.max, 4), n=self.count)
+        return out
+
+    # Sparse form for JSON packets: [[bucket, count], ...] plus totals
+    def to_wire(self) -> dict:
+        return {"b": [[i, c] for i, c in enumerate(self.counts) if c],
+                "n": self.count, "sum": round(self.total, 6), "max": self.max}
+
+    def merge_wire(self, wire: dict):
+        for i, c in wire["b"]:
+            self.counts[i] += c
+        self.count += wire["n"]
+        self.total += wire["sum"]
+        self.max = max(self.max, wire["max"])
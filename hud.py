@@ -0,0 +1,118 @@
+# hud.py
+"""Health / special / block bars kept on a pre-rendered layer, redrawn only when a bar's pixel width changes.
+
+The bars move a few times a second, but draw_bars used to issue ~20 rect
+and line draws per frame for them. HudLayer quantizes every bar to the
+pixels it fills, re-renders only the bars whose key changed, and blits the
+six bar rects (whole pixels, opaque, so a plain copy) from its layer onto
+the frame. draw() returns the rects whose pixels changed, so a dirty-rect
+presenter only has to push those.
+
+Players are dicts with the snapshot keys (hp, hpMax, hpDisp, special,
+specialMax, block, blockMax); hud_values() makes one from a Fighter object.
+"""
+import pygame as pg
+
+LOW_HP = 0.3                # below this share of max HP the bar turns LOW_HP_COLOR
+LOW_HP_COLOR = (255, 80, 80)
+HP_BG, CHIP_COLOR = (60, 60, 60), (230, 230, 230)
+SPECIAL_BG, SEGMENT_COLOR = (50, 0, 50), (255, 255, 255)
+BLOCK_BG, BLOCK_COLOR = (20, 20, 70), (0, 200, 255)
+SPECIAL_SEGMENTS = 3
+BAR_SPACING = 5
+
+def hud_values(fighter) -> dict:
+    """The snapshot-style dict draw() takes, from a Fighter (game_sim or the game script)."""
+    return {"hp": fighter.health, "hpMax": fighter.max_health, "hpDisp": fighter.display_health,
+            "special": fighter.special_attack, "specialMax": fighter.max_special,
+            "block": fighter.block_stamina, "blockMax": fighter.max_block_stamina}
+
+def _fill(width: float, value, maximum) -> int:
+    return min(max(int(width * (value / maximum)), 0), int(width))
+
+class HudLayer:
+    """Both players' bars on one layer surface the size of the HUD strip."""
+    def __init__(self, p1_color=(255, 0, 0), p2_color=(0, 0, 255)):
+        self.colors = {1: p1_color, 2: p2_color}
+        self.size = None
+        self.layer = None
+        self.rects = {}     # (side, kind) -> pg.Rect of that bar, same on the layer and the screen
+        self.keys = {}      # (side, kind) -> quantized value the layer currently shows
+
+        # Metrics
+        self.redraws = 0
+
+    def _layout(self, width: int, height: int):
+        # Same float layout draw_bars always used; pg.Rect truncates it to the pixels pg.draw filled
+        bar_h = 0.05 * height
+        seg_w = width * 0.03
+        hp_w, special_w, block_w, block_h = width * 0.35, seg_w * SPECIAL_SEGMENTS, seg_w * 3, bar_h / 2
+        y_special = bar_h + BAR_SPACING
+        y_block = y_special + bar_h + BAR_SPACING
+        self.seg_w = seg_w
+        self.rects = {
+            (1, "hp"): pg.Rect(0, 0, hp_w, bar_h), (2, "hp"): pg.Rect(width - hp_w, 0, hp_w, bar_h),
+            (1, "special"): pg.Rect(0, y_special, special_w, bar_h),
+            (2, "special"): pg.Rect(width - special_w, y_special, special_w, bar_h),
+            (1, "block"): pg.Rect(0, y_block, block_w, block_h),
+            (2, "block"): pg.Rect(width - block_w, y_block, block_w, block_h),
+        }
+        self.layer = pg.Surface((width, max(r.bottom for r in self.rects.values())))
+        self.keys = {}
+        self.size = (width, height)
+
+    def _key(self, kind: str, p: dict, w: float):
+        if kind == "hp":
+            return _fill(w, p["hpDisp"], p["hpMax"]), _fill(w, p["hp"], p["hpMax"]), p["hp"] / p["hpMax"] >= LOW_HP
+        if kind == "special":
+            return _fill(w, p["special"], p["specialMax"])
+        return _fill(w, p["block"], p["blockMax"])
+
+    def _render(self, bar, key):
+        side, kind = bar
+        rect = self.rects[bar]
+        x, y, w, h = rect
+        layer = self.layer
+
+        def fill(width, color):     # p1's bars fill from the left, p2's from the right
+            layer.fill(color, (x if side == 1 else x + w - width, y, width, h))
+
+        if kind == "hp":
+            chip, real, healthy = key
+            layer.fill(HP_BG, rect)
+            fill(chip, CHIP_COLOR)
+            fill(real, self.colors[side] if healthy else LOW_HP_COLOR)
+        elif kind == "special":
+            layer.fill(SPECIAL_BG, rect)
+            fill(key, self.colors[side])
+            for j in range(1, SPECIAL_SEGMENTS):
+                line_x = x + j * self.seg_w
+                pg.draw.line(layer, SEGMENT_COLOR, (line_x, y), (line_x, y + h - 1), 2)
+        else:
+            layer.fill(BLOCK_BG, rect)
+            fill(key, BLOCK_COLOR)
+
+    def update(self, width: int, height: int, p1: dict, p2: dict) -> list:
+        """Re-render the bars whose quantized value changed; returns their rects."""
+        if self.size != (width, height):
+            self._layout(width, height)
+        dirty = []
+        for bar, rect in self.rects.items():
+            key = self._key(bar[1], p1 if bar[0] == 1 else p2, rect.w)
+            if self.keys.get(bar) != key:
+                self.keys[bar] = key
+                self._render(bar, key)
+                self.redraws += 1
+                dirty.append(self.rects[bar])
+        return dirty
+
+    def blit(self, surface, rects=None):
+        """Copy the bars (or just `rects`) from the layer onto surface."""
+        for rect in self.rects.values() if rects is None else rects:
+            surface.blit(self.layer, rect, rect)
+
+    def draw(self, surface, width: int, height: int, p1: dict, p2: dict) -> list:
+        """update() then blit() every bar; returns the rects whose pixels changed since the last call."""
+        dirty = self.update(width, height, p1, p2)
+        self.blit(surface)
+        return dirty
@@ -0,0 +1,171 @@
+# interpolation.py
+"""Timestamped snapshot buffer that renders remote entities slightly in the past,
+and the lock-free handoff that gets snapshots from the network thread to the render loop."""
+import time
+from collections import deque
+
+INTERP_DELAY = 0.05          # s behind the newest snapshot we render remote entities
+MAX_EXTRAPOLATION = 0.05     # s we keep moving things forward once the buffer runs dry
+FIREBALL_MATCH_DIST = 80     # px a fireball may move between snapshots and still be "the same"
+RESTART_TIME = 1.0           # s a snapshot may be older than the newest before it means the room restarted
+
+def _lerp(a, b, t):
+    return a + (b - a) * t
+
+def _lerp_rect(ra, rb, t):
+    if not ra or not rb:
+        return dict(rb) if rb else None
+    return {"x": _lerp(ra["x"], rb["x"], t), "y": _lerp(ra["y"], rb["y"], t), "w": rb["w"], "h": rb["h"]}
+
+def _lerp_fireballs(fa, fb, t):
+    out = []
+    unused = list(fa)
+    for f in fb:
+        best = None
+        for g in unused:
+            if g["dir"] == f["dir"] and abs(g["x"] - f["x"]) <= FIREBALL_MATCH_DIST and abs(g["y"] - f["y"]) <= FIREBALL_MATCH_DIST:
+                if best is None or abs(g["x"] - f["x"]) < abs(best["x"] - f["x"]):
+                    best = g
+        if best is None:
+            out.append(dict(f))
+        else:
+            unused.remove(best)
+            out.append({"x": _lerp(best["x"], f["x"], t), "y": _lerp(best["y"], f["y"], t), "dir": f["dir"]})
+    return out
+
+class SnapshotBuffer:
+    """Keeps recent snapshots on the server's tick timeline.
+
+    The server tick is converted to seconds and mapped onto our clock with the
+    smallest observed (arrival - server time) offset, so network jitter does not
+    move the render time around. apply() then replaces the remote fighter and
+    the fireballs in a state with values lerped between the two snapshots that
+    bracket (now - delay), or briefly extrapolated past the newest one.
+    """
+    def __init__(self, remote_key: str, tick_rate: float = 60, delay: float = INTERP_DELAY, size: int = 64):
+        self.remote_key = remote_key
+        self.tick_dt = 1.0 / tick_rate
+        self.delay = delay
+        self.snaps = deque(maxlen=size)     # (server_time, snapshot), oldest first
+        self.clock_offset = None
+
+        # Metrics
+        self.depth = 0           # snapshots still ahead of the render time
+        self.underruns = 0       # frames rendered past the newest snapshot
+        self.starved = 0         # ...of which beyond MAX_EXTRAPOLATION (frozen)
+        self.restarts = 0        # tick timelines thrown away because the server started over
+
+    def push(self, s: dict, now: float = None):
+        """Add a decoded snapshot (must carry its server "tick")."""
+        now = time.perf_counter() if now is None else now
+        t = s.get("tick", 0) * self.tick_dt
+        if self.snaps and t <= self.snaps[-1][0] - RESTART_TIME:
+            # Not a late packet: ticks restarted, so the old timeline and its clock mapping are void
+            self.snaps.clear()
+            self.clock_offset = None
+            self.restarts += 1
+        offset = now - t
+        if self.clock_offset is None or offset < self.clock_offset:
+            self.clock_offset = offset
+        else:
+            # drift slowly upward so a one-off early packet doesn't pin the offset forever
+            self.clock_offset += (offset - self.clock_offset) * 0.01
+
+        if self.snaps and t <= self.snaps[-1][0]:
+            # reordered/duplicate: slot it in by time, drop exact duplicates
+            if any(t == st for st, _ in self.snaps):
+                return
+            items = sorted(list(self.snaps) + [(t, s)], key=lambda e: e[0])
+            self.snaps.clear()
+            self.snaps.extend(items)
+        else:
+            self.snaps.append((t, s))
+
+    def _bracket(self, render_t):
+        """Return (a, b, alpha) with a/b snapshots and alpha in [0, 1+]."""
+        snaps = self.snaps
+        if len(snaps) == 1 or render_t <= snaps[0][0]:
+            self.depth = len(snaps)
+            return snaps[0][1], snaps[0][1], 0.0
+
+        newest_t = snaps[-1][0]
+        if render_t >= newest_t:
+            self.depth = 0
+            self.underruns += 1
+            ahead = render_t - newest_t
+            if ahead > MAX_EXTRAPOLATION:
+                self.starved += 1
+                ahead = MAX_EXTRAPOLATION
+            (ta, a), (tb, b) = snaps[-2], snaps[-1]
+            return a, b, 1.0 + ahead / (tb - ta)
+
+        for i in range(len(snaps) - 1, 0, -1):
+            ta, a = snaps[i - 1]
+            tb, b = snaps[i]
+            if ta <= render_t < tb:
+                self.depth = len(snaps) - i
+                return a, b, (render_t - ta) / (tb - ta)
+        return snaps[-1][1], snaps[-1][1], 0.0
+
+    def age(self, s: dict, now: float = None) -> float:
+        """Seconds since the server produced `s`, on top of the fastest delivery seen.
+
+        Without synced clocks the one-way latency itself is unknowable; this is
+        what comes on top of it: jitter, queueing, and the client's own delay
+        in reading and drawing the snapshot.
+        """
+        if self.clock_offset is None:
+            return 0.0
+        now = time.perf_counter() if now is None else now
+        return now - self.clock_offset - s.get("tick", 0) * self.tick_dt
+
+    def apply(self, s: dict, now: float = None):
+        """Overwrite the remote fighter and fireballs in `s` with interpolated values."""
+        if not self.snaps:
+            return s
+        now = time.perf_counter() if now is None else now
+        a, b, alpha = self._bracket(now - self.clock_offset - self.delay)
+
+        pa, pb = a[self.remote_key], b[self.remote_key]
+        p = dict(pb)
+        p["x"] = _lerp(pa["x"], pb["x"], alpha)
+        p["y"] = _lerp(pa["y"], pb["y"], alpha)
+        p["hitbox"] = _lerp_rect(pa.get("hitbox"), pb.get("hitbox"), alpha)
+        s[self.remote_key] = p
+        s["fireballs"] = _lerp_fireballs(a.get("fireballs", []), b.get("fireballs", []), alpha)
+        return s
+
+class SnapshotHandoff:
+    """Network thread -> render loop, without a lock or a deep copy.
+
+    A published snapshot is never modified again: decode() builds a new dict
+    for every packet, reconcile() and SnapshotBuffer only read them, and the
+    render loop draws from frame(), a shallow copy whose entries it replaces
+    rather than edits. So the network thread just swaps `latest` (one
+    reference store) and queues (snapshot, arrival time) for the render loop
+    to drain() into its SnapshotBuffer; deque append/popleft are atomic, so
+    neither side ever waits on the other.
+    """
+    def __init__(self, initial: dict = None, size: int = 64):
+        self.latest = initial
+        self.pending = deque(maxlen=size)   # past SnapshotBuffer's size they'd be dropped anyway
+
+    def publish(self, s: dict, now: float = None, latest: bool = True):
+        """Network side: hand over a freshly decoded snapshot (don't touch it afterwards).
+
+        latest=False for one older than the current latest (a reordered packet):
+        it only goes to the SnapshotBuffer.
+        """
+        self.pending.append((s, time.perf_counter() if now is None else now))
+        if latest:
+            self.latest = s
+
+    def drain(self):
+        """Render side: (snapshot, arrival time) pairs published since the last drain, oldest first."""
+        pending = self.pending
+        while pending:
+            yield pending.popleft()
+
+    def frame(self) -> dict:
+        """Render side: the newest snapshot as a dict the frame may replace entries in."""
+        return dict(self.latest)
@@ -0,0 +1,238 @@
+# loadgen.py
+"""Headless load test for server.py: thousands of scripted clients from one process.
+
+    python loadgen.py [--matches N] [--duration S] [--ramp S] [--host H] [--port P] [--decode] [--sim-rate N]
+
+Every match gets two clients in their own room. Each client joins, sends
+binary input packets at INPUT_RATE with button patterns held the way a
+player holds them, and consumes (and acks) the snapshots it gets back.
+Once a second it prints the server's step time percentiles and CPU (from
+a {"stats": 1} query), snapshot inter-arrival jitter and packet loss, and
+a summary at the end, so you can see how many matches a box holds before
+ticks slip. Snapshot headers are parsed for the tick only; --decode does
+the full client-side decode too (costs loadgen CPU). --sim-rate is the
+server's, for the expected snapshot interval. The server only answers the
+stats query from loopback or its --stats-allow list.
+"""
+import random
+import selectors
+import socket
+import sys
+import time
+from collections import deque
+from shared_protocol import (encode, decode, encode_inputs, pack_buttons, SnapshotReceiver,
+                             HEADER, SNAP_MAGIC, INPUT_HISTORY, INPUT_RATE)
+from game_sim import SIM_RATE, SIM_DT
+from histogram import Histogram
+
+SERVER_PORT = 5000
+JOIN_RETRY = 0.5        # s between join attempts until the first snapshot arrives
+STATS_EVERY = 1.0       # s between server stats queries / report lines
+MAX_PACKET = 8192
+ROOM_PREFIX = "load-"
+
+class Bot:
+    """One scripted player: holds a button pattern for a while, then picks another.
+
+    The mix is walking and jumping around with bursts of attacks, blocks and
+    the odd special, which keeps the server's combat paths busy like a real
+    fight does.
+    """
+    PATTERNS = (
+        ({"right": 1}, 0.6), ({"left": 1}, 0.6), ({}, 0.4), ({"jump": 1}, 0.15),
+        ({"right": 1, "jump": 1}, 0.3), ({"attack": 1}, 0.25), ({"right": 1, "attack": 1}, 0.3),
+        ({"block": 1}, 0.5), ({"special": 1}, 0.1), ({"left": 1, "attack": 1}, 0.3),
+    )
+    WEIGHTS = (12, 12, 10, 6, 6, 14, 8, 8, 3, 8)
+
+    def __init__(self, room: str, pid: int, rng: random.Random, decode_full: bool):
+        self.room, self.pid, self.rng = room, pid, rng
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.seq = 0
+        self.history = deque(maxlen=INPUT_HISTORY)
+        self.bits = 0
+        self.hold_until = 0.0
+        self.receiver = SnapshotReceiver() if decode_full else None
+        self.joined = False
+        self.last_join = -JOIN_RETRY
+        self.first_tick = self.last_tick = None
+        self.tick_step = None       # smallest tick gap seen = ticks per snapshot
+        self.received = 0
+        self.gap_ticks = 0          # ticks covered by lost snapshots
+        self.last_arrival = None
+
+    def next_bits(self, now: float) -> int:
+        if now >= self.hold_until:
+            buttons, hold = self.rng.choices(self.PATTERNS, self.WEIGHTS)[0]
+            self.bits = pack_buttons(buttons)
+            self.hold_until = now + hold * self.rng.uniform(0.5, 1.5)
+        return self.bits
+
+    def on_snapshot(self, data: bytes, now: float, interval_hist: Histogram, jitter_hist: Histogram):
+        if self.receiver is not None:
+            state = self.receiver.decode(data)
+            tick = self.receiver.last_tick if state else None
+        elif data[:1] == bytes((SNAP_MAGIC,)) and len(data) >= HEADER.size:
+            tick = HEADER.unpack_from(data, 0)[3]
+        else:
+            tick = decode(data).get("tick")
+        if tick is None:
+            return
+        self.joined = True
+        self.received += 1
+        if self.last_tick is not None and tick > self.last_tick:
+            gap = tick - self.last_tick
+            if self.tick_step is None or gap < self.tick_step:
+                self.tick_step = gap
+            self.gap_ticks += gap - self.tick_step
+            interval = (now - self.last_arrival) * 1000
+            interval_hist.add(interval)
+            jitter_hist.add(abs(interval - self.tick_step * SIM_DT * 1000))
+        if self.first_tick is None:
+            self.first_tick = tick
+        if self.last_tick is None or tick > self.last_tick:
+            self.last_tick = tick
+            self.last_arrival = now
+
+    @property
+    def lost(self) -> int:
+        return self.gap_ticks // self.tick_step if self.tick_step else 0
+
+def arg(name, default, cast=float):
+    if name in sys.argv:
+        return cast(sys.argv[sys.argv.index(name) + 1])
+    return default
+
+def main():
+    global SIM_DT
+    SIM_DT = 1.0 / arg("--sim-rate", SIM_RATE, int)
+    matches = arg("--matches", 50, int)
+    duration = arg("--duration", 30.0)
+    ramp = arg("--ramp", 5.0)
+    server = (arg("--host", "127.0.0.1", str), arg("--port", SERVER_PORT, int))
+    decode_full = "--decode" in sys.argv
+    try:
+        import resource     # two sockets per match; raise the fd limit if we can
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        want = min(hard, max(soft, 2 * matches + 64))
+        resource.setrlimit(resource.RLIMIT_NOFILE, (want, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+    rng = random.Random(1)
+    bots = []
+    selector = selectors.DefaultSelector()
+    for i in range(matches):
+        for pid in (1, 2):
+            bot = Bot(f"{ROOM_PREFIX}{i}", pid, random.Random(rng.getrandbits(32)), decode_full)
+            bots.append(bot)
+            selector.register(bot.sock, selectors.EVENT_READ, bot)
+    stats_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    stats_sock.setblocking(False)
+    selector.register(stats_sock, selectors.EVENT_READ, None)
+
+    interval_hist, jitter_hist = Histogram(), Histogram()
+    server_stats = None
+    stats_sock.sendto(encode({"stats": 1, "reset": 1}), server)
+
+    frame_dt = 1.0 / INPUT_RATE
+    start = time.perf_counter()
+    next_frame = start
+    next_stats = start + STATS_EVERY
+    cpu0 = time.process_time()
+    late_frames = 0
+    print(f"[LOADGEN] {matches} matches ({len(bots)} clients) -> {server[0]}:{server[1]} "
+          f"for {duration:.0f} s, ramp {ramp:.0f} s")
+    try:
+        while True:
+            now = time.perf_counter()
+            if now - start >= duration:
+                break
+            if now >= next_frame:
+                if now - next_frame > frame_dt:
+                    late_frames += 1
+                    next_frame = now
+                next_frame += frame_dt
+                started = len(bots) if ramp <= 0 else int(len(bots) * min(1.0, (now - start) / ramp))
+                for bot in bots[:started]:
+                    if not bot.joined and now - bot.last_join >= JOIN_RETRY:
+                        bot.last_join = now
+                        bot.sock.sendto(encode({"join": bot.pid, "room": bot.room}), server)
+                        continue
+                    if not bot.joined:
+                        continue
+                    bot.seq += 1
+                    bot.history.appendleft(bot.next_bits(now))
+                    try:
+                        bot.sock.sendto(encode_inputs(bot.pid, bot.seq, bot.history, bot.last_tick), server)
+                    except BlockingIOError:
+                        pass
+
+            if now >= next_stats:
+                next_stats += STATS_EVERY
+                stats_sock.sendto(encode({"stats": 1}), server)
+                report(bots, server_stats, interval_hist, jitter_hist, now - start)
+
+            timeout = max(0.0, min(next_frame, next_stats) - time.perf_counter())
+            for key, _ in selector.select(timeout):
+                sock, bot = key.fileobj, key.data
+                while True:
+                    try:
+                        data = sock.recv(MAX_PACKET)
+                    except (BlockingIOError, ConnectionRefusedError):
+                        break
+                    if bot is not None:
+                        bot.on_snapshot(data, time.perf_counter(), interval_hist, jitter_hist)
+                    else:
+                        server_stats = decode(data).get("stats", server_stats)
+    except KeyboardInterrupt:
+        pass
+
+    # One last query so the summary covers the whole run
+    stats_sock.sendto(encode({"stats": 1}), server)
+    deadline = time.perf_counter() + 0.5
+    while time.perf_counter() < deadline:
+        if selector.select(0.05):
+            try:
+                server_stats = decode(stats_sock.recv(MAX_PACKET)).get("stats", server_stats)
+                break
+            except BlockingIOError:
+                pass
+    elapsed = time.perf_counter() - start
+    print("[LOADGEN] ---- summary ----")
+    report(bots, server_stats, interval_hist, jitter_hist, elapsed, final=True)
+    print(f"[LOADGEN] loadgen cpu={(time.process_time() - cpu0) / elapsed * 100:.1f}% late_frames={late_frames} "
+          f"(if loadgen itself is saturated, its numbers overstate jitter and loss)")
+    for bot in bots:
+        bot.sock.close()
+    stats_sock.close()
+
+def report(bots, stats, interval_hist, jitter_hist, elapsed, final=False):
+    joined = sum(b.joined for b in bots)
+    received = sum(b.received for b in bots)
+    lost = sum(b.lost for b in bots)
+    loss = lost / (received + lost) * 100 if received + lost else 0.0
+    line = (f"[LOADGEN] t={elapsed:5.1f}s clients={joined}/{len(bots)} snapshots={received} "
+            f"loss={loss:.2f}% interval_ms p50={interval_hist.percentile(50):.2f} "
+            f"jitter_ms p50={jitter_hist.percentile(50):.2f} p99={jitter_hist.percentile(99):.2f} "
+            f"max={jitter_hist.max:.2f}")
+    if stats:
+        ticks = Histogram()
+        ticks.merge_wire(stats["tick_ms"])
+        per_match = stats["cpu"] / stats["active"] if stats["active"] else 0.0
+        line += (f" | server rooms={stats['active']}/{stats['rooms']} workers={stats['workers']} "
+                 f"step_ms p50={ticks.percentile(50):.3f} p99={ticks.percentile(99):.3f} max={ticks.max:.3f} "
+                 f"cpu={stats['cpu']:.1f}% cpu/match={per_match:.2f}% "
+                 f"overruns={stats['overruns']} dropped_steps={stats['dropped_steps']}")
+        if final:
+            budget = 1000 / stats.get("sim_rate", SIM_RATE)
+            slipping = stats["dropped_steps"] > 0 or ticks.percentile(99) > budget
+            line += f"\n[LOADGEN] step budget {budget:.2f} ms: " + (
+                "ticks are SLIPPING at this load" if slipping else "ticks keep up at this load")
+    else:
+        line += " | no stats reply from the server"
+    print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# match.py
+"""One fighting match on the dedicated server: world, inputs, clients and snapshot streams."""
+import os
+import time
+from collections import deque
+from shared_protocol import (SnapshotSender, InputBuffer, flatten_snapshot, pack_buttons, unpack_buttons,
+                             encode_snapshot, INPUT_BUTTONS)
+from game_sim import (World, initial_width, initial_height, reset_game, step_game, apply_inputs, update_world,
+                      resolve_hits, pack_state, state_values, held_inputs, SIM_RATE)
+import tracing
+from desync import DesyncDetector
+from matchlog import MatchRecorder, log_name, HASH_EVERY
+
+ROOM_IDLE_TIMEOUT = 30.0    # s a room with nobody sending may live before it is closed
+# Ticks between state hashes (the chain still covers every tick's inputs, and
+# a hash costs about a third of a step)
+STATE_HASH_INTERVAL = 4
+
+# Spectators get one shared keyframe stream instead of per-client deltas
+SPECTATOR_RATE = 20             # max spectator snapshots per second
+SPECTATOR_DELAY = 2.0           # s spectators see the fight behind the players
+SPECTATOR_TIMEOUT = 10.0        # s without a keepalive before a spectator is dropped
+SPECTATOR_SWEEP = 1.0           # s between sweeps for timed-out spectators
+MAX_SPECTATORS = 5000
+PLAYER_IDS = (1, 2)
+
+class Match:
+    """Everything that used to be module state in server.py, for one room.
+
+    The server owns the socket; a Match only consumes decoded packets for its
+    players and produces the snapshot bytes to send back to each of them.
+    """
+    def __init__(self, room_id: str, width: int = initial_width, height: int = initial_height,
+                 sim_rate: int = SIM_RATE, record_dir: str = None):
+        self.room_id = room_id
+        self.world = World(width, height)
+        self.tick = 0           # simulation steps so far
+        # Rolling state hash; World(seed=world.seed) fed the same inputs reproduces it
+        self.desync = DesyncDetector(tag=f"DESYNC {room_id}")
+        # Input log for replay.py (None unless the server records matches)
+        self.recorder = None
+        if record_dir:
+            started = time.time()
+            w = self.world
+            self.recorder = MatchRecorder(os.path.join(record_dir, log_name(room_id, w.seed, started)), {
+                "room": room_id, "started": round(started, 3), "seed": w.seed, "sim_rate": sim_rate,
+                "width": w.width, "height": w.height,
+                "p1_special": w.player1.typeofspecial, "p2_special": w.player2.typeofspecial,
+            })
+
+        # Last seen addresses (player 1 and 2)
+        self.addresses = {}
+        # Per-player delta snapshot stream (baseline ring + last acked tick)
+        self.senders = {}
+        # Latest inputs (buttons are 0/1)
+        self.inputs = {
+            1: {"left":0,"right":0,"jump":0,"attack":0,"block":0,"special":0},
+            2: {"left":0,"right":0,"jump":0,"attack":0,"block":0,"special":0},
+        }
+        # Sequenced input frames per player, drained once per tick
+        self.input_buffers = {1: InputBuffer(), 2: InputBuffer()}
+        # Steps run since the last pull_inputs(); after the first, jump/attack/special are released
+        self.frame_steps = 0
+        self.last_heard = 0.0
+        # Arrival time of the oldest input not yet seen by a tick (latency metric)
+        self.input_since = None
+        self.state = None
+        self.flat = None
+
+        # Spectator address -> last keepalive; encoded frames waiting out the delay
+        self.spectators = {}
+        self.spectator_frames = deque()
+        self.spectator_interval = max(1, round(sim_rate / SPECTATOR_RATE))
+        self.spectator_delay = round(SPECTATOR_DELAY * sim_rate)
+        self.last_spectator_tick = None
+        self.last_sweep = 0.0
+
+    @property
+    def active(self) -> bool:
+        return bool(self.addresses)
+
+    def join(self, pid: int, addr, now: float) -> bool:
+        """Take `addr` as player `pid`; False (ignored) unless pid is one of PLAYER_IDS."""
+        if pid not in PLAYER_IDS:
+            return False
+        self.addresses[pid] = addr
+        self.senders[pid] = SnapshotSender()
+        self.input_buffers[pid] = InputBuffer()
+        self.last_heard = now
+        return True
+
+    def spectate(self, addr, now: float) -> bool:
+        if addr not in self.spectators and len(self.spectators) >= MAX_SPECTATORS:
+            return False
+        self.spectators[addr] = now
+        return True
+
+    def leave(self, pid: int):
+        """Forget player `pid`'s address; their fighter stops holding whatever they last sent."""
+        self.addresses.pop(pid, None)
+        self.senders.pop(pid, None)
+        if pid in self.inputs:
+            self.inputs[pid] = dict.fromkeys(INPUT_BUTTONS, 0)
+            self.input_buffers[pid] = InputBuffer()
+
+    def add_inputs(self, pid: int, pkt: dict, now: float):
+        """Sequenced binary input packet (see decode_inputs) from player `pid`'s address.
+
+        pid comes from the server's routing table, never from the packet: a
+        client may only send for the player it joined as.
+        """
+        if pid not in self.input_buffers:
+            return
+        self.input_buffers[pid].add(pkt["seq"], pkt["frames"])
+        self.ack(pid, pkt["ack"])
+        self.heard(now)
+
+    def set_inputs(self, pid: int, inputs: dict, ack, now: float):
+        """Legacy JSON input message from player `pid`'s address: latest buttons only."""
+        if pid not in self.inputs:
+            return
+        self.inputs[pid] = {k: int(bool(inputs.get(k, 0))) for k in INPUT_BUTTONS}
+        self.ack(pid, ack)
+        self.heard(now)
+
+    def heard(self, now: float):
+        self.last_heard = now
+        if self.input_since is None:
+            self.input_since = now
+
+    def ack(self, pid: int, tick):
+        if tick is not None and pid in self.senders:
+            self.senders[pid].ack(int(tick))
+
+    def replay(self):
+        reset_game(self.world)
+        if self.recorder:
+            self.recorder.reset()
+
+    def pull_inputs(self, now: float):
+        """Take this tick's frame from each input buffer.
+
+        Returns how long the oldest input received since the last tick waited
+        to be simulated, or None if nothing arrived.
+        """
+        for pid, buf in self.input_buffers.items():
+            if buf.next_seq is not None:
+                self.inputs[pid] = unpack_buttons(buf.next_frame())
+        self.world.player1.input_seq = self.input_buffers[1].applied_seq
+        self.world.player2.input_seq = self.input_buffers[2].applied_seq
+        self.frame_steps = 0
+        waited, self.input_since = self.input_since, None
+        return None if waited is None else now - waited
+
+    def step(self, dt: float, times: dict = None):
+        """One simulation step. With `times`, seconds spent per phase are added to it
+        ("input", "update", "collisions", "hash"; see server.TICK_PHASES) and,
+        if tracing is on, recorded as spans on this room's track."""
+        inputs = self.inputs if self.frame_steps == 0 else {pid: held_inputs(i) for pid, i in self.inputs.items()}
+        self.frame_steps += 1
+        if self.recorder:
+            self.recorder.tick(pack_buttons(inputs[1]), pack_buttons(inputs[2]))
+        if times is None:
+            step_game(self.world, dt, inputs)
+        else:
+            t0 = time.perf_counter()
+            apply_inputs(self.world, inputs)
+            t1 = time.perf_counter()
+            update_world(self.world, dt)
+            t2 = time.perf_counter()
+            resolve_hits(self.world, dt)
+            t3 = time.perf_counter()
+            times["input"] += t1 - t0
+            times["update"] += t2 - t1
+            times["collisions"] += t3 - t2
+            tr = tracing.tracer
+            if tr:
+                tid = tr.track(self.room_id)
+                tr.add("step_game.apply_inputs", t0, t1, tid)
+                tr.add("step_game.update_world", t1, t2, tid)
+                tr.add("step_game.resolve_hits", t2, t3, tid)
+        self.tick += 1
+        if self.tick % STATE_HASH_INTERVAL == 0:
+            t0 = time.perf_counter()
+            h = self.desync.record(self.tick, state_values(self.world))
+            if self.recorder and self.tick % HASH_EVERY == 0:
+                self.recorder.state_hash(self.tick, h)
+            if times is not None:
+                t1 = time.perf_counter()
+                times["hash"] += t1 - t0
+                if tracing.tracer:
+                    tracing.tracer.add("state_hash", t0, t1, tracing.tracer.track(self.room_id))
+
+    def pack(self):
+        """Capture this tick's state for snapshots() and spectator_frame()."""
+        self.state = pack_state(self.world)
+        self.flat = flatten_snapshot(self.state)
+
+    def snapshots(self):
+        """Yield (addr, packet) for every connected player, delta against their last ack. Call pack() first."""
+        for pid, addr in list(self.addresses.items()):
+            yield addr, self.senders[pid].encode(self.state, self.tick, self.flat)
+
+    def spectator_frame(self, now: float):
+        """Encode the last snapshot for spectators (at most SPECTATOR_RATE per second).
+
+        Call after pack(). The packet is the same for every viewer, so it
+        is built once and returned only after SPECTATOR_DELAY; None when
+        nothing is due.
+        """
+        if now - self.last_sweep > SPECTATOR_SWEEP:
+            self.last_sweep = now
+            for addr, seen in list(self.spectators.items()):
+                if now - seen > SPECTATOR_TIMEOUT:
+                    del self.spectators[addr]
+        if not self.spectators:
+            self.spectator_frames.clear()
+            return None
+        if self.last_spectator_tick is None or self.tick - self.last_spectator_tick >= self.spectator_interval:
+            self.last_spectator_tick = self.tick
+            self.spectator_frames.append((self.tick, encode_snapshot(self.state, self.tick)))
+        if self.spectator_frames and self.spectator_frames[0][0] <= self.tick - self.spectator_delay:
+            return self.spectator_frames.popleft()[1]
+        return None
+
+    def idle(self, now: float) -> bool:
+        return now - self.last_heard > ROOM_IDLE_TIMEOUT
+
+    def close(self):
+        if self.recorder:
+            self.recorder.close()
@@ -0,0 +1,112 @@
+# matchlog.py
+"""Append-only match recordings: the seed plus both players' inputs, one run per change.
+
+Replaying a log through step_game() from World(seed=...) reproduces the
+fight exactly (see replay.py), so this is all a server needs to keep.
+
+Layout: MAGIC, a length-prefixed JSON header, then records:
+  RUN    (kind, p1 bits, p2 bits, ticks)  both players held these buttons this many ticks
+  RESET  (kind,)                          reset_game() ran before the next tick
+  HASH   (kind, tick, hash)               Match.desync's rolling hash after `tick`
+"""
+import json
+import re
+import struct
+import time
+
+MAGIC = b"FLOG"
+LOG_VERSION = 1
+LOG_SUFFIX = ".flog"
+HASH_EVERY = 60         # ticks between HASH records (must be a multiple of match.STATE_HASH_INTERVAL)
+FLUSH_EVERY = 300       # ticks between flushes to disk (a crash loses at most this much)
+
+HEADER_LEN = struct.Struct("<H")
+REC_KIND = struct.Struct("<B")
+REC_RUN = struct.Struct("<BBBH")
+REC_HASH = struct.Struct("<BII")
+KIND_RUN, KIND_RESET, KIND_HASH = 0, 1, 2
+MAX_RUN = 0xFFFF
+
+def log_name(room_id: str, seed: int, started: float) -> str:
+    room = re.sub(r"[^A-Za-z0-9_-]", "_", room_id)[:32]
+    return f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(started))}-{room}-{seed:08x}{LOG_SUFFIX}"
+
+class MatchRecorder:
+    """Writes one match's log; Match calls tick() once per step with the inputs it used."""
+    def __init__(self, path: str, header: dict):
+        self.path = path
+        self.file = open(path, "ab")
+        head = json.dumps(dict(header, version=LOG_VERSION), separators=(",", ":")).encode()
+        self.file.write(MAGIC + HEADER_LEN.pack(len(head)) + head)
+        self.file.flush()
+        self.bits = None        # (p1, p2) of the current run
+        self.run = 0
+        self.ticks = 0
+        self.bytes = self.file.tell()
+
+    def _write(self, data: bytes):
+        self.file.write(data)
+        self.bytes += len(data)
+
+    def _end_run(self):
+        if self.run:
+            self._write(REC_RUN.pack(KIND_RUN, self.bits[0], self.bits[1], self.run))
+            self.run = 0
+
+    def tick(self, p1_bits: int, p2_bits: int):
+        bits = (p1_bits, p2_bits)
+        if bits != self.bits or self.run == MAX_RUN:
+            self._end_run()
+            self.bits = bits
+        self.run += 1
+        self.ticks += 1
+        if self.ticks % FLUSH_EVERY == 0:
+            self._end_run()
+            self.file.flush()
+
+    def reset(self):
+        self._end_run()
+        self._write(REC_KIND.pack(KIND_RESET))
+
+    def state_hash(self, tick: int, h: int):
+        self._end_run()
+        self._write(REC_HASH.pack(KIND_HASH, tick & 0xFFFFFFFF, h))
+
+    def close(self):
+        if not self.file.closed:
+            self._end_run()
+            self.file.close()
+
+def read_log(path: str):
+    """(header dict, list of records); each record is a tuple starting with its kind.
+
+    A truncated last record (the server died mid-write) is ignored.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != MAGIC:
+        raise ValueError(f"{path}: not a match log")
+    (n,) = HEADER_LEN.unpack_from(data, 4)
+    header = json.loads(data[6:6 + n])
+    if header.get("version") != LOG_VERSION:
+        raise ValueError(f"{path}: log version {header.get('version')}, expected {LOG_VERSION}")
+    records = []
+    i, end = 6 + n, len(data)
+    while i < end:
+        kind = data[i]
+        if kind == KIND_RUN:
+            if i + REC_RUN.size > end:
+                break
+            records.append(REC_RUN.unpack_from(data, i))
+            i += REC_RUN.size
+        elif kind == KIND_RESET:
+            records.append((KIND_RESET,))
+            i += REC_KIND.size
+        elif kind == KIND_HASH:
+            if i + REC_HASH.size > end:
+                break
+            records.append(REC_HASH.unpack_from(data, i))
+            i += REC_HASH.size
+        else:
+            raise ValueError(f"{path}: bad record kind {kind} at byte {i}")
+    return header, records
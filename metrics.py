@@ -0,0 +1,224 @@
+# metrics.py
+"""In-process metrics registry (counters, gauges, histograms) and a tiny HTTP endpoint for it.
+
+Updating a metric is an attribute add or a Histogram.add(); nothing is
+formatted or sent until somebody scrapes, and gauges can be callbacks that
+only run then. The endpoint is served from the owner's selector loop (no
+thread), so an unscraped server pays nothing for it.
+
+    GET /metrics        Prometheus text format
+    GET /metrics.json   the same numbers as JSON
+"""
+import json
+import selectors
+import socket
+from histogram import Histogram
+
+SUMMARY_QUANTILES = (50, 90, 99)
+MAX_CONNECTIONS = 16        # open scrape connections; more are refused
+MAX_REQUEST = 8192          # bytes of request headers we'll buffer
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels):
+        self.name, self.help, self.labels = name, help, labels
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def read(self):
+        return self.value
+
+class Gauge:
+    """A settable value, or fn() evaluated at scrape time.
+
+    With `label`, fn returns {label value: number} (e.g. clients per room).
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, labels, fn=None, label=None):
+        self.name, self.help, self.labels = name, help, labels
+        self.fn, self.label = fn, label
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def read(self):
+        return self.fn() if self.fn else self.value
+
+class Summary:
+    """Registry entry for a Histogram; rendered as quantiles plus _sum and _count."""
+    kind = "summary"
+
+    def __init__(self, name, help, labels, hist):
+        self.name, self.help, self.labels = name, help, labels
+        self.hist = hist
+
+    def read(self):
+        return self.hist.summary(*SUMMARY_QUANTILES)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels: dict, extra: dict = None) -> str:
+    items = dict(labels, **(extra or {}))
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items.items()) + "}"
+
+class Registry:
+    """Named metrics in registration order. Same name + different labels = one metric family."""
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name: str, help: str = "", **labels) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str = "", fn=None, label: str = None, **labels) -> Gauge:
+        return self._add(Gauge(name, help, labels, fn, label))
+
+    def histogram(self, name: str, help: str = "", **labels) -> Histogram:
+        hist = Histogram()
+        self._add(Summary(name, help, labels, hist))
+        return hist
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def get(self, name: str, **labels):
+        for m in self.metrics:
+            if m.name == name and m.labels == labels:
+                return m.hist if m.kind == "summary" else m
+        raise KeyError(name)
+
+    def collect(self) -> dict:
+        """{name: value}; labelled metrics nest as {name: {label values: value}}."""
+        out = {}
+        for m in self.metrics:
+            value = m.read()
+            if m.kind == "gauge" and m.label:
+                value = dict(value)
+            if m.labels:
+                out.setdefault(m.name, {})[",".join(str(v) for v in m.labels.values())] = value
+            else:
+                out[m.name] = value
+        return out
+
+    def render_text(self) -> str:
+        lines = []
+        seen = set()
+        for m in self.metrics:
+            if m.name not in seen:
+                seen.add(m.name)
+                if m.help:
+                    lines.append(f"# HELP {m.name} {m.help}")
+                lines.append(f"# TYPE {m.name} {m.kind}")
+            if m.kind == "summary":
+                h = m.hist
+                for q in SUMMARY_QUANTILES:
+                    lines.append(f"{m.name}{_labels(m.labels, {'quantile': q / 100})} {h.percentile(q):.6g}")
+                lines.append(f"{m.name}_sum{_labels(m.labels)} {h.total:.6g}")
+                lines.append(f"{m.name}_count{_labels(m.labels)} {h.count}")
+            elif m.kind == "gauge" and m.label:
+                for key, v in m.read().items():
+                    lines.append(f"{m.name}{_labels(m.labels, {m.label: key})} {v:.6g}")
+            else:
+                lines.append(f"{m.name}{_labels(m.labels)} {m.read():.6g}")
+        return "\n".join(lines) + "\n"
+
+class MetricsEndpoint:
+    """Non-blocking HTTP server for a Registry, driven by the caller's selector.
+
+    Every socket it registers carries a callable as its selector data; the
+    owner's loop calls key.data(key.events) for those keys.
+    """
+    def __init__(self, registry: Registry, selector, port: int, host: str = "127.0.0.1"):
+        self.registry = registry
+        self.selector = selector
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(MAX_CONNECTIONS)
+        self.sock.setblocking(False)
+        self.address = self.sock.getsockname()
+        self.conns = {}         # socket -> [request bytes, response bytes or None]
+        self.routes = {}        # extra path -> (content type, fn() -> bytes)
+        self.scrapes = registry.counter("metrics_scrapes_total", "HTTP requests served by the metrics endpoint")
+        selector.register(self.sock, selectors.EVENT_READ, self._accept)
+
+    def add_route(self, path: str, content_type: str, fn):
+        """Serve fn()'s bytes at `path` (built in the loop when requested)."""
+        self.routes[path] = (content_type, fn)
+
+    def _accept(self, events):
+        try:
+            conn, _ = self.sock.accept()
+        except (BlockingIOError, OSError):
+            return
+        if len(self.conns) >= MAX_CONNECTIONS:
+            conn.close()
+            return
+        conn.setblocking(False)
+        self.conns[conn] = [b"", None]
+        self.selector.register(conn, selectors.EVENT_READ, lambda ev, c=conn: self._io(c, ev))
+
+    def _io(self, conn, events):
+        state = self.conns[conn]
+        try:
+            if state[1] is None:
+                data = conn.recv(4096)
+                if not data:
+                    return self._close(conn)
+                state[0] += data
+                if b"\r\n\r\n" not in state[0] and len(state[0]) < MAX_REQUEST:
+                    return
+                state[1] = self._response(state[0])
+                self.selector.modify(conn, selectors.EVENT_WRITE, lambda ev, c=conn: self._io(c, ev))
+            sent = conn.send(state[1])
+            state[1] = state[1][sent:]
+            if not state[1]:
+                self._close(conn)
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._close(conn)
+
+    def _response(self, request: bytes) -> bytes:
+        self.scrapes.inc()
+        parts = request.split(b"\r\n", 1)[0].split()
+        path = parts[1].decode("latin-1") if len(parts) > 1 else ""
+        path = path.split("?", 1)[0]
+        if path in ("/", "/metrics"):
+            status, ctype, body = "200 OK", "text/plain; version=0.0.4", self.registry.render_text().encode()
+        elif path == "/metrics.json":
+            status, ctype = "200 OK", "application/json"
+            body = json.dumps(self.registry.collect(), separators=(",", ":")).encode()
+        elif path in self.routes:
+            ctype, fn = self.routes[path]
+            status, body = "200 OK", fn()
+        else:
+            status, ctype, body = "404 Not Found", "text/plain", b"try /metrics or /metrics.json\n"
+        head = (f"HTTP/1.0 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n").encode()
+        return head + body
+
+    def _close(self, conn):
+        self.conns.pop(conn, None)
+        try:
+            self.selector.unregister(conn)
+        except (KeyError, ValueError):
+            pass
+        conn.close()
+
+    def close(self):
+        for conn in list(self.conns):
+            self._close(conn)
+        try:
+            self.selector.unregister(self.sock)
+        except (KeyError, ValueError):
+            pass
+        self.sock.close()
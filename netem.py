@@ -0,0 +1,341 @@
+# netem.py
+"""UDP proxy that makes a local network bad on purpose: delay, jitter, loss, duplication, reordering, bandwidth.
+
+    python netem.py [--profile NAME|FILE.json] [--listen PORT] [--server HOST:PORT] [--seed N]
+                    [--script FILE.json] [--duration S]
+
+Point clients at the proxy instead of the server (client.py and
+spectate_client.py take host:port at the IP prompt, loadgen.py has
+--port). Each client address gets its own upstream socket, so the server
+still sees one address per player and its replies find their way back.
+Works the same for server.py and the in-game OnlineServer; nothing needs
+root, unlike tc netem. For rollback_client.py peers, run one proxy in front
+of each peer and give each the other's proxy as its peer address.
+
+A profile is a dict of link settings, applied to both directions unless
+"up" (client -> server) or "down" (server -> client) override them:
+
+    delay_ms     one-way base delay
+    jitter_ms    std deviation added to the delay (packets stay in order
+                 unless they are picked for reordering)
+    loss         % of packets dropped; with loss_burst > 1 losses come in
+                 bursts of that mean length (Gilbert model), same average
+    dup          % of packets delivered twice
+    reorder      % of packets sent straight away, overtaking the queue
+    rate_kbps    bandwidth cap (0 = none); packets queue behind each other
+    queue_ms     tail-drop packets that would wait longer than this behind
+                 the rate cap
+
+--script runs a timeline, e.g. [[0, "wifi"], [10, "bad"], [20, {"loss": 30}]]
+(seconds from start, profile name or dict). From Python (tests, tools):
+
+    proxy = NetemProxy(5100, ("127.0.0.1", 5000), "mobile", seed=1)
+    proxy.start()                   # background thread; or call poll() yourself
+    ...
+    proxy.set_profile("bad")
+    proxy.stop(); print(proxy.stats())
+
+With the same seed and the same packet arrivals, the same packets are
+dropped, duplicated and reordered.
+"""
+import heapq
+import json
+import random
+import selectors
+import socket
+import sys
+import threading
+import time
+from histogram import Histogram
+
+LISTEN_PORT = 5100
+SERVER_ADDR = ("127.0.0.1", 5000)
+MAX_PACKET = 65535
+CLIENT_IDLE_TIMEOUT = 30.0  # s without traffic before a client's upstream socket is closed
+REPORT_EVERY = 5.0          # s between stats lines
+
+# One-way settings; "up" / "down" keys override per direction
+PROFILES = {
+    "none": {},
+    "lan": {"delay_ms": 1, "jitter_ms": 0.3},
+    "broadband": {"delay_ms": 15, "jitter_ms": 2, "loss": 0.1},
+    "transatlantic": {"delay_ms": 45, "jitter_ms": 2, "loss": 0.2},
+    "wifi": {"delay_ms": 8, "jitter_ms": 6, "loss": 1, "loss_burst": 2, "reorder": 0.5},
+    "mobile": {"delay_ms": 50, "jitter_ms": 20, "loss": 2, "loss_burst": 3, "reorder": 1,
+               "up": {"rate_kbps": 500}, "down": {"rate_kbps": 2000}},
+    "bad": {"delay_ms": 120, "jitter_ms": 40, "loss": 5, "loss_burst": 4, "dup": 1, "reorder": 2,
+            "rate_kbps": 256},
+}
+LINK_DEFAULTS = {"delay_ms": 0.0, "jitter_ms": 0.0, "loss": 0.0, "loss_burst": 1.0, "dup": 0.0, "reorder": 0.0,
+                 "rate_kbps": 0.0, "queue_ms": 200.0}
+
+def load_profile(profile) -> dict:
+    """A PROFILES name, a path to a JSON file, or a dict -> profile dict."""
+    if isinstance(profile, dict):
+        return profile
+    if profile in PROFILES:
+        return PROFILES[profile]
+    try:
+        with open(profile) as f:
+            return json.load(f)
+    except OSError:
+        raise ValueError(f"unknown profile {profile!r} (known: {', '.join(PROFILES)})") from None
+
+def link_settings(profile, direction: str) -> dict:
+    """Settings for one direction ("up" or "down") with defaults filled in."""
+    profile = load_profile(profile)
+    out = dict(LINK_DEFAULTS)
+    out.update({k: v for k, v in profile.items() if k not in ("up", "down")})
+    out.update(profile.get(direction, {}))
+    unknown = set(out) - set(LINK_DEFAULTS)
+    if unknown:
+        raise ValueError(f"unknown link settings: {', '.join(sorted(unknown))}")
+    return out
+
+class Link:
+    """One direction of the proxy: decides when (and whether) each packet is delivered."""
+    def __init__(self, name: str, settings: dict, rng: random.Random):
+        self.name = name
+        self.rng = rng
+        self.configure(settings)
+        self.bad = False            # Gilbert model state: in a loss burst
+        self.last_release = 0.0     # in-order packets never leave before this
+        self.busy_until = 0.0       # rate cap: when the link finishes serialising the queue
+
+        # Metrics
+        self.packets = 0
+        self.bytes = 0
+        self.lost = 0
+        self.duplicated = 0
+        self.reordered = 0
+        self.queue_drops = 0
+        self.delay_hist = Histogram()   # ms actually added per delivered packet
+
+    def configure(self, settings: dict):
+        self.settings = settings
+        self.delay = settings["delay_ms"] / 1000
+        self.jitter = settings["jitter_ms"] / 1000
+        self.loss = settings["loss"] / 100
+        self.dup = settings["dup"] / 100
+        self.reorder = settings["reorder"] / 100
+        self.rate = settings["rate_kbps"] * 1000 / 8     # bytes/s
+        self.queue_max = settings["queue_ms"] / 1000
+        # Gilbert model: stay in a burst with 1 - 1/burst, enter one so the average loss is still `loss`
+        burst = max(1.0, settings["loss_burst"])
+        self.p_exit_burst = 1 / burst
+        self.p_enter_burst = self.loss / (burst * (1 - self.loss)) if self.loss < 1 else 1.0
+
+    def _dropped(self) -> bool:
+        if not self.loss:
+            return False
+        if self.bad:
+            self.bad = self.rng.random() >= self.p_exit_burst
+        else:
+            self.bad = self.rng.random() < self.p_enter_burst
+        return self.bad
+
+    def schedule(self, size: int, now: float) -> list:
+        """Release times for a packet arriving now: [] if lost, two if duplicated."""
+        self.packets += 1
+        self.bytes += size
+        if self._dropped():
+            self.lost += 1
+            return []
+        copies = 2 if self.dup and self.rng.random() < self.dup else 1
+        self.duplicated += copies - 1
+        out = []
+        for _ in range(copies):
+            start = now
+            if self.rate:
+                start = max(now, self.busy_until)
+                if start - now > self.queue_max:
+                    self.queue_drops += 1
+                    continue
+                self.busy_until = start + size / self.rate
+                start = self.busy_until
+            if self.reorder and self.rng.random() < self.reorder:
+                self.reordered += 1
+                release = start     # skips the delay line, so it overtakes what's queued there
+            else:
+                delay = self.delay + (self.rng.gauss(0.0, self.jitter) if self.jitter else 0.0)
+                release = max(start + max(0.0, delay), self.last_release)
+                self.last_release = release
+            self.delay_hist.add((release - now) * 1000)
+            out.append(release)
+        return out
+
+    def stats(self) -> dict:
+        return {"packets": self.packets, "bytes": self.bytes, "lost": self.lost, "duplicated": self.duplicated,
+                "reordered": self.reordered, "queue_drops": self.queue_drops,
+                "delay_ms": self.delay_hist.summary()}
+
+class NetemProxy:
+    """The proxy. Drive it with poll() from your own loop, or start() it on a thread."""
+    def __init__(self, listen_port: int = LISTEN_PORT, server=SERVER_ADDR, profile="none", seed: int = None,
+                 host: str = "0.0.0.0"):
+        self.server = (socket.gethostbyname(server[0]), server[1])
+        self.rng = random.Random(seed)
+        self.up = Link("up", link_settings(profile, "up"), self.rng)
+        self.down = Link("down", link_settings(profile, "down"), self.rng)
+        self.profile = profile
+        self.selector = selectors.DefaultSelector()
+        self.front = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.front.bind((host, listen_port))
+        self.front.setblocking(False)
+        self.address = self.front.getsockname()
+        self.selector.register(self.front, selectors.EVENT_READ, None)
+        self.upstream = {}          # client address -> [socket, last seen]
+        self.queue = []             # heap of (release time, seq, packet, socket, destination)
+        self.seq = 0
+        self.thread = None
+        self.running = False
+
+    def set_profile(self, profile):
+        """Switch both directions to a new profile; packets already queued keep their release times."""
+        self.up.configure(link_settings(profile, "up"))
+        self.down.configure(link_settings(profile, "down"))
+        self.profile = profile
+
+    def _queue(self, link: Link, packet: bytes, sock, dest, now: float):
+        for release in link.schedule(len(packet), now):
+            self.seq += 1
+            heapq.heappush(self.queue, (release, self.seq, packet, sock, dest))
+
+    def _upstream(self, client, now: float):
+        entry = self.upstream.get(client)
+        if entry is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(("0.0.0.0", 0))
+            sock.setblocking(False)
+            self.selector.register(sock, selectors.EVENT_READ, client)
+            entry = self.upstream[client] = [sock, now]
+        entry[1] = now
+        return entry[0]
+
+    def _receive(self, key, now: float):
+        sock, client = key.fileobj, key.data
+        while True:
+            try:
+                packet, addr = sock.recvfrom(MAX_PACKET)
+            except (BlockingIOError, ConnectionRefusedError):
+                return
+            except OSError:
+                return
+            if client is None:          # front socket: client -> server
+                self._queue(self.up, packet, self._upstream(addr, now), self.server, now)
+            elif addr == self.server:   # an upstream socket: server -> its client
+                self._queue(self.down, packet, self.front, client, now)
+
+    def _release(self, now: float):
+        while self.queue and self.queue[0][0] <= now:
+            _, _, packet, sock, dest = heapq.heappop(self.queue)
+            try:
+                sock.sendto(packet, dest)
+            except OSError:
+                pass    # full buffer / unreachable: the packet is lost, like on a real link
+
+    def _close_idle(self, now: float):
+        for client, (sock, seen) in list(self.upstream.items()):
+            if now - seen > CLIENT_IDLE_TIMEOUT:
+                self.selector.unregister(sock)
+                sock.close()
+                del self.upstream[client]
+
+    def poll(self, timeout: float = 0.0):
+        """Receive what's waiting, release what's due; waits at most `timeout` (less if a packet is due)."""
+        now = time.perf_counter()
+        if self.queue:
+            timeout = min(timeout, max(0.0, self.queue[0][0] - now))
+        for key, _ in self.selector.select(timeout):
+            self._receive(key, time.perf_counter())
+        self._release(time.perf_counter())
+
+    def run(self, duration: float = None, script=None, report_every: float = REPORT_EVERY):
+        """Loop until stop() (or `duration` s). `script` is [[seconds, profile], ...]."""
+        start = time.perf_counter()
+        steps = sorted(script or [], key=lambda s: s[0])
+        next_report = start + report_every if report_every else None
+        next_idle = start + CLIENT_IDLE_TIMEOUT
+        self.running = True
+        while self.running:
+            now = time.perf_counter()
+            if duration is not None and now - start >= duration:
+                break
+            while steps and now - start >= steps[0][0]:
+                self.set_profile(steps.pop(0)[1])
+                print(f"[NETEM] t={now - start:.1f}s profile -> {self.profile_name}")
+            if next_report and now >= next_report:
+                next_report += report_every
+                print(self.report_line(now - start))
+            if now >= next_idle:
+                next_idle = now + CLIENT_IDLE_TIMEOUT
+                self._close_idle(now)
+            self.poll(0.01)
+
+    def start(self, **kwargs):
+        self.thread = threading.Thread(target=self.run, kwargs=dict(report_every=0, **kwargs), daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        self.stop()
+        for sock, _ in self.upstream.values():
+            sock.close()
+        self.upstream.clear()
+        self.front.close()
+        self.selector.close()
+
+    @property
+    def profile_name(self) -> str:
+        return self.profile if isinstance(self.profile, str) else json.dumps(self.profile)
+
+    def stats(self) -> dict:
+        return {"profile": self.profile_name, "clients": len(self.upstream), "queued": len(self.queue),
+                "up": self.up.stats(), "down": self.down.stats()}
+
+    def report_line(self, elapsed: float) -> str:
+        parts = [f"[NETEM] t={elapsed:5.1f}s clients={len(self.upstream)} queued={len(self.queue)}"]
+        for link in (self.up, self.down):
+            n = link.packets or 1
+            parts.append(f"{link.name}: pkts={link.packets} lost={link.lost / n * 100:.1f}% "
+                         f"dup={link.duplicated} reord={link.reordered} qdrop={link.queue_drops} "
+                         f"delay_ms p50={link.delay_hist.percentile(50):.1f} p99={link.delay_hist.percentile(99):.1f}")
+        return " | ".join(parts)
+
+def arg(name, default, cast=str):
+    if name in sys.argv:
+        return cast(sys.argv[sys.argv.index(name) + 1])
+    return default
+
+def main():
+    profile = arg("--profile", "none")
+    host, _, port = arg("--server", f"{SERVER_ADDR[0]}:{SERVER_ADDR[1]}").rpartition(":")
+    seed = arg("--seed", None, int)
+    script = None
+    if "--script" in sys.argv:
+        with open(arg("--script", None)) as f:
+            script = json.load(f)
+    try:
+        proxy = NetemProxy(arg("--listen", LISTEN_PORT, int), (host or "127.0.0.1", int(port)), profile, seed)
+    except ValueError as e:
+        sys.exit(f"[NETEM] {e}")
+    print(f"[NETEM] {proxy.address[0]}:{proxy.address[1]} -> {proxy.server[0]}:{proxy.server[1]} "
+          f"profile {proxy.profile_name}")
+    for link in (proxy.up, proxy.down):
+        print(f"[NETEM]   {link.name}: " + " ".join(f"{k}={v:g}" for k, v in link.settings.items()))
+    try:
+        proxy.run(arg("--duration", None, float), script)
+    except KeyboardInterrupt:
+        pass
+    print("[NETEM] ---- summary ----")
+    print(json.dumps(proxy.stats(), indent=1))
+    proxy.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# prediction.py
+"""Client-side prediction and server reconciliation for the local fighter."""
+import math
+import time
+from collections import deque
+from game_sim import World, held_inputs, SIM_RATE
+from shared_protocol import INPUT_RATE
+
+MAX_PENDING = 120           # unacked frames kept for replay (~2 s)
+SNAP_TOLERANCE = 1.0        # px of disagreement accepted before rewinding
+SMOOTH_TIME = 0.1           # s for a correction to visually blend out
+
+class LocalPredictor:
+    """Runs NetPlayer movement for our own fighter ahead of the server.
+
+    apply_input() steps the local copy with every input frame we send. When a
+    snapshot acks input frame N, reconcile() compares the server's position
+    with what we predicted after N; on a mismatch it rewinds to the server
+    state, replays the unacked frames and blends the jump out over SMOOTH_TIME.
+    """
+    def __init__(self, player_id: int, sim_rate: int = SIM_RATE):
+        self.player_id = player_id
+        self.steps = sim_rate // INPUT_RATE        # server steps one input frame covers
+        self.dt = 1.0 / sim_rate
+        self.key = "p1" if player_id == 1 else "p2"
+        self.world = World()
+        self.me = self.world.player1 if player_id == 1 else self.world.player2
+        self.pending = deque(maxlen=MAX_PENDING)   # (seq, inputs, x, y) after applying
+
+        self.last_ack = None
+        self.offset = (0.0, 0.0, 0.0)              # (dx, dy, time) visual correction
+        self.published = (self.me.rect.x, self.me.rect.y, self.offset)
+
+        # Metrics
+        self.last_error = 0.0
+        self.avg_error = 0.0
+        self.corrections = 0
+
+    def _step(self, inputs: dict):
+        self.me.set_inputs(inputs)
+        for i in range(self.steps):
+            if i == 1:
+                self.me.set_inputs(held_inputs(inputs))
+            self.me.update(self.dt, self.world.width, self.world.height)
+        # Our own fireballs come back in the snapshot; don't simulate them here
+        for f in list(self.world.fireballs):
+            f.kill()
+
+    def _load(self, p: dict):
+        me = self.me
+        me.rect.x, me.rect.y = p["x"], p["y"]
+        me.carry_x = me.carry_y = 0.0     # the server's sub-pixel remainder isn't in snapshots
+        me.gravity = p["vy"]
+        me.jump_count = p["jumps"]
+        me.knockback_velocity = p["knock"]
+        me.facing = p["facing"]
+        me.health = p["hp"]
+        me.special_attack = p["special"]
+        me.block_stamina = p["block"]
+        me.blocking = p["blocking"]
+        me.stunned = p["stunned"]
+        if me.stunned:
+            me.stun_timer = max(me.stun_timer, self.dt)
+
+    def _current_offset(self, now: float):
+        dx, dy, t = self.offset
+        k = math.exp(-(now - t) / SMOOTH_TIME)
+        return dx * k, dy * k
+
+    def _publish(self):
+        self.published = (self.me.rect.x, self.me.rect.y, self.offset)
+
+    def apply_input(self, seq: int, inputs: dict):
+        """Predict one input frame (call right after sending it)."""
+        self._step(inputs)
+        self.pending.append((seq, dict(inputs), self.me.rect.x, self.me.rect.y))
+        self._publish()
+
+    def reconcile(self, s: dict):
+        """Check the prediction against an authoritative snapshot."""
+        p = s[self.key]
+        ack = p["inputSeq"]
+        if self.last_ack is not None and ack <= self.last_ack:
+            return    # no new input frame applied on the server since the last check
+        first_sync = self.last_ack is None
+        self.last_ack = ack
+        self.world.width, self.world.height = s["width"], s["height"]
+        self.world.ko_triggered = s["ko"]
+
+        predicted = None
+        while self.pending and self.pending[0][0] <= ack:
+            entry = self.pending.popleft()
+            if entry[0] == ack:
+                predicted = entry
+
+        if predicted is not None:
+            error = math.hypot(predicted[2] - p["x"], predicted[3] - p["y"])
+            self.last_error = error
+            self.avg_error += (error - self.avg_error) * 0.05
+            if error <= SNAP_TOLERANCE:
+                return
+
+        # Rewind to the server's state and replay what it hasn't seen yet
+        now = time.perf_counter()
+        old_dx, old_dy = self._current_offset(now)
+        old_x, old_y = self.me.rect.x + old_dx, self.me.rect.y + old_dy
+
+        self._load(p)
+        replayed = deque(maxlen=MAX_PENDING)
+        for seq, inputs, _, _ in self.pending:
+            self._step(inputs)
+            replayed.append((seq, inputs, self.me.rect.x, self.me.rect.y))
+        self.pending = replayed
+
+        if first_sync:
+            self.offset = (0.0, 0.0, now)
+        else:
+            self.offset = (old_x - self.me.rect.x, old_y - self.me.rect.y, now)
+            self.corrections += 1
+        self._publish()
+
+    def render_pos(self, now: float = None):
+        """Predicted (x, y) to draw this frame, with the correction smoothed out."""
+        x, y, (dx, dy, t) = self.published
+        k = math.exp(-((now or time.perf_counter()) - t) / SMOOTH_TIME)
+        return x + dx * k, y + dy * k
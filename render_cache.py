@@ -0,0 +1,80 @@
+# render_cache.py
+"""LRU cache of pygame render resources: fonts, pre-rendered text, shield ellipses, mirrored sprite frames.
+
+pg.font.SysFont() searches the system font list every call, and a fresh
+SRCALPHA surface or transform.flip() is an allocation plus a full redraw,
+so drawing code asks the cache instead and a steady-state frame allocates
+nothing. Entries are keyed by (kind, params...); anything sized from the
+window goes stale on VIDEORESIZE, so the loop calls invalidate() then.
+
+    from render_cache import resources
+    text = resources.text("KO", "Arial", int(0.18 * h), (255, 255, 255), bold=True)
+    img = resources.flipped(frame) if facing_left else frame
+"""
+from collections import OrderedDict
+import pygame as pg
+
+RENDER_CACHE_SIZE = 512     # entries; mirrored frames for every character's animations fit comfortably
+
+class RenderCache:
+    """(kind, *params) -> resource, least recently used evicted first."""
+    def __init__(self, capacity: int = RENDER_CACHE_SIZE):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple, build):
+        """Cached value for `key`, calling build() to make it on a miss."""
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            value = self.entries[key] = build()
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            return value
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def invalidate(self, kind: str = None):
+        """Drop every entry (window resized), or only those of one kind."""
+        if kind is None:
+            self.entries.clear()
+        else:
+            for key in [k for k in self.entries if k[0] == kind]:
+                del self.entries[key]
+
+    def font(self, name: str, size: int, bold: bool = False) -> pg.font.Font:
+        return self.get(("font", name, size, bold), lambda: pg.font.SysFont(name, size, bold=bold))
+
+    def text(self, text: str, name: str, size: int, color, bold: bool = False) -> pg.Surface:
+        """Rendered (antialiased) text; for strings that repeat from frame to frame, not counters."""
+        return self.get(("text", text, name, size, tuple(color), bold),
+                        lambda: self.font(name, size, bold).render(text, True, color))
+
+    def ellipse(self, w: int, h: int, color) -> pg.Surface:
+        """A w x h SRCALPHA surface holding a filled ellipse (block shields)."""
+        def build():
+            surf = pg.Surface((w, h), pg.SRCALPHA)
+            pg.draw.ellipse(surf, color, surf.get_rect())
+            return surf
+        return self.get(("ellipse", w, h, tuple(color)), build)
+
+    def flipped(self, img: pg.Surface) -> pg.Surface:
+        """img mirrored horizontally, keyed by identity: meant for long-lived frames (loaded animations).
+
+        The entry holds on to img itself, so its id can't be reused by another surface while cached.
+        """
+        return self.get(("flip", id(img)), lambda: (img, pg.transform.flip(img, True, False)))[1]
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+# Shared by client_render and the online client in the game script
+resources = RenderCache()
@@ -0,0 +1,118 @@
+# replay.py
+"""Replay recorded matches (matchlog.py) headless, as fast as step_game allows.
+
+    python replay.py [--no-verify] [--quiet] LOG_OR_DIR [...]
+
+Each log is re-simulated from its seed with no sleeping or rendering; the
+final state and ticks/sec are printed. Unless --no-verify is given, the
+rolling state hash is recomputed the way Match does and checked against
+the HASH records, so a replay that no longer matches production (a
+simulation change, a platform difference) names the second it split in.
+Exits with status 1 if any log failed to verify.
+"""
+import os
+import sys
+import time
+from game_sim import World, step_game, reset_game, state_values, state_hash
+from shared_protocol import unpack_buttons
+from match import STATE_HASH_INTERVAL
+from matchlog import read_log, LOG_SUFFIX, KIND_RUN, KIND_RESET, KIND_HASH
+
+def replay_log(path: str, verify: bool = True) -> dict:
+    """Re-simulate one log; returns the final world plus tick count and verification result."""
+    header, records = read_log(path)
+    world = World(header["width"], header["height"], header["p1_special"], header["p2_special"],
+                  seed=header["seed"])
+    dt = 1.0 / header["sim_rate"]
+    tick = 0
+    chain = 0
+    checked = 0
+    mismatch = None     # first (tick, recorded hash, replayed hash) that differed
+    for rec in records:
+        kind = rec[0]
+        if kind == KIND_RUN:
+            # The players keep their buttons between steps, so only the first tick of a run sets them
+            step_game(world, dt, {1: unpack_buttons(rec[1]), 2: unpack_buttons(rec[2])})
+            tick += 1
+            if not verify:
+                for _ in range(rec[3] - 1):
+                    step_game(world, dt)
+                tick += rec[3] - 1
+                continue
+            if tick % STATE_HASH_INTERVAL == 0:
+                chain = state_hash(state_values(world), chain)
+            for _ in range(rec[3] - 1):
+                step_game(world, dt)
+                tick += 1
+                if tick % STATE_HASH_INTERVAL == 0:
+                    chain = state_hash(state_values(world), chain)
+        elif kind == KIND_RESET:
+            reset_game(world)
+        elif kind == KIND_HASH and verify and mismatch is None:
+            checked += 1
+            if rec[1] != tick or rec[2] != chain:
+                mismatch = (rec[1], rec[2], chain if rec[1] == tick else None)
+    return {"header": header, "world": world, "ticks": tick, "checked": checked, "mismatch": mismatch}
+
+def describe(result: dict) -> str:
+    w = result["world"]
+    p1, p2 = w.player1, w.player2
+    if p1.health <= 0 < p2.health:
+        outcome = "P2 wins"
+    elif p2.health <= 0 < p1.health:
+        outcome = "P1 wins"
+    else:
+        outcome = "no KO"
+    return (f"ticks={result['ticks']} {outcome} hp={p1.health:.0f}/{p2.health:.0f} "
+            f"pos=({p1.rect.x},{p1.rect.y})/({p2.rect.x},{p2.rect.y}) "
+            f"state_hash={state_hash(state_values(w)):08x}")
+
+def log_paths(args):
+    for a in args:
+        if os.path.isdir(a):
+            for name in sorted(os.listdir(a)):
+                if name.endswith(LOG_SUFFIX):
+                    yield os.path.join(a, name)
+        else:
+            yield a
+
+def main(argv):
+    verify = "--no-verify" not in argv
+    quiet = "--quiet" in argv
+    paths = list(log_paths(a for a in argv if not a.startswith("--")))
+    if not paths:
+        print(__doc__)
+        return 2
+
+    failed = 0
+    total_ticks = 0
+    t_all = time.perf_counter()
+    for path in paths:
+        t0 = time.perf_counter()
+        try:
+            result = replay_log(path, verify)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[REPLAY] {e}")
+            failed += 1
+            continue
+        elapsed = time.perf_counter() - t0
+        total_ticks += result["ticks"]
+        mismatch = result["mismatch"]
+        if mismatch:
+            failed += 1
+            tick, recorded, replayed = mismatch
+            got = f"{replayed:08x}" if replayed is not None else "(tick count differs)"
+            print(f"[REPLAY] {path}: DESYNC by tick {tick}: recorded {recorded:08x} replayed {got}")
+        if not quiet or mismatch:
+            check = f"verified {result['checked']} hashes" if verify else "not verified"
+            print(f"[REPLAY] {os.path.basename(path)}: {describe(result)} {check} "
+                  f"{result['ticks'] / max(elapsed, 1e-9):,.0f} ticks/s")
+
+    elapsed = time.perf_counter() - t_all
+    print(f"[REPLAY] {len(paths)} logs, {total_ticks} ticks in {elapsed:.2f} s: "
+          f"{total_ticks / max(elapsed, 1e-9):,.0f} ticks/s, {len(paths) / max(elapsed, 1e-9) * 60:,.0f} matches/min, "
+          f"{failed} failed")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,134 @@
+# rollback.py
+"""GGPO-style rollback session: both peers run step_game and exchange only inputs."""
+from game_sim import World, step_game, state_values
+from shared_protocol import unpack_buttons, INPUT_HISTORY
+from desync import DesyncDetector
+
+ROLLBACK_DT = 1.0 / 60.0
+INPUT_DELAY = 2         # frames our own input is scheduled ahead (hides small RTTs)
+MAX_ROLLBACK = 8        # frames we may run ahead of the last confirmed remote input
+
+class RollbackSession:
+    """Fixed-step lockstep-with-prediction over one World.
+
+    Every frame we save the world, simulate it with our input and the remote
+    input (confirmed, or predicted by repeating the last confirmed one), and
+    move on. When a remote input arrives for a frame we already simulated with
+    a different prediction, the next advance() restores the saved state of that
+    frame and re-simulates up to the present. We stall instead of advancing when
+    more than max_rollback frames would be unconfirmed.
+
+    Once a frame was simulated with confirmed inputs on both sides it can't
+    change any more, and its state is hashed into `desync` for comparison
+    with the peer's.
+    """
+    def __init__(self, world: World, local_pid: int, input_delay: int = INPUT_DELAY,
+                 max_rollback: int = MAX_ROLLBACK, dt: float = ROLLBACK_DT):
+        self.world = world
+        self.local_pid = local_pid
+        self.remote_pid = 2 if local_pid == 1 else 1
+        self.input_delay = input_delay
+        self.max_rollback = max_rollback
+        self.dt = dt
+
+        self.frame = 0              # next frame to simulate
+        self.local_inputs = {}      # frame -> button bits
+        self.remote_inputs = {}     # frame -> confirmed button bits
+        self.used_remote = {}       # frame -> remote bits we simulated it with
+        self.saved = {}             # frame -> world state before that frame
+        self.values = {}            # frame -> state_values() after that frame
+        self.last_confirmed = -1    # every remote frame up to here has arrived
+        self.rollback_from = None
+        self.desync = DesyncDetector()
+
+        # Nobody can have input for the first input_delay frames
+        for f in range(input_delay):
+            self.local_inputs[f] = 0
+            self.remote_inputs[f] = 0
+        self.last_confirmed = input_delay - 1
+
+        # Stats
+        self.rollbacks = 0
+        self.resimulated = 0
+        self.max_depth = 0
+        self.stalls = 0
+
+    def add_local_input(self, bits: int) -> int:
+        """Schedule this frame's local buttons; returns the frame they apply to."""
+        f = self.frame + self.input_delay
+        self.local_inputs.setdefault(f, bits)
+        return f
+
+    def local_history(self, newest: int):
+        """Newest-first local frames ending at `newest`, for encode_inputs()."""
+        frames = []
+        for f in range(newest, newest - INPUT_HISTORY, -1):
+            if f not in self.local_inputs:
+                break
+            frames.append(self.local_inputs[f])
+        return frames
+
+    def add_remote_input(self, frame: int, bits: int):
+        if frame in self.remote_inputs or frame <= self.frame - self.max_rollback - INPUT_HISTORY:
+            return
+        self.remote_inputs[frame] = bits
+        while self.last_confirmed + 1 in self.remote_inputs:
+            self.last_confirmed += 1
+        if frame < self.frame and self.used_remote.get(frame) != bits:
+            if self.rollback_from is None or frame < self.rollback_from:
+                self.rollback_from = frame
+
+    def _remote_for(self, f: int) -> int:
+        if f in self.remote_inputs:
+            return self.remote_inputs[f]
+        return self.remote_inputs.get(self.last_confirmed, 0)
+
+    def _simulate(self, f: int):
+        self.saved[f] = self.world.save_state()
+        remote = self._remote_for(f)
+        self.used_remote[f] = remote
+        step_game(self.world, self.dt, {
+            self.local_pid: unpack_buttons(self.local_inputs[f]),
+            self.remote_pid: unpack_buttons(remote),
+        })
+        self.values[f] = state_values(self.world)
+
+    def _record_final(self):
+        """Hash every newly final frame (simulated, with no more predicted inputs)."""
+        last = min(self.last_confirmed, self.frame - 1)
+        f = self.desync.last_tick
+        f = 0 if f is None else f + 1
+        while f <= last:
+            self.desync.record(f, self.values.pop(f))
+            f += 1
+
+    def rollback(self):
+        """Re-simulate from the oldest mispredicted frame up to the present."""
+        f0, self.rollback_from = self.rollback_from, None
+        depth = self.frame - f0
+        self.world.load_state(self.saved[f0])
+        for f in range(f0, self.frame):
+            self._simulate(f)
+        self.rollbacks += 1
+        self.resimulated += depth
+        self.max_depth = max(self.max_depth, depth)
+
+    def advance(self) -> bool:
+        """Simulate one frame; False if we have to wait for the remote peer."""
+        if self.rollback_from is not None:
+            self.rollback()
+
+        if self.frame - self.last_confirmed > self.max_rollback or self.frame not in self.local_inputs:
+            self._record_final()
+            self.stalls += 1
+            return False
+
+        self._simulate(self.frame)
+        self.frame += 1
+        self._record_final()
+
+        # Forget anything too old to be rolled back to or resent
+        old = self.frame - self.max_rollback - INPUT_HISTORY - 1
+        for d in (self.saved, self.values, self.used_remote, self.local_inputs, self.remote_inputs):
+            d.pop(old, None)
+        return True
@@ -0,0 +1,108 @@
+# rollback_client.py
+"""Peer-to-peer rollback mode: no server, both players simulate and only swap inputs."""
+import socket
+import pygame as pg
+from shared_protocol import (INPUT_MAGIC, HASH_MAGIC, HASH_HISTORY, encode, decode, encode_inputs,
+                             decode_inputs, encode_hashes, decode_hashes, pack_buttons)
+from game_sim import World, pack_state
+from rollback import RollbackSession
+from client_render import get_inputs, draw_state
+from render_cache import resources
+
+LOCAL_PORT = int(input("Local UDP port [5001]: ").strip() or 5001)
+peer_ip, peer_port = input("Peer address (ip:port): ").strip().rsplit(":", 1)
+PEER_ADDR = (peer_ip, int(peer_port))
+player_id = int(input("Player number (1 or 2): ").strip())
+
+# Both peers must build the same World (same joker deck order)
+MATCH_SEED = 1
+MAX_PACKET = 4096
+
+sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+sock.bind(("0.0.0.0", LOCAL_PORT))
+sock.setblocking(False)
+
+pg.init()
+display_flags = pg.RESIZABLE | pg.DOUBLEBUF
+screen = pg.display.set_mode((800, 500), display_flags)
+pg.display.set_caption(f"Fighter Rollback - Player {player_id}")
+clock = pg.time.Clock()
+
+CLIENT_HEARTBEAT_MS = 2000
+DEBUG_CLIENT = True
+
+world = World(seed=MATCH_SEED)
+session = RollbackSession(world, player_id)
+desync = session.desync
+
+def send(data: bytes):
+    try:
+        sock.sendto(data, PEER_ADDR)
+    except Exception:
+        pass
+
+running = True
+last_heartbeat = 0
+while running:
+    clock.tick(60)
+    now_ms = pg.time.get_ticks()
+    if DEBUG_CLIENT and now_ms - last_heartbeat > CLIENT_HEARTBEAT_MS:
+        print(f"[ROLLBACK] frame={session.frame} confirmed={session.last_confirmed} "
+              f"rollbacks={session.rollbacks} resimulated={session.resimulated} "
+              f"max_depth={session.max_depth} stalls={session.stalls} "
+              f"hash={desync.last_hash:08x}@{desync.last_tick} checked={desync.checked} "
+              f"desync_tick={desync.desync_tick}")
+        last_heartbeat = now_ms
+
+    for event in pg.event.get():
+        if event.type == pg.QUIT:
+            running = False
+        elif event.type == pg.VIDEORESIZE:
+            screen = pg.display.set_mode((event.w, event.h), display_flags)
+            resources.invalidate()
+
+    # Schedule our input and send it (with redundant history) to the peer
+    keys = pg.key.get_pressed()
+    frame = session.add_local_input(pack_buttons(get_inputs(keys, player_id)))
+    send(encode_inputs(player_id, frame, session.local_history(frame)))
+
+    # Our newest final-state hashes, and (after a mismatch) a request for the peer's values
+    tick, hashes = desync.recent(HASH_HISTORY)
+    if hashes:
+        send(encode_hashes(player_id, tick, hashes))
+    if desync.wanted is not None:
+        send(encode({"desync_dump": desync.wanted}))
+
+    # Take every remote input, hash and dump that has arrived
+    while True:
+        try:
+            data, _ = sock.recvfrom(MAX_PACKET)
+        except BlockingIOError:
+            break
+        except Exception:
+            break
+        kind = data[0] if data else None
+        if kind == INPUT_MAGIC:
+            pkt = decode_inputs(data)
+            if pkt and pkt["player"] != player_id:
+                for k, bits in enumerate(pkt["frames"]):
+                    session.add_remote_input(pkt["seq"] - k, bits)
+        elif kind == HASH_MAGIC:
+            pkt = decode_hashes(data)
+            if pkt and pkt["player"] != player_id:
+                desync.add_remote(pkt["tick"], pkt["hashes"])
+        elif data[:1] == b"{":
+            msg = decode(data)
+            if "desync_dump" in msg and msg["desync_dump"] in desync.values:
+                t = msg["desync_dump"]
+                send(encode({"desync_values": t, "values": desync.values[t]}))
+            elif "desync_values" in msg and msg["desync_values"] == desync.wanted:
+                desync.compare_values(msg["desync_values"], msg["values"])
+
+    session.advance()
+
+    draw_state(screen, pack_state(world))
+    pg.display.flip()
+
+sock.close()
+pg.quit()
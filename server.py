@@ -1,676 +1,769 @@
 # server.py
 import os
+import hmac
+import hashlib
+import json
+import sys
 import socket
+import struct
 import time
-import threading
-import random as r
-import math
-import pygame as pg
-from shared_protocol import encode, decode
-
-# ---------------- Headless setup (server has no window/audio) ----------------
-os.environ["SDL_VIDEODRIVER"] = "dummy"
-os.environ["SDL_AUDIODRIVER"] = "dummy"
-
-pg.init()
-clock = pg.time.Clock()
+import signal
+import selectors
+import multiprocessing as mp
+from shared_protocol import encode, decode, INPUT_MAGIC, INPUT_RATE, decode_inputs
+from game_sim import initial_width, initial_height, SIM_RATE, SIM_DT
+from match import Match, ROOM_IDLE_TIMEOUT, PLAYER_IDS
+from fanout import Fanout
+from histogram import Histogram
+from metrics import Registry, MetricsEndpoint
+import tracing
+
+# ---------------- Timing ----------------
+# The simulation always advances in fixed SIM_DT steps (game_sim.SIM_RATE, or
+# --sim-rate N; clients need the same flag), run from an accumulator. Snapshots
+# go out every SIM_RATE // SEND_RATE steps and each client input frame covers
+# SIM_RATE // INPUT_RATE steps.
+SEND_RATE = 60          # snapshots per second (--send-rate N)
+MAX_CATCHUP_STEPS = 8   # steps run back-to-back after a hitch; older backlog is dropped
 
 # ---------------- Network config ----------------
-TICK_RATE = 60
 SERVER_PORT = 5000
 MAX_PACKET = 4096
-
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.bind(("0.0.0.0", SERVER_PORT))
-sock.setblocking(False)
-print(f"[SERVER] UDP listening on 0.0.0.0:{SERVER_PORT}")
+MAX_DRAIN = 1024        # datagrams handled per wakeup before we check the tick timer again
+DEFAULT_ROOM = "default"
+MAX_ROOMS = 1000
+FANOUT_MARGIN = 0.001   # s before the next tick at which spectator sends stop
+# A spectator only gets the stream after echoing back a token sent to its
+# address, so a spoofed {"spectate": 1} can't aim it at someone else. The
+# token reply is smaller than the request. Per process: a restart (or another
+# worker) just hands out new tokens.
+SPECTATE_SECRET = os.urandom(16)
+# Directory every match's input log is written to (--record DIR); see matchlog.py / replay.py
+RECORD_DIR = None
+# Span tracing (--trace [DIR], off by default; see tracing.py). The ring is
+# dumped to TRACE_DIR when a step takes longer than TRACE_SLOW_MS or starts
+# a whole step late, on SIGUSR1, and served at /trace.json on the metrics port.
+TRACE_DIR = None
+TRACE_SLOW_MS = SIM_DT * 1000
+
+def set_sim_rate(rate: int):
+    """Run every room at `rate` steps per second instead of game_sim.SIM_RATE (--sim-rate)."""
+    global SIM_RATE, SIM_DT, TRACE_SLOW_MS
+    SIM_RATE, SIM_DT = rate, 1.0 / rate
+    TRACE_SLOW_MS = SIM_DT * 1000
+
+# ---------------- Sharding config ----------------
+# SERVER_WORKERS > 1 (or `python server.py --workers N`) runs a dispatcher on
+# SERVER_PORT that forwards each room's packets to one of N worker processes.
+SERVER_WORKERS = 1
+LOAD_REPORT_MS = 500            # how often workers tell the dispatcher their tick load
+WORKER_START_TIMEOUT = 10.0     # s to wait for every worker to come up
+NEW_ROOM_LOAD = 0.01            # assumed share of a core for a room a worker hasn't reported yet
+# Client IPv4 address + port, prepended by the dispatcher to every forwarded datagram
+FORWARD_HEADER = struct.Struct("<4sH")
 
 # Diagnostics
-DEBUG_SERVER = True
+DEBUG_SERVER = False            # one-line heartbeat every SERVER_HEARTBEAT_MS (the metrics endpoint has more)
 SERVER_HEARTBEAT_MS = 1000
-_last_server_hb = 0
-
-# Last seen addresses (player 1 and 2)
-player_addresses = {}
-# Latest inputs received (buttons are 0/1)
-player_inputs = {
-    1: {"left":0,"right":0,"jump":0,"attack":0,"block":0,"special":0},
-    2: {"left":0,"right":0,"jump":0,"attack":0,"block":0,"special":0},
-}
-
-# ---------------- Game constants & globals ----------------
-BG_COLOR = (30, 30, 30)
-PLAYER1_COLOR = (255, 0, 0)
-PLAYER2_COLOR = (0, 0, 255)
-FIREBALL_COLOR = (255, 165, 0)  # Orange
-BLOCK_SHIELD_COLOR = (50, 50, 255, 150)
-
-initial_width, initial_height = 800, 500
-width, height = initial_width, initial_height
-
-# Placeholder fireball image (server doesn't need real assets)
-fireball_image = pg.Surface((30, 30), pg.SRCALPHA)
-pg.draw.circle(fireball_image, FIREBALL_COLOR, (15, 15), 14)
-
-# Sprite groups
-all_sprites = pg.sprite.Group()
-fireballs = pg.sprite.Group()
-
-ko_triggered = False
-ko_y = -200
-
-# ---------------- Classes ----------------
-class Fireball(pg.sprite.Sprite):
-    def __init__(self, start_x, start_y, direction, color, screen_width):
-        super().__init__()
-        self.direction = direction  # "left" or "right"
-        self.speed = 500
-        self.damage = 25
-        self.screen_width = screen_width
-        self.owner = None
-
-        self.original_image = fireball_image
-        self.image = pg.transform.scale(self.original_image, (30, 30))
-        if self.direction == "left":
-            self.image = pg.transform.flip(self.image, True, False)
-        self.rect = self.image.get_rect(center=(start_x, start_y))
-
-    def update(self, dt, *args):
-        if self.direction == "right":
-            self.rect.x += self.speed * dt
-        else:
-            self.rect.x -= self.speed * dt
-
-        if self.rect.right < 0 or self.rect.left > self.screen_width:
-            self.kill()
-
-class Player(pg.sprite.Sprite):
-    def __init__(self, x_ratio, color, controls, typeofspecial):
-        super().__init__()
-        self.color = color
-        self.x_ratio = x_ratio
-        self.width_ratio = 0.06
-        self.height_ratio = 0.2
-
-        self.image = pg.Surface((50, 100))
-        self.image.fill(color)
-        self.rect = self.image.get_rect()
-        self.controls = controls
-        self.speed = 300
-        self.gravity = 0
-        self.attacking = False
-        self.blocking = False
-        self.active_hitbox = None
-        self.hit_opponents = []
-        self.facing = "right" if x_ratio < 0.5 else "left"
-        self.health = 100
-        self.max_health = 100
-
-        self.typeofspecial = typeofspecial
-        self.special_attack = 300
-        self.max_special = 300
-        self.special_cost = 100
-        self.can_special = True
-        self.special_cooldown_timer = 0
-        self.special_cooldown_time = 0.5
-
-        self.block_stamina = 100
-        self.max_block_stamina = 100
-        self.block_drain_rate = 100
-        self.block_recover_rate = 30
-
-        self.combo_count = 0
-        self.last_hit_time = 0
-        self.combo_reset_time = 0.8
-
-        self.stunned = False
-        self.stun_timer = 0
-        self.knockback_velocity = 0
-
-        self.shockwave_damage = 30
-        self.shockwave_base_damage = 15
-        self.shockwave_height_multiplier = 0.08
-
-        self.attack_type = "normal"
-
-        self.max_jumps = 2
-        self.jump_count = 0
-        self.jump_pressed = False
-
-        self.dashing = False
-        self.dash_speed = 3000
-        self.dash_time = 0.08
-        self.dash_timer = 0
-        self.dash_trail = []   # trail visuals not used on server
-        self.dash_trail_max = 10
-
-        self.max_dash_charges = 3
-        self.dash_charges = 0
-        self.dash_hit_this_dash = False
-
-        self.display_health = self.health
-
-        if self.typeofspecial == "joker":
-            self.joker_deck = ["fireball", "dash", "heal", "shockwave"]
-            r.shuffle(self.joker_deck)
-            self.joker_index = 0
-            self.joker_current = self.joker_deck[self.joker_index]
-        else:
-            self.joker_deck = None
-            self.joker_index = None
-            self.joker_current = None
-
-    def initial_setup(self, screen_width, screen_height):
-        w = int(screen_width * self.width_ratio)
-        h = int(screen_height * self.height_ratio)
-        floor = 0.8 * screen_height
-        self.image = pg.Surface((w, h))
-        self.image.fill(self.color)
-        self.rect = self.image.get_rect(midbottom=(int(screen_width * self.x_ratio), floor))
-
-    def update_rect(self, screen_width, screen_height):
-        w = int(screen_width * self.width_ratio)
-        h = int(screen_height * self.height_ratio)
-        floor = 0.8 * screen_height
-        old_midbottom = self.rect.midbottom
-
-        self.image = pg.Surface((w, h))
-        self.image.fill(self.color)
-        self.rect = self.image.get_rect(midbottom=old_midbottom)
-
-        if self.rect.bottom > floor:
-            self.rect.bottom = floor
-        if self.rect.left < 0:
-            self.rect.left = 0
-        if self.rect.right > screen_width:
-            self.rect.right = screen_width
-
-    def handle_input(self, dt, screen_height, screen_width):
-        # Overridden in NetPlayer; server doesn't read keyboard
+LOG_TAG = "[SERVER]"
+
+# ---------------- Metrics ----------------
+# Served as http://127.0.0.1:METRICS_PORT/metrics (--metrics-port N, 0 = off).
+# With --workers the dispatcher serves its own numbers there and worker i
+# serves the simulation's on METRICS_PORT + 1 + i.
+METRICS_PORT = 5001
+# Where a step's time goes, summed over every room stepped in it. Timing the
+# phases costs a few percent of a step, so only the steps of one send period
+# in every PHASE_SAMPLE_EVERY are timed.
+TICK_PHASES = ("input", "update", "collisions", "hash", "pack", "encode", "send")
+PHASE_SAMPLE_EVERY = 8
+metrics = Registry()
+m_packets_in = metrics.counter("server_packets_in_total", "Datagrams received")
+m_bytes_in = metrics.counter("server_bytes_in_total", "Bytes received")
+m_packets_out = metrics.counter("server_packets_out_total", "Snapshots sent to players")
+m_bytes_out = metrics.counter("server_bytes_out_total", "Snapshot bytes sent to players")
+m_decode_failures = metrics.counter("server_decode_failures_total", "Datagrams that were not a valid message")
+m_send_dropped = metrics.counter("server_send_dropped_total", "Snapshots dropped on a full socket buffer")
+m_send_errors = metrics.counter("server_send_errors_total", "Snapshots that failed to send")
+m_ticks = metrics.counter("server_ticks_total", "Simulation steps")
+m_overruns = metrics.counter("server_overruns_total", "Wakeups that had to run more than one step")
+m_dropped_steps = metrics.counter("server_dropped_steps_total", "Steps skipped after a hitch (beyond MAX_CATCHUP_STEPS)")
+m_tick_ms = metrics.histogram("server_tick_ms", "Wall time of one step over all rooms (ms)")
+m_tick_late_ms = metrics.histogram("server_tick_late_ms", "How far past its deadline a step started (ms)")
+m_input_latency_ms = metrics.histogram("server_input_latency_ms", "Time from input arrival to the step that used it (ms)")
+m_phase_ms = {p: metrics.histogram("server_tick_phase_ms", "Time per step spent in each phase (ms)", phase=p)
+              for p in TICK_PHASES}
+phase_times = dict.fromkeys(TICK_PHASES, 0.0)   # seconds this step, flushed into m_phase_ms
+# Time per simulation step (ms) for loadgen.py, since the last {"stats": 1, "reset": 1}
+tick_hist = Histogram()
+# Addresses that asked for {"stats": 1}, answered after the next tick
+stats_requests = []
+# Addresses that asked to spectate without a valid token, sent one after the next tick
+spectate_challenges = []
+# Who may ask for {"stats": 1} on the game port besides loopback (--stats-allow
+# IP,IP). The reply is ~40x the request, so answering anyone would make the
+# server an amplifier.
+STATS_ALLOW = set()
+# Source address of the dispatcher's {"stats_reset": 1} as a worker sees it;
+# port 0 is never a real client's, so nothing else can reset the histograms
+DISPATCHER_ADDR = ("127.0.0.1", 0)
+cpu_marks = {"stats": (time.process_time(), time.perf_counter())}
+
+# ---------------- Rooms ----------------
+# room id -> Match; a room exists from its first join until it goes idle
+rooms = {}
+# client address -> (room id, player number), for routing packets
+clients = {}
+# Spectator snapshots, sent between ticks after the players' own
+fanout = Fanout()
+
+def join_room(room_id, pid, addr):
+    if pid not in PLAYER_IDS:
+        m_decode_failures.inc()
+        return
+    prev = clients.get(addr)
+    if prev and prev != (room_id, pid) and prev[0] in rooms:
+        rooms[prev[0]].leave(prev[1])
+    match = rooms.get(room_id)
+    if match is None:
+        if len(rooms) >= MAX_ROOMS:
+            print(f"{LOG_TAG} Room limit reached, refusing {addr}")
+            return
+        match = rooms[room_id] = Match(room_id, initial_width, initial_height, sim_rate=SIM_RATE, record_dir=RECORD_DIR)
+    old = match.addresses.get(pid)
+    if old is not None and old != addr:
+        clients.pop(old, None)
+    match.join(pid, addr, time.perf_counter())
+    clients[addr] = (room_id, pid)
+    print(f"{LOG_TAG} Player {pid} joined room {room_id!r} from {addr}")
+
+def spectate_room(room_id, addr, now):
+    """Attach (or keep alive) a spectator; rooms are only created by players joining."""
+    match = rooms.get(room_id)
+    if match is None:
+        return
+    new = addr not in match.spectators
+    if match.spectate(addr, now) and new:
+        print(f"{LOG_TAG} Spectator joined room {room_id!r} from {addr} ({len(match.spectators)} watching)")
+
+def close_idle_rooms(now):
+    for room_id, match in list(rooms.items()):
+        if match.idle(now):
+            for addr in match.addresses.values():
+                clients.pop(addr, None)
+            del rooms[room_id]
+            match.close()
+            print(f"{LOG_TAG} Closed idle room {room_id!r} seed={match.world.seed} ticks={match.tick} "
+                  f"state_hash={match.desync.last_hash:08x}@{match.desync.last_tick}")
+
+# ---------------- Packet handling ----------------
+def stats_allowed(addr) -> bool:
+    return addr[0].startswith("127.") or addr[0] in STATS_ALLOW
+
+def spectate_token(addr) -> str:
+    return hmac.new(SPECTATE_SECRET, f"{addr[0]}:{addr[1]}".encode(), hashlib.sha256).hexdigest()[:12]
+
+def handle_packet(data, addr, now):
+    if data[:1] == bytes((INPUT_MAGIC,)):
+        pkt = decode_inputs(data)
+        if not pkt:
+            m_decode_failures.inc()
+            return
+        # Inputs count for the player this address joined as, whatever the packet claims
+        route = clients.get(addr)
+        if route and route[0] in rooms:
+            rooms[route[0]].add_inputs(route[1], pkt, now)
         return
 
-    def apply_gravity(self, screen_height, screen_width=None):
-        floor = 0.8 * screen_height
-        GRAVITY_ACCELERATION_RATIO = 0.002
-        GRAVITY_ACCELERATION = screen_height * GRAVITY_ACCELERATION_RATIO
-        WALL_SLIDE_SPEED_RATIO = 0.5
-
-        wall_touch = self.is_touching_wall(screen_width) if screen_width else None
-        if wall_touch and self.is_airborne(screen_height):
-            self.gravity = min(self.gravity, GRAVITY_ACCELERATION / WALL_SLIDE_SPEED_RATIO)
-
-        self.gravity += GRAVITY_ACCELERATION
-        self.rect.y += self.gravity
-
-        if self.rect.bottom >= floor:
-            self.rect.bottom = floor
-            self.gravity = 0
-            self.jump_count = 0
-
-        if self.knockback_velocity != 0:
-            self.rect.x += self.knockback_velocity
-            self.knockback_velocity *= 0.85
-            if abs(self.knockback_velocity) < 1:
-                self.knockback_velocity = 0
-
-        if self.stunned:
-            self.stun_timer -= 1 / 60
-            if self.stun_timer <= 0:
-                self.stunned = False
-
-    def start_attack(self, screen_height):
-        self.attack_type = "normal"
-        self.attacking = True
-        self.attack_timer = 0.2
-        w, h = self.rect.width, self.rect.height
-        airborne = self.is_airborne(screen_height)
-
-        # Keep deterministic; use grounded/airborne branches
-        if airborne:
-            self.active_hitbox = pg.Rect(self.rect.centerx - 0.2*w, self.rect.top - 0.5*h, 0.4*w, 0.5*h)
-        else:
-            if self.facing == "right":
-                self.active_hitbox = pg.Rect(self.rect.right, self.rect.top + 0.2*h, 0.35*w, 0.6*h)
-            else:
-                self.active_hitbox = pg.Rect(self.rect.left - 0.35*w, self.rect.top + 0.2*h, 0.35*w, 0.6*h)
-        self.hit_opponents = []
-
-    def start_special(self, screen_width):
-        self.special_attack -= self.special_cost
-        self.can_special = False
-        self.special_cooldown_timer = self.special_cooldown_time
-
-        if self.typeofspecial == "joker":
-            chosen = self.joker_current
-        else:
-            chosen = self.typeofspecial
-
-        if chosen == "fireball":
-            self.attack_type = "fireball"
-            start_x = self.rect.centerx
-            start_y = self.rect.centery - 10
-            fireball = Fireball(start_x, start_y, self.facing, FIREBALL_COLOR, screen_width)
-            fireball.owner = self
-            all_sprites.add(fireball)
-            fireballs.add(fireball)
-
-        elif chosen == "dash":
-            self.attack_type = "dash"
-            self.dashing = True
-            self.dash_timer = self.dash_time
-            self.dash_charges = self.max_dash_charges
-            self.dash_hit_this_dash = False
-            self.hit_opponents = []
-
-        elif chosen == "heal":
-            self.health += 20
-            if self.health > self.max_health:
-                self.health = self.max_health
-
-        elif chosen == "shockwave":
-            self.attack_type = "shockwave"
-            w, h = self.rect.width, self.rect.height
-            shockwave_radius = max(w, h) * 1.85
-            self.active_hitbox = pg.Rect(self.rect.centerx - shockwave_radius/2, self.rect.centery - shockwave_radius/2, shockwave_radius, shockwave_radius)
-            self.attacking = True
-            self.attack_timer = 0.3
-            self.hit_opponents = []
-
-        if self.typeofspecial == "joker":
-            self.joker_index += 1
-            if self.joker_index >= len(self.joker_deck):
-                self.joker_index = 0
-            self.joker_current = self.joker_deck[self.joker_index]
-
-    def update_attack(self, dt):
-        if self.attacking:
-            self.attack_timer -= dt
-            if self.attack_timer <= 0:
-                self.attacking = False
-                self.active_hitbox = None
-                self.hit_opponents = []
-        if not self.can_special:
-            self.special_cooldown_timer -= dt
-            if self.special_cooldown_timer <= 0:
-                self.can_special = True
-
-    def gain_special(self, amount):
-        self.special_attack += amount
-        if self.special_attack > self.max_special:
-            self.special_attack = self.max_special
-
-    def deal_damage(self, amount):
-        self.health -= amount
-        if self.health < 0:
-            self.health = 0
-        self.gain_special(amount * 0.5)
-
-    def update(self, dt, screen_width, screen_height):
-        # Ensure rect size & floor clamping uses current screen size.
-        self.update_rect(screen_width, screen_height)
-
-        # >>> APPLY INPUTS HERE <<<
-        # NetPlayer overrides handle_input; base Player's is a no-op, so this is safe.
-        self.handle_input(dt, screen_height, screen_width)
-
-        # Dash movement & hitbox
-        if self.dashing:
-            direction = 1 if self.facing == "right" else -1
-            self.rect.x += direction * self.dash_speed * dt
-            self.dash_timer -= dt
-            self.active_hitbox = pg.Rect(
-                min(self.rect.centerx, self.rect.centerx + direction * self.dash_speed * dt),
-                self.rect.top,
-                self.rect.width * 0.6 + self.dash_speed * dt,
-                self.rect.height
-            )
-            if self.dash_timer <= 0:
-                self.dashing = False
-                self.active_hitbox = None
-                self.dash_hit_this_dash = False
-                self.hit_opponents = []
-        if not self.dashing and self.attack_type == "dash":
-            self.attack_type = "normal"
-
-        self.apply_gravity(screen_height, screen_width)
-        self.update_attack(dt)
-        self.display_health += (self.health - self.display_health) * 0.12
-
-    def is_airborne(self, screen_height):
-        floor = 0.8 * screen_height
-        return self.rect.bottom < floor - 5
-
-    def is_touching_wall(self, screen_width):
-        if self.rect.left <= 0:
-            return "left"
-        elif self.rect.right >= screen_width:
-            return "right"
-        return None
-
-class NetPlayer(Player):
-    """Same as Player, but reads inputs from network dict instead of keyboard."""
-    def __init__(self, x_ratio, color, player_id, typeofspecial):
-        super().__init__(x_ratio, color, controls={}, typeofspecial=typeofspecial)
-        self.player_id = player_id
-        self.net_inputs = {"left":0,"right":0,"jump":0,"attack":0,"block":0,"special":0}
+    msg = decode(data)
+    if not msg or not isinstance(msg, dict):
+        m_decode_failures.inc()
+        return
 
-    def set_inputs(self, inputs: dict):
-        self.net_inputs.update({k:int(bool(inputs.get(k,0))) for k in ["left","right","jump","attack","block","special"]})
+    if "stats" in msg:
+        if stats_allowed(addr):
+            stats_requests.append((addr, bool(msg.get("reset"))))
+        return
+    if "stats_reset" in msg:
+        if addr == DISPATCHER_ADDR:
+            tick_hist.reset()
+        return
 
-    def handle_input(self, dt, screen_height, screen_width):
-        global ko_triggered
-        if ko_triggered or self.stunned:
+    if "join" in msg:
+        if type(msg["join"]) is not int:
+            m_decode_failures.inc()
             return
-        inp = self.net_inputs
-
-        if not self.dashing:
-            if inp["left"]:
-                self.rect.x -= self.speed * dt
-                self.facing = "left"
-            if inp["right"]:
-                self.rect.x += self.speed * dt
-                self.facing = "right"
-
-        # Jump / double-jump / wall-jump
-        JUMP_VELOCITY = screen_height * (-0.036)
-        wall_touch = None
-        if self.rect.left <= 0: wall_touch = "left"
-        elif self.rect.right >= screen_width: wall_touch = "right"
-
-        if inp["jump"]:
-            if self.is_airborne(screen_height) and self.jump_count < self.max_jumps:
-                self.gravity = JUMP_VELOCITY
-                self.jump_count += 1
-            elif not self.is_airborne(screen_height) and self.jump_count == 0:
-                self.gravity = JUMP_VELOCITY
-                self.jump_count = 1
-            elif wall_touch:
-                self.gravity = JUMP_VELOCITY
-                if wall_touch == "left":
-                    self.rect.x += int(0.1 * screen_width); self.facing = "right"
-                else:
-                    self.rect.x -= int(0.1 * screen_width); self.facing = "left"
-
-        # Blocking
-        if inp["block"]:
-            self.blocking = self.block_stamina > 0
-        else:
-            self.blocking = False
+        join_room(str(msg.get("room", DEFAULT_ROOM)), msg["join"], addr)
+        return
 
-        if self.blocking:
-            self.block_stamina -= self.block_drain_rate * dt
-            if self.block_stamina < 0:
-                self.block_stamina = 0
-                self.blocking = False
+    if "spectate" in msg:
+        token = msg.get("token")
+        if isinstance(token, str) and hmac.compare_digest(token, spectate_token(addr)):
+            spectate_room(str(msg.get("room", DEFAULT_ROOM)), addr, now)
         else:
-            self.block_stamina += self.block_recover_rate * dt
-            if self.block_stamina > self.max_block_stamina:
-                self.block_stamina = self.max_block_stamina
-
-        # Attack
-        if inp["attack"] and not self.attacking and not self.blocking:
-            self.start_attack(screen_height)
-
-        # Special
-        if inp["special"] and self.special_attack >= self.special_cost and self.can_special and not self.attacking and not self.blocking:
-            self.start_special(screen_width)
-
-# ---------------- World setup ----------------
-player1 = NetPlayer(0.2, PLAYER1_COLOR, player_id=1, typeofspecial="heal")
-player2 = NetPlayer(0.8, PLAYER2_COLOR, player_id=2, typeofspecial="joker")
-player1.initial_setup(width, height)
-player2.initial_setup(width, height)
-players = pg.sprite.Group(player1, player2)
-all_sprites.add(player1, player2)
-
-def reset_game():
-    global ko_triggered, ko_y
-    ko_triggered = False
-    ko_y = -200
-
-    player1.health = 100
-    player2.health = 100
-
-    player1.special_attack = 0
-    player2.special_attack = 0
-
-    player1.block_stamina = player1.max_block_stamina
-    player2.block_stamina = player2.max_block_stamina
-
-    player1.rect.midbottom = (int(width * player1.x_ratio), int(0.8 * height))
-    player2.rect.midbottom = (int(width * player2.x_ratio), int(0.8 * height))
-
-    player1.gravity = 0
-    player2.gravity = 0
-
-    player1.attacking = False
-    player2.attacking = False
-
-    player1.active_hitbox = None
-    player2.active_hitbox = None
-
-    player1.facing = "right"
-    player2.facing = "left"
-
-    player1.stunned = False
-    player2.stunned = False
-    player1.combo_count = 0
-    player2.combo_count = 0
-    player1.knockback_velocity = 0
-    player2.knockback_velocity = 0
-
-    for f in list(fireballs):
-        f.kill()
-
-def handle_attack(attacker: Player, defender: Player):
-    now = pg.time.get_ticks() / 1000
-
-    # Dash contact
-    if attacker.attack_type == "dash" and attacker.dashing and attacker.active_hitbox:
-        if attacker.active_hitbox.colliderect(defender.rect) and defender not in attacker.hit_opponents:
-            defender.deal_damage(30)
-            defender.stunned = True
-            defender.stun_timer = 0.4
-            defender.knockback_velocity = 15 if attacker.facing == "right" else -15
-
-            attacker.hit_opponents.append(defender)
-            attacker.dash_hit_this_dash = True
+            spectate_challenges.append(addr)
         return
 
-    # Normal/shockwave
-    if attacker.active_hitbox and attacker.active_hitbox.colliderect(defender.rect) and defender not in attacker.hit_opponents:
-        if now - attacker.last_hit_time > attacker.combo_reset_time:
-            attacker.combo_count = 0
-
-        attacker.combo_count += 1
-        attacker.last_hit_time = now
-        attacker.hit_opponents.append(defender)
-
-        damage = 5
-        if attacker.attack_type == "shockwave":
-            floor = 0.8 * height
-            height_above_ground = max(0, floor - attacker.rect.bottom)
-            damage = attacker.shockwave_base_damage + height_above_ground * attacker.shockwave_height_multiplier
+    route = clients.get(addr)
+    match = rooms.get(route[0]) if route else None
+    if match is None:
+        return
 
-        if not defender.blocking:
-            defender.deal_damage(damage)
+    if "player" in msg and "inputs" in msg:
+        ack = msg.get("ack")
+        if (type(msg["player"]) is not int or msg["player"] not in PLAYER_IDS or not isinstance(msg["inputs"], dict)
+                or (ack is not None and type(ack) is not int)):
+            m_decode_failures.inc()
+            return
+        match.set_inputs(route[1], msg["inputs"], ack, now)
 
-        attacker.gain_special(damage * 1.5)
-        defender.gain_special(damage * 0.5)
-
-        if attacker.combo_count >= 4:
-            defender.stunned = True
-            defender.stun_timer = 0.7
-            defender.knockback_velocity = 18 if attacker.facing == "right" else -18
-            attacker.combo_count = 0
-
-def step_game(dt):
-    global ko_triggered, ko_y
-
-    # Apply inputs
-    player1.set_inputs(player_inputs[1])
-    player2.set_inputs(player_inputs[2])
-
-    # Update world
-    players.update(dt, width, height)
-    fireballs.update(dt)
-
-    # Passive special gain
-    player1.gain_special(10 * dt)
-    player2.gain_special(10 * dt)
-
-    # Basic attack collisions
-    handle_attack(player1, player2)
-    handle_attack(player2, player1)
-
-    # Fireball collisions
-    for fireball in list(fireballs):
-        if fireball.owner != player1 and fireball.rect.colliderect(player1.rect):
-            attacker = fireball.owner; defender = player1
-            now = pg.time.get_ticks() / 1000
-
-            if now - attacker.last_hit_time > attacker.combo_reset_time:
-                attacker.combo_count = 0
-
-            attacker.combo_count += 1
-            attacker.last_hit_time = now
-
-            if not defender.blocking:
-                defender.deal_damage(fireball.damage)
-
-            attacker.gain_special(fireball.damage * 1.5)
-            defender.gain_special(fireball.damage * 0.5)
-
-            if attacker.combo_count >= 4:
-                defender.stunned = True
-                defender.stun_timer = 0.9
-                defender.knockback_velocity = 35 if attacker.facing == "right" else -35
-                attacker.combo_count = 0
-
-            fireball.kill()
-
-        elif fireball.owner != player2 and fireball.rect.colliderect(player2.rect):
-            attacker = fireball.owner; defender = player2
-            now = pg.time.get_ticks() / 1000
-
-            if now - attacker.last_hit_time > attacker.combo_reset_time:
-                attacker.combo_count = 0
-
-            attacker.combo_count += 1
-            attacker.last_hit_time = now
-
-            if not defender.blocking:
-                defender.deal_damage(fireball.damage)
-
-            attacker.gain_special(fireball.damage * 1.5)
-            defender.gain_special(fireball.damage * 0.5)
-
-            if attacker.combo_count >= 4:
-                defender.stunned = True
-                defender.stun_timer = 0.9
-                defender.knockback_velocity = 35 if attacker.facing == "right" else -35
-                attacker.combo_count = 0
-
-            fireball.kill()
-
-    # KO logic (no drawing on server)
-    if not ko_triggered and (player1.health <= 0 or player2.health <= 0):
-        ko_triggered = True
-        ko_y = -0.4 * height
-
-    if ko_triggered:
-        ko_y += 600 * dt
-        if ko_y > 0.3 * height:
-            ko_y = 0.3 * height
-
-def pack_state() -> dict:
-    """Pack minimal full state for clients to render."""
-    fb_list = [{"x": f.rect.centerx, "y": f.rect.centery, "dir": f.direction} for f in fireballs]
-
-    def p_to_dict(p: Player):
-        hb = None
-        if p.active_hitbox:
-            rct = p.active_hitbox
-            hb = {"x": rct.x, "y": rct.y, "w": rct.width, "h": rct.height}
-        return {
-            "x": p.rect.x, "y": p.rect.y,
-            "w": p.rect.width, "h": p.rect.height,
-            "hp": p.health, "hpMax": p.max_health,
-            "hpDisp": p.display_health,
-            "special": p.special_attack, "specialMax": p.max_special,
-            "block": p.block_stamina, "blockMax": p.max_block_stamina,
-            "facing": p.facing, "blocking": p.blocking,
-            "attacking": p.attacking, "attackType": p.attack_type,
-            "stunned": p.stunned,
-            "hitbox": hb
-        }
+    elif msg.get("replay") == 1:
+        match.replay()
 
-    return {
-        "p1": p_to_dict(player1),
-        "p2": p_to_dict(player2),
-        "fireballs": fb_list,
-        "ko": ko_triggered,
-        "width": width, "height": height
-    }
+def drain_socket(sock, now=None, forwarded=False):
+    """Handle every datagram already queued on the socket (up to MAX_DRAIN).
 
-# ---------------- UDP listener (thread) ----------------
-def network_listener():
-    global player_inputs
-    while True:
+    With forwarded=True each datagram carries FORWARD_HEADER with the real
+    client address (a worker behind the dispatcher).
+    """
+    now = time.perf_counter() if now is None else now
+    for _ in range(MAX_DRAIN):
         try:
             data, addr = sock.recvfrom(MAX_PACKET)
         except BlockingIOError:
-            time.sleep(0.001)
+            return
+        except OSError:
+            # e.g. Windows reports an ICMP port-unreachable from an earlier sendto here
             continue
-
-        msg = decode(data)
-        if not msg:
+        if forwarded:
+            if len(data) < FORWARD_HEADER.size:
+                m_decode_failures.inc()
+                continue
+            ip, port = FORWARD_HEADER.unpack_from(data)
+            addr = (socket.inet_ntoa(ip), port)
+            data = data[FORWARD_HEADER.size:]
+        m_packets_in.inc()
+        m_bytes_in.inc(len(data))
+        try:
+            handle_packet(data, addr, now)
+        except Exception:
+            # One bad datagram must not take the loop (and every room on it) down; not
+            # logged, since whoever sends them could flood the log as easily
+            m_decode_failures.inc()
+
+# ---------------- Simulation tick ----------------
+def _no_clock():
+    return 0.0
+
+def run_tick(sock, now, pull=True, send=True, timed=False):
+    """Advance every active room one SIM_DT step; optionally take inputs / send snapshots.
+
+    timed=True records where the step's time went in m_phase_ms.
+    """
+    close_idle_rooms(now)
+    # Rooms nobody has joined yet (or everyone left) are not stepped at all
+    active = [m for m in rooms.values() if m.active]
+    tr = tracing.tracer
+    timed = timed or tr is not None
+    times = phase_times if timed else None
+    clock = time.perf_counter if timed else _no_clock
+    for match in active:
+        tid = tr.track(match.room_id) if tr else 0
+        if pull:
+            t0 = clock()
+            waited = match.pull_inputs(now)
+            if timed:
+                t1 = clock()
+                times["input"] += t1 - t0
+                if tr:
+                    tr.add("pull_inputs", t0, t1, tid)
+            if waited is not None:
+                m_input_latency_ms.add(waited * 1000)
+        match.step(SIM_DT, times)
+        if not send:
             continue
-
-        if "join" in msg:
-            pid = int(msg["join"])
-            player_addresses[pid] = addr
-            print(f"[SERVER] Player {pid} joined from {addr}")
-
-        elif "player" in msg and "inputs" in msg:
-            pid = int(msg["player"])
-            if pid in player_inputs:
-                player_inputs[pid] = {k:int(bool(v)) for k, v in msg["inputs"].items()}
-                if DEBUG_SERVER:
-                    # lightweight log: occasionally print inputs
-                    now_ms = int(time.time() * 1000)
-                    if now_ms % 5000 < 50:
-                        print(f"[SERVER] recv inputs from {pid}: {player_inputs[pid]}")
-
-        elif msg.get("replay") == 1:
-            reset_game()
-
-threading.Thread(target=network_listener, daemon=True).start()
-
-# ---------------- Main server loop ----------------
-try:
-    while True:
-        dt = clock.tick(TICK_RATE) / 1000.0
-        step_game(dt)
-
-        state_packet = encode(pack_state())
-        # Send state to connected players
-        for pid, addr in list(player_addresses.items()):
+        # Send state to connected players (delta against each one's last ack)
+        t0 = clock()
+        match.pack()
+        t1 = clock()
+        send_time = 0.0
+        te = t1
+        for addr, packet in match.snapshots():
+            ts = clock()
             try:
-                sock.sendto(state_packet, addr)
+                sock.sendto(packet, addr)
+                m_packets_out.inc()
+                m_bytes_out.inc(len(packet))
+            except BlockingIOError:
+                m_send_dropped.inc()
             except Exception as e:
-                print(f"[SERVER] sendto error to {addr}: {e}")
+                m_send_errors.inc()
+                print(f"{LOG_TAG} sendto error to {addr}: {e}")
+            if tr:
+                tr.add("encode", te, ts, tid)
+                te = clock()
+                tr.add("sendto", ts, te, tid)
+                send_time += te - ts
+            else:
+                send_time += clock() - ts
+        # Spectators: one packet for the whole audience, queued for between ticks
+        packet = match.spectator_frame(now)
+        if packet is not None:
+            fanout.broadcast(match.room_id, packet, list(match.spectators))
+        if timed:
+            times["pack"] += t1 - t0
+            times["encode"] += clock() - t1 - send_time
+            times["send"] += send_time
+            if tr:
+                tr.add("pack_state", t0, t1, tid)
+    m_ticks.inc()
+    if timed:
+        for phase, t in times.items():
+            if t:
+                m_phase_ms[phase].add(t * 1000)
+                times[phase] = 0.0
+    return len(active)
+
+def cpu_since(key) -> float:
+    """Percent of one core this process used since the last call with the same key."""
+    cpu, wall = time.process_time(), time.perf_counter()
+    cpu0, wall0 = cpu_marks.get(key, (cpu, wall))
+    cpu_marks[key] = (cpu, wall)
+    return (cpu - cpu0) / (wall - wall0) * 100 if wall > wall0 else 0.0
+
+def server_stats(active) -> dict:
+    """Load numbers for loadgen.py and the dispatcher (JSON-friendly)."""
+    return {
+        "rooms": len(rooms), "active": active, "clients": len(clients),
+        "spectators": sum(len(m.spectators) for m in rooms.values()),
+        "cpu": round(cpu_since("stats"), 2), "overruns": m_overruns.value, "dropped_steps": m_dropped_steps.value,
+        "tick_ms": tick_hist.to_wire(), "sim_rate": SIM_RATE,
+    }
 
-        # Periodic heartbeat for diagnostics
-        if DEBUG_SERVER:
-            now_ms = int(time.time() * 1000)
-            if now_ms - _last_server_hb > SERVER_HEARTBEAT_MS:
-                _last_server_hb = now_ms
-                print(f"[SERVER] heartbeat - players={list(player_addresses.keys())} inputs_p1={player_inputs.get(1)} inputs_p2={player_inputs.get(2)}")
+def answer_stats(sock, active):
+    reply = encode({"stats": dict(server_stats(active), workers=1)})
+    reset = False
+    for addr, r in stats_requests:
+        reset |= r
+        try:
+            sock.sendto(reply, addr)
+        except OSError:
+            pass
+    stats_requests.clear()
+    if reset:
+        tick_hist.reset()
+
+def answer_spectate_challenges(sock):
+    for addr in spectate_challenges:
+        try:
+            sock.sendto(encode({"token": spectate_token(addr)}), addr)
+        except OSError:
+            pass
+    spectate_challenges.clear()
+
+# Read only when scraped
+metrics.gauge("server_rooms", "Rooms open", lambda: len(rooms))
+metrics.gauge("server_active_rooms", "Rooms with a player connected", lambda: sum(m.active for m in rooms.values()))
+metrics.gauge("server_clients", "Players connected", lambda: len(clients))
+metrics.gauge("server_spectators", "Spectators watching", lambda: sum(len(m.spectators) for m in rooms.values()))
+metrics.gauge("server_room_clients", "Players connected per room",
+              lambda: {room_id: len(m.addresses) for room_id, m in rooms.items()}, label="room")
+metrics.gauge("server_cpu_percent", "Share of one core used since the last scrape", lambda: cpu_since("metrics"))
+metrics.gauge("server_snapshot_bytes_total", "Snapshot bytes encoded for players (open rooms)",
+              lambda: sum(s.bytes_sent for m in rooms.values() for s in m.senders.values()))
+metrics.gauge("server_inputs_late_total", "Input frames that arrived after their tick (open rooms)",
+              lambda: sum(b.late for m in rooms.values() for b in m.input_buffers.values()))
+metrics.gauge("server_inputs_recovered_total", "Lost input frames recovered from redundant history (open rooms)",
+              lambda: sum(b.recovered for m in rooms.values() for b in m.input_buffers.values()))
+metrics.gauge("server_inputs_too_far_total", "Input packets dropped for a seq too far ahead (open rooms)",
+              lambda: sum(b.too_far for m in rooms.values() for b in m.input_buffers.values()))
+metrics.gauge("server_spectator_sent_total", "Spectator packets sent", lambda: fanout.sent)
+metrics.gauge("server_spectator_dropped_total", "Spectator packets dropped (superseded or socket full)",
+              lambda: fanout.dropped_stale + fanout.dropped_full)
+metrics.gauge("server_spectator_send_errors_total", "Spectator packets that failed to send", lambda: fanout.errors)
+metrics.gauge("server_spectator_send_seconds_total", "Time spent sending to spectators", lambda: fanout.send_time)
+
+def open_metrics(registry, selector, port):
+    """Serve `registry` on 127.0.0.1:port from `selector`'s loop; None if off or the port is taken."""
+    if not port:
+        return None
+    try:
+        endpoint = MetricsEndpoint(registry, selector, port)
+    except OSError as e:
+        print(f"{LOG_TAG} metrics endpoint unavailable on port {port}: {e}")
+        return None
+    print(f"{LOG_TAG} metrics on http://127.0.0.1:{port}/metrics")
+    return endpoint
 
-except KeyboardInterrupt:
-    print("\n[SERVER] Shutting down.")
-finally:
-    sock.close()
+def heartbeat_line(active) -> str:
+    return (f"{LOG_TAG} heartbeat - rooms={len(rooms)} active={active} clients={len(clients)} "
+            f"steps={m_ticks.value} overruns={m_overruns.value} dropped_steps={m_dropped_steps.value} "
+            f"tick_ms p50={m_tick_ms.percentile(50):.2f} p99={m_tick_ms.percentile(99):.2f} "
+            f"cpu={cpu_since('heartbeat'):.1f}% packets_in={m_packets_in.value} packets_out={m_packets_out.value} "
+            f"decode_failures={m_decode_failures.value} send_dropped={m_send_dropped.value}")
 
-    pg.quit()
+# ---------------- Main server loop ----------------
+def serve(recv_sock, send_sock, forwarded=False, report=None, send_rate=SEND_RATE, metrics_port=0):
+    """One thread: sleep in select() until a datagram arrives or the next step is due.
+
+    Wall time is added to an accumulator and the rooms advance in fixed SIM_DT
+    steps, so a hitch means a few back-to-back steps (an overrun) instead of
+    one long step. More than MAX_CATCHUP_STEPS of backlog is dropped.
+
+    report(busy, active) is called every LOAD_REPORT_MS with the share of
+    wall time spent ticking, so a dispatcher can balance new rooms.
+    Other sockets on the selector (the metrics endpoint) carry a handler as
+    their selector data.
+    """
+    if SIM_RATE % send_rate or SIM_RATE % INPUT_RATE:
+        raise ValueError(f"SIM_RATE {SIM_RATE} must be a multiple of the send rate ({send_rate}) and INPUT_RATE ({INPUT_RATE})")
+    send_every = SIM_RATE // send_rate
+    input_every = SIM_RATE // INPUT_RATE
+    print(f"{LOG_TAG} simulating at {SIM_RATE} Hz, sending at {send_rate} Hz")
+
+    selector = selectors.DefaultSelector()
+    selector.register(recv_sock, selectors.EVENT_READ)
+    endpoint = open_metrics(metrics, selector, metrics_port)
+    tr = tracing.tracer
+    if tr:
+        print(f"{LOG_TAG} tracing; dumps go to {tr.out_dir}/ (slow steps, SIGUSR1)")
+
+        def trace_json():
+            body = json.dumps(tr.chrome_trace(), separators=(",", ":")).encode()
+            # Building this stalls the loop; don't let that stall trigger a slow-tick dump
+            tr.last_auto_dump = time.perf_counter()
+            return body
+
+        if endpoint:
+            endpoint.add_route("/trace.json", "application/json", trace_json)
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda *_: tr.dump("signal"))
+
+    def poll(timeout):
+        for key, events in selector.select(timeout):
+            if key.data is None:
+                drain_socket(recv_sock, forwarded=forwarded)
+            else:
+                key.data(events)
+
+    last = time.perf_counter()
+    acc = 0.0
+    sim_tick = 0
+    active = 0
+    busy, busy_mark = 0.0, last
+    last_hb = last
+    try:
+        while True:
+            now = time.perf_counter()
+            acc += now - last
+            last = now
+            if acc < SIM_DT:
+                timeout = SIM_DT - acc
+                if fanout and timeout > FANOUT_MARGIN:
+                    fanout.send(send_sock, now + timeout - FANOUT_MARGIN)
+                    poll(0)
+                    continue
+                poll(timeout)
+                continue
+
+            steps = int(acc / SIM_DT)
+            if steps > MAX_CATCHUP_STEPS:
+                m_dropped_steps.inc(steps - MAX_CATCHUP_STEPS)
+                acc -= (steps - MAX_CATCHUP_STEPS) * SIM_DT
+                steps = MAX_CATCHUP_STEPS
+            if steps > 1:
+                m_overruns.inc()
+            m_tick_late_ms.add((acc - SIM_DT) * 1000)
+
+            # Whatever arrived while we were waiting for the deadline goes into this step
+            drain_socket(recv_sock, now, forwarded)
+            if tr:
+                tr.add("drain_socket", now, time.perf_counter())
+                if steps > 1:
+                    tr.instant("late_wakeup", args={"steps": steps, "late_ms": round((acc - SIM_DT) * 1000, 3)})
+            slow = steps > 1
+            for _ in range(steps):
+                ts = time.perf_counter()
+                active = run_tick(send_sock, now, pull=sim_tick % input_every == 0, send=(sim_tick + 1) % send_every == 0,
+                                  timed=(sim_tick // send_every) % PHASE_SAMPLE_EVERY == 0)
+                te = time.perf_counter()
+                step_ms = (te - ts) * 1000
+                m_tick_ms.add(step_ms)
+                tick_hist.add(step_ms)
+                if tr:
+                    tr.add("tick", ts, te, args={"tick": sim_tick, "rooms": active})
+                    slow |= step_ms > TRACE_SLOW_MS
+                sim_tick += 1
+                acc -= SIM_DT
+            t1 = time.perf_counter()
+            if tr and slow:
+                tr.auto_dump("slow-tick", t1)
+            if stats_requests:
+                answer_stats(send_sock, active)
+            if spectate_challenges:
+                answer_spectate_challenges(send_sock)
+            busy += t1 - now
+
+            if report is not None and (t1 - busy_mark) * 1000 >= LOAD_REPORT_MS:
+                report(busy / (t1 - busy_mark), active)
+                busy, busy_mark = 0.0, t1
+
+            if DEBUG_SERVER and (t1 - last_hb) * 1000 >= SERVER_HEARTBEAT_MS:
+                last_hb = t1
+                print(heartbeat_line(active))
+    finally:
+        if endpoint:
+            endpoint.close()
+        selector.close()
+        for match in rooms.values():
+            match.close()   # finish the match logs
+        if tr:
+            tr.dump("exit", background=False)
+
+def open_front_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("0.0.0.0", SERVER_PORT))
+    sock.setblocking(False)
+    print(f"[SERVER] UDP listening on 0.0.0.0:{SERVER_PORT}")
+    return sock
+
+# ---------------- Sharded mode: worker processes ----------------
+def worker_main(index, front_sock, control_addr, send_rate=SEND_RATE, record_dir=None, metrics_port=0,
+                trace_dir=None, sim_rate=SIM_RATE):
+    """Host rooms forwarded by the dispatcher; reply to clients straight from the front socket."""
+    global LOG_TAG, RECORD_DIR
+    LOG_TAG = f"[WORKER {index}]"
+    RECORD_DIR = record_dir
+    set_sim_rate(sim_rate)
+    if trace_dir:
+        tracing.enable(f"worker-{index}", trace_dir)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.setblocking(False)
+    sock.sendto(encode({"hello": index}), control_addr)
+    # The dispatcher stops us with terminate(); unwind so serve() can close the match logs
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    def report(busy, active):
+        if not mp.parent_process().is_alive():
+            raise SystemExit    # dispatcher is gone (killed without cleanup)
+        msg = {"load": index, "busy": round(busy, 4), "rooms": len(rooms), "active": active, "clients": len(clients),
+               "stats": server_stats(active)}
+        try:
+            sock.sendto(encode(msg), control_addr)
+        except OSError:
+            pass
+
+    try:
+        serve(sock, front_sock, forwarded=True, report=report, send_rate=send_rate, metrics_port=metrics_port)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+
+# ---------------- Sharded mode: dispatcher ----------------
+class Worker:
+    def __init__(self, index, proc):
+        self.index = index
+        self.proc = proc
+        self.addr = None        # worker's localhost socket, from its hello
+        self.busy = 0.0         # share of a core spent ticking, as last reported
+        self.rooms = 0
+        self.active = 0
+        self.clients = 0
+        self.assigned = 0       # rooms given to it since that report
+        self.stats = None       # its server_stats() from that report
+
+    def score(self):
+        per_room = self.busy / self.active if self.active else NEW_ROOM_LOAD
+        return self.busy + self.assigned * per_room
+
+def run_dispatcher(n_workers, send_rate=SEND_RATE, metrics_port=METRICS_PORT):
+    """Own SERVER_PORT and forward every datagram to the worker that hosts its room.
+
+    A room goes to the worker with the least reported tick load when its
+    first join arrives and stays there until nobody has sent to it for
+    ROOM_IDLE_TIMEOUT. Workers send snapshots directly from a copy of the
+    front socket, so clients only ever see SERVER_PORT.
+    """
+    front = open_front_socket()
+    control = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    control.bind(("127.0.0.1", 0))
+    control_addr = control.getsockname()
+
+    workers = []
+    for i in range(n_workers):
+        worker_port = metrics_port + 1 + i if metrics_port else 0
+        proc = mp.Process(target=worker_main, args=(i, front, control_addr, send_rate, RECORD_DIR, worker_port,
+                                                    TRACE_DIR, SIM_RATE), daemon=True)
+        proc.start()
+        workers.append(Worker(i, proc))
+
+    control.settimeout(WORKER_START_TIMEOUT)
+    while any(w.addr is None for w in workers):
+        data, addr = control.recvfrom(MAX_PACKET)
+        msg = decode(data)
+        if "hello" in msg:
+            workers[int(msg["hello"])].addr = addr
+    control.setblocking(False)
+    print(f"[SERVER] {n_workers} workers up: {[w.addr[1] for w in workers]}")
+    if TRACE_DIR and hasattr(signal, "SIGUSR1"):
+        # The dispatcher does no simulation; a dump request goes to every worker
+        signal.signal(signal.SIGUSR1, lambda *_: [os.kill(w.proc.pid, signal.SIGUSR1) for w in workers])
+
+    room_worker = {}    # room id -> Worker
+    room_seen = {}      # room id -> last time a client of it sent anything
+    client_room = {}    # client address -> room id
+
+    # The dispatcher's own numbers; each worker serves its simulation metrics itself
+    dmetrics = Registry()
+    d_packets = dmetrics.counter("dispatcher_packets_in_total", "Datagrams received on the front socket")
+    d_bytes = dmetrics.counter("dispatcher_bytes_in_total", "Bytes received on the front socket")
+    d_forwarded = dmetrics.counter("dispatcher_forwarded_total", "Datagrams forwarded to a worker")
+    d_unrouted = dmetrics.counter("dispatcher_unrouted_total", "Datagrams from addresses that never joined a room")
+    d_decode_failures = dmetrics.counter("dispatcher_decode_failures_total", "Datagrams that were not a valid message")
+    dmetrics.gauge("dispatcher_rooms", "Rooms assigned to a worker", lambda: len(room_worker))
+    dmetrics.gauge("dispatcher_clients", "Client addresses routed to a room", lambda: len(client_room))
+    dmetrics.gauge("dispatcher_worker_up", "1 while the worker process is alive",
+                   lambda: {w.index: int(w.proc.is_alive()) for w in workers}, label="worker")
+    dmetrics.gauge("dispatcher_worker_busy", "Share of a core each worker spends ticking (last report)",
+                   lambda: {w.index: w.busy for w in workers}, label="worker")
+    dmetrics.gauge("dispatcher_worker_rooms", "Rooms open on each worker (last report)",
+                   lambda: {w.index: w.rooms for w in workers}, label="worker")
+    dmetrics.gauge("dispatcher_worker_metrics_port", "Where each worker serves its own /metrics",
+                   lambda: {w.index: metrics_port + 1 + w.index if metrics_port else 0 for w in workers}, label="worker")
+
+    def answer_stats(addr, reset):
+        """Sum of the workers' last reports (up to LOAD_REPORT_MS old)."""
+        total = {"rooms": 0, "active": 0, "clients": 0, "spectators": 0, "cpu": 0.0, "overruns": 0, "dropped_steps": 0}
+        ticks = Histogram()
+        for w in workers:
+            if w.stats:
+                for k in total:
+                    total[k] += w.stats[k]
+                ticks.merge_wire(w.stats["tick_ms"])
+        total.update(tick_ms=ticks.to_wire(), workers=len(workers), sim_rate=SIM_RATE)
+        try:
+            front.sendto(encode({"stats": total}), addr)
+        except OSError:
+            pass
+        if reset:
+            for w in workers:
+                w.stats = None
+                control.sendto(FORWARD_HEADER.pack(socket.inet_aton(DISPATCHER_ADDR[0]), DISPATCHER_ADDR[1])
+                               + encode({"stats_reset": 1}), w.addr)
+
+    def forward(data, addr, now):
+        d_packets.inc()
+        d_bytes.inc(len(data))
+        if data[:1] == b"{":
+            msg = decode(data)
+            if not msg or not isinstance(msg, dict):
+                d_decode_failures.inc()
+                return
+            if "stats" in msg:
+                if stats_allowed(addr):
+                    answer_stats(addr, bool(msg.get("reset")))
+                return
+            if "join" in msg or "spectate" in msg:
+                client_room[addr] = str(msg.get("room", DEFAULT_ROOM))
+        room = client_room.get(addr)
+        if room is None:
+            d_unrouted.inc()
+            return
+        w = room_worker.get(room)
+        if w is None:
+            w = room_worker[room] = min(workers, key=lambda wk: (wk.score(), wk.rooms))
+            w.assigned += 1
+        room_seen[room] = now
+        control.sendto(FORWARD_HEADER.pack(socket.inet_aton(addr[0]), addr[1]) + data, w.addr)
+        d_forwarded.inc()
+
+    def on_report(msg):
+        w = workers[int(msg["load"])]
+        w.busy, w.rooms, w.active, w.clients = msg["busy"], msg["rooms"], msg["active"], msg["clients"]
+        w.stats = msg.get("stats")
+        w.assigned = 0
+
+    selector = selectors.DefaultSelector()
+    selector.register(front, selectors.EVENT_READ, "front")
+    selector.register(control, selectors.EVENT_READ, "control")
+    endpoint = open_metrics(dmetrics, selector, metrics_port)
+    last_hb = time.perf_counter()
+    try:
+        while True:
+            for key, events in selector.select(SERVER_HEARTBEAT_MS / 1000):
+                if callable(key.data):
+                    key.data(events)
+                    continue
+                for _ in range(MAX_DRAIN):
+                    try:
+                        data, addr = key.fileobj.recvfrom(MAX_PACKET)
+                    except BlockingIOError:
+                        break
+                    except OSError:
+                        continue
+                    if key.data == "front":
+                        forward(data, addr, time.perf_counter())
+                    else:
+                        msg = decode(data)
+                        if isinstance(msg, dict) and "load" in msg:
+                            on_report(msg)
+
+            now = time.perf_counter()
+            if now - last_hb >= SERVER_HEARTBEAT_MS / 1000:
+                last_hb = now
+                for room, seen in list(room_seen.items()):
+                    if now - seen > ROOM_IDLE_TIMEOUT:
+                        del room_seen[room], room_worker[room]
+                for addr, room in list(client_room.items()):
+                    if room not in room_worker:
+                        del client_room[addr]
+                if DEBUG_SERVER:
+                    print(f"[SERVER] dispatcher - rooms={len(room_worker)} clients={len(client_room)} workers=" +
+                          " ".join(f"{w.index}:{'up' if w.proc.is_alive() else 'DEAD'}/busy={w.busy * 100:.1f}%"
+                                   f"/rooms={w.rooms}/active={w.active}" for w in workers))
+    finally:
+        if endpoint:
+            endpoint.close()
+        selector.close()
+        for w in workers:
+            w.proc.terminate()
+        control.close()
+        front.close()
+
+# ---------------- Entry point ----------------
+if __name__ == "__main__":
+    workers = SERVER_WORKERS
+    if "--workers" in sys.argv:
+        workers = int(sys.argv[sys.argv.index("--workers") + 1])
+    send_rate = SEND_RATE
+    if "--send-rate" in sys.argv:
+        send_rate = int(sys.argv[sys.argv.index("--send-rate") + 1])
+    if "--sim-rate" in sys.argv:
+        set_sim_rate(int(sys.argv[sys.argv.index("--sim-rate") + 1]))
+    if "--record" in sys.argv:
+        RECORD_DIR = sys.argv[sys.argv.index("--record") + 1]
+        os.makedirs(RECORD_DIR, exist_ok=True)
+        print(f"[SERVER] Recording matches to {RECORD_DIR}")
+    metrics_port = METRICS_PORT
+    if "--metrics-port" in sys.argv:
+        metrics_port = int(sys.argv[sys.argv.index("--metrics-port") + 1])
+    if "--stats-allow" in sys.argv:
+        STATS_ALLOW = set(sys.argv[sys.argv.index("--stats-allow") + 1].split(","))
+    if "--trace" in sys.argv:
+        i = sys.argv.index("--trace") + 1
+        TRACE_DIR = sys.argv[i] if i < len(sys.argv) and not sys.argv[i].startswith("--") else "traces"
+        if workers <= 1:
+            tracing.enable("server", TRACE_DIR)
+    try:
+        if workers > 1:
+            run_dispatcher(workers, send_rate, metrics_port)
+        else:
+            sock = open_front_socket()
+            try:
+                serve(sock, sock, send_rate=send_rate, metrics_port=metrics_port)
+            finally:
+                sock.close()
+    except KeyboardInterrupt:
+        print("\n[SERVER] Shutting down.")
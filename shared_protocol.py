@@ -1,5 +1,6 @@
 # shared_protocol.py
 import json
+import struct
 
 def encode(obj: dict) -> bytes:
     """Convert a Python dict to minified JSON bytes (UTF-8)."""
@@ -11,3 +12,582 @@ def decode(data: bytes) -> dict:
         return json.loads(data.decode("utf-8"))
     except Exception:
         return {}
+
+# ---------------- Binary snapshot codec ----------------
+# Fixed-layout little-endian snapshot. JSON stays available as a debug
+# fallback (set SNAPSHOT_CODEC = "json"); decode_snapshot() accepts both,
+# since a JSON packet always starts with "{" and a binary one with SNAP_MAGIC.
+SNAPSHOT_CODEC = "binary"     # "binary" or "json"
+SNAP_MAGIC = 0xB1
+SNAP_VERSION = 2
+
+# Enums are sent as their index; 255 means "unknown / None"
+FACINGS = ("right", "left")
+ATTACK_TYPES = ("normal", "fireball", "dash", "shockwave")
+ANIMS = ("idle", "run", "walk", "jump", "double_jump", "attack1", "attack2", "hurt", "death", "climb")
+CHARS = ("Pink_Monster", "Owl_Monster", "Dude_Monster")
+ENUM_NONE = 255
+
+# Header flags
+SF_KO = 1 << 0
+SF_ONLINE = 1 << 1      # OnlineServer layout: lobby + char/anim extras follow
+SF_STARTED = 1 << 2
+SF_JOINED_P1 = 1 << 3
+SF_JOINED_P2 = 1 << 4
+SF_DELTA = 1 << 5       # body is a delta against an acked baseline
+
+# Player flags
+PF_BLOCKING = 1 << 0
+PF_ATTACKING = 1 << 1
+PF_STUNNED = 1 << 2
+PF_FACING_LEFT = 1 << 3
+PF_HITBOX = 1 << 4
+
+# magic, version, flags, tick, width, height
+HEADER = struct.Struct("<BBBIHH")
+# x, y, w, h, hp, hpMax, hpDisp, special, specialMax, block, blockMax, flags, attackType,
+# vy, knock, jumps, inputSeq (the last input frame the server applied for this player)
+PLAYER = struct.Struct("<hhHHfffffffBBffBI")
+HITBOX = struct.Struct("<hhHH")
+# anim, frame (online layout only)
+ANIM = struct.Struct("<BB")
+FIREBALL = struct.Struct("<hhB")
+# bg_index, p1_char, p2_char (online layout only)
+LOBBY = struct.Struct("<BBB")
+COUNT = struct.Struct("<B")
+
+def _enum(table, value) -> int:
+    try:
+        return table.index(value)
+    except ValueError:
+        return ENUM_NONE
+
+def _name(table, index):
+    return table[index] if index < len(table) else None
+
+def _pack_player(buf: bytearray, p: dict, online: bool):
+    flags = 0
+    if p.get("blocking"): flags |= PF_BLOCKING
+    if p.get("attacking"): flags |= PF_ATTACKING
+    if p.get("stunned"): flags |= PF_STUNNED
+    if p.get("facing") == "left": flags |= PF_FACING_LEFT
+    hb = p.get("hitbox")
+    if hb: flags |= PF_HITBOX
+
+    buf += PLAYER.pack(
+        int(p["x"]), int(p["y"]), int(p["w"]), int(p["h"]),
+        p["hp"], p["hpMax"], p["hpDisp"],
+        p["special"], p["specialMax"],
+        p["block"], p["blockMax"],
+        flags, _enum(ATTACK_TYPES, p.get("attackType", "normal")),
+        p.get("vy", 0.0), p.get("knock", 0.0), int(p.get("jumps", 0)), int(p.get("inputSeq", 0)),
+    )
+    if hb:
+        buf += HITBOX.pack(int(hb["x"]), int(hb["y"]), int(hb["w"]), int(hb["h"]))
+    if online:
+        buf += ANIM.pack(_enum(ANIMS, p.get("anim")), int(p.get("frame", 0)) & 0xFF)
+
+def _unpack_player(data: bytes, offset: int, online: bool):
+    (x, y, w, h, hp, hp_max, hp_disp, special, special_max,
+     block, block_max, flags, attack_type, vy, knock, jumps, input_seq) = PLAYER.unpack_from(data, offset)
+    offset += PLAYER.size
+
+    hb = None
+    if flags & PF_HITBOX:
+        hx, hy, hw, hh = HITBOX.unpack_from(data, offset)
+        offset += HITBOX.size
+        hb = {"x": hx, "y": hy, "w": hw, "h": hh}
+
+    p = {
+        "x": x, "y": y, "w": w, "h": h,
+        "hp": hp, "hpMax": hp_max, "hpDisp": hp_disp,
+        "special": special, "specialMax": special_max,
+        "block": block, "blockMax": block_max,
+        "facing": "left" if flags & PF_FACING_LEFT else "right",
+        "blocking": bool(flags & PF_BLOCKING),
+        "attacking": bool(flags & PF_ATTACKING),
+        "attackType": _name(ATTACK_TYPES, attack_type) or "normal",
+        "stunned": bool(flags & PF_STUNNED),
+        "hitbox": hb,
+        "vy": vy, "knock": knock, "jumps": jumps, "inputSeq": input_seq,
+    }
+    if online:
+        anim, frame = ANIM.unpack_from(data, offset)
+        offset += ANIM.size
+        p["anim"] = _name(ANIMS, anim) or "idle"
+        p["frame"] = frame
+    return p, offset
+
+def encode_binary(state: dict, tick: int = 0) -> bytes:
+    """Pack a pack_state() dict (server.py or OnlineServer layout) into bytes."""
+    online = "sim" in state
+    if online:
+        width, height = state["sim"]["w"], state["sim"]["h"]
+    else:
+        width, height = state["width"], state["height"]
+
+    flags = 0
+    if state.get("ko"): flags |= SF_KO
+    if online:
+        flags |= SF_ONLINE
+        if state.get("started"): flags |= SF_STARTED
+        joined = state.get("joined", {})
+        if joined.get("p1"): flags |= SF_JOINED_P1
+        if joined.get("p2"): flags |= SF_JOINED_P2
+
+    buf = bytearray(HEADER.pack(SNAP_MAGIC, SNAP_VERSION, flags, tick & 0xFFFFFFFF, int(width), int(height)))
+    if online:
+        buf += LOBBY.pack(int(state.get("bg_index", 0)) & 0xFF,
+                          _enum(CHARS, state.get("p1_char")), _enum(CHARS, state.get("p2_char")))
+
+    _pack_player(buf, state["p1"], online)
+    _pack_player(buf, state["p2"], online)
+
+    fbs = state.get("fireballs", [])[:255]
+    buf += COUNT.pack(len(fbs))
+    for f in fbs:
+        buf += FIREBALL.pack(int(f["x"]), int(f["y"]), _enum(FACINGS, f["dir"]))
+    return bytes(buf)
+
+def decode_binary(data: bytes) -> dict:
+    """Inverse of encode_binary(); return {} on a bad or unknown-version packet."""
+    try:
+        magic, version, flags, tick, width, height = HEADER.unpack_from(data, 0)
+        if magic != SNAP_MAGIC or version != SNAP_VERSION or flags & SF_DELTA:
+            return {}
+        offset = HEADER.size
+        online = bool(flags & SF_ONLINE)
+
+        s = {"tick": tick, "ko": bool(flags & SF_KO), "width": width, "height": height}
+        if online:
+            bg_index, p1_char, p2_char = LOBBY.unpack_from(data, offset)
+            offset += LOBBY.size
+            s.update({
+                "started": bool(flags & SF_STARTED),
+                "joined": {"p1": bool(flags & SF_JOINED_P1), "p2": bool(flags & SF_JOINED_P2)},
+                "sim": {"w": width, "h": height},
+                "bg_index": bg_index,
+                "p1_char": _name(CHARS, p1_char),
+                "p2_char": _name(CHARS, p2_char),
+            })
+
+        s["p1"], offset = _unpack_player(data, offset, online)
+        s["p2"], offset = _unpack_player(data, offset, online)
+
+        (count,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        fbs = []
+        for _ in range(count):
+            fx, fy, fdir = FIREBALL.unpack_from(data, offset)
+            offset += FIREBALL.size
+            fbs.append({"x": fx, "y": fy, "dir": _name(FACINGS, fdir) or "right"})
+        s["fireballs"] = fbs
+        return s
+    except struct.error:
+        return {}
+
+# ---------------- Delta snapshots ----------------
+# A delta packet carries the normal HEADER (with SF_DELTA set), the tick of
+# the baseline it was diffed against, a bitmask of changed fields and then
+# only those field values. Fireballs are resent whole when the list changes.
+DELTA = struct.Struct("<IQ")          # base_tick, changed-field mask
+
+SNAPSHOT_RING = 32        # baselines kept per client (~0.5 s at 60 Hz)
+KEYFRAME_INTERVAL = 60    # force a full snapshot at least this often (ticks)
+
+LOBBY_FIELDS = (("bg_index", "B"), ("p1_char", "B"), ("p2_char", "B"))
+PLAYER_FIELDS = (
+    ("x", "h"), ("y", "h"), ("w", "H"), ("h", "H"),
+    ("hp", "f"), ("hpMax", "f"), ("hpDisp", "f"),
+    ("special", "f"), ("specialMax", "f"),
+    ("block", "f"), ("blockMax", "f"),
+    ("flags", "B"), ("attackType", "B"),
+    ("hb_x", "h"), ("hb_y", "h"), ("hb_w", "H"), ("hb_h", "H"),
+    ("anim", "B"), ("frame", "B"),
+    ("vy", "f"), ("knock", "f"), ("jumps", "B"), ("inputSeq", "I"),
+)
+FIELD_STRUCTS = [struct.Struct("<" + fmt) for _, fmt in LOBBY_FIELDS + PLAYER_FIELDS + PLAYER_FIELDS]
+FIREBALL_BIT = 1 << len(FIELD_STRUCTS)
+
+def _flatten_player(p: dict) -> list:
+    flags = 0
+    if p.get("blocking"): flags |= PF_BLOCKING
+    if p.get("attacking"): flags |= PF_ATTACKING
+    if p.get("stunned"): flags |= PF_STUNNED
+    if p.get("facing") == "left": flags |= PF_FACING_LEFT
+    hb = p.get("hitbox")
+    if hb:
+        flags |= PF_HITBOX
+        hb_vals = [int(hb["x"]), int(hb["y"]), int(hb["w"]), int(hb["h"])]
+    else:
+        hb_vals = [0, 0, 0, 0]
+    return [
+        int(p["x"]), int(p["y"]), int(p["w"]), int(p["h"]),
+        p["hp"], p["hpMax"], p["hpDisp"],
+        p["special"], p["specialMax"],
+        p["block"], p["blockMax"],
+        flags, _enum(ATTACK_TYPES, p.get("attackType", "normal")),
+    ] + hb_vals + [
+        _enum(ANIMS, p.get("anim")), int(p.get("frame", 0)) & 0xFF,
+        p.get("vy", 0.0), p.get("knock", 0.0), int(p.get("jumps", 0)), int(p.get("inputSeq", 0)),
+    ]
+
+def flatten_snapshot(state: dict):
+    """Return (header_flags, width, height, field values, fireballs) for diffing."""
+    online = "sim" in state
+    flags = 0
+    if state.get("ko"): flags |= SF_KO
+    if online:
+        flags |= SF_ONLINE
+        if state.get("started"): flags |= SF_STARTED
+        joined = state.get("joined", {})
+        if joined.get("p1"): flags |= SF_JOINED_P1
+        if joined.get("p2"): flags |= SF_JOINED_P2
+        width, height = state["sim"]["w"], state["sim"]["h"]
+        vals = [int(state.get("bg_index", 0)) & 0xFF,
+                _enum(CHARS, state.get("p1_char")), _enum(CHARS, state.get("p2_char"))]
+    else:
+        width, height = state["width"], state["height"]
+        vals = [0, ENUM_NONE, ENUM_NONE]
+    vals += _flatten_player(state["p1"])
+    vals += _flatten_player(state["p2"])
+    fbs = tuple((int(f["x"]), int(f["y"]), _enum(FACINGS, f["dir"])) for f in state.get("fireballs", [])[:255])
+    return flags, int(width), int(height), vals, fbs
+
+def _unflatten_player(v: list, online: bool) -> dict:
+    flags = v[11]
+    p = {
+        "x": v[0], "y": v[1], "w": v[2], "h": v[3],
+        "hp": v[4], "hpMax": v[5], "hpDisp": v[6],
+        "special": v[7], "specialMax": v[8],
+        "block": v[9], "blockMax": v[10],
+        "facing": "left" if flags & PF_FACING_LEFT else "right",
+        "blocking": bool(flags & PF_BLOCKING),
+        "attacking": bool(flags & PF_ATTACKING),
+        "attackType": _name(ATTACK_TYPES, v[12]) or "normal",
+        "stunned": bool(flags & PF_STUNNED),
+        "hitbox": {"x": v[13], "y": v[14], "w": v[15], "h": v[16]} if flags & PF_HITBOX else None,
+        "vy": v[19], "knock": v[20], "jumps": v[21], "inputSeq": v[22],
+    }
+    if online:
+        p["anim"] = _name(ANIMS, v[17]) or "idle"
+        p["frame"] = v[18]
+    return p
+
+def unflatten_snapshot(tick: int, flags: int, width: int, height: int, vals: list, fbs) -> dict:
+    """Inverse of flatten_snapshot(); builds the same dict decode_binary() returns."""
+    online = bool(flags & SF_ONLINE)
+    s = {"tick": tick, "ko": bool(flags & SF_KO), "width": width, "height": height}
+    if online:
+        s.update({
+            "started": bool(flags & SF_STARTED),
+            "joined": {"p1": bool(flags & SF_JOINED_P1), "p2": bool(flags & SF_JOINED_P2)},
+            "sim": {"w": width, "h": height},
+            "bg_index": vals[0],
+            "p1_char": _name(CHARS, vals[1]),
+            "p2_char": _name(CHARS, vals[2]),
+        })
+    n = len(PLAYER_FIELDS)
+    s["p1"] = _unflatten_player(vals[3:3 + n], online)
+    s["p2"] = _unflatten_player(vals[3 + n:3 + 2 * n], online)
+    s["fireballs"] = [{"x": x, "y": y, "dir": _name(FACINGS, d) or "right"} for x, y, d in fbs]
+    return s
+
+def encode_delta(tick: int, flat, base_tick: int, base_flat) -> bytes:
+    """Encode only the fields of `flat` that differ from `base_flat`."""
+    flags, width, height, vals, fbs = flat
+    base_vals, base_fbs = base_flat[3], base_flat[4]
+
+    mask = 0
+    body = bytearray()
+    for i, v in enumerate(vals):
+        if v != base_vals[i]:
+            mask |= 1 << i
+            body += FIELD_STRUCTS[i].pack(v)
+    if fbs != base_fbs:
+        mask |= FIREBALL_BIT
+        body += COUNT.pack(len(fbs))
+        for f in fbs:
+            body += FIREBALL.pack(*f)
+
+    head = HEADER.pack(SNAP_MAGIC, SNAP_VERSION, flags | SF_DELTA, tick & 0xFFFFFFFF, width, height)
+    return head + DELTA.pack(base_tick & 0xFFFFFFFF, mask) + bytes(body)
+
+def decode_delta(data: bytes, baselines: dict):
+    """Apply a delta packet to its baseline; return (dict, flat) or ({}, None)."""
+    try:
+        magic, version, flags, tick, width, height = HEADER.unpack_from(data, 0)
+        if magic != SNAP_MAGIC or version != SNAP_VERSION or not flags & SF_DELTA:
+            return {}, None
+        base_tick, mask = DELTA.unpack_from(data, HEADER.size)
+        base = baselines.get(base_tick)
+        if base is None:
+            return {}, None
+        offset = HEADER.size + DELTA.size
+
+        vals = list(base[3])
+        for i, fs in enumerate(FIELD_STRUCTS):
+            if mask & (1 << i):
+                (vals[i],) = fs.unpack_from(data, offset)
+                offset += fs.size
+        fbs = base[4]
+        if mask & FIREBALL_BIT:
+            (count,) = COUNT.unpack_from(data, offset)
+            offset += COUNT.size
+            fbs = tuple(FIREBALL.unpack_from(data, offset + k * FIREBALL.size) for k in range(count))
+
+        flags &= ~SF_DELTA
+        flat = (flags, width, height, vals, fbs)
+        return unflatten_snapshot(tick, flags, width, height, vals, fbs), flat
+    except struct.error:
+        return {}, None
+
+class SnapshotSender:
+    """Per-client outgoing snapshot stream: ring buffer of sent baselines + last ack."""
+    def __init__(self, ring_size: int = SNAPSHOT_RING, keyframe_interval: int = KEYFRAME_INTERVAL):
+        self.ring = [None] * ring_size    # (tick, flat) at index tick % ring_size
+        self.acked_tick = None
+        self.last_keyframe = None
+        self.keyframe_interval = keyframe_interval
+        self.keyframes_sent = 0
+        self.deltas_sent = 0
+        self.bytes_sent = 0
+
+    def ack(self, tick: int):
+        """Record the newest snapshot tick the client reports having decoded.
+
+        An ack more than the ring size behind the current one isn't a late
+        packet: the client has reset to a restarted tick timeline.
+        """
+        if self.acked_tick is None or tick > self.acked_tick or tick < self.acked_tick - len(self.ring):
+            self.acked_tick = tick
+
+    def baseline(self):
+        if self.acked_tick is None:
+            return None
+        entry = self.ring[self.acked_tick % len(self.ring)]
+        if entry is None or entry[0] != self.acked_tick:
+            return None
+        return entry
+
+    def encode(self, state: dict, tick: int, flat=None, codec: str = None) -> bytes:
+        """Encode `state` as a delta against the acked baseline, or as a keyframe."""
+        if (codec or SNAPSHOT_CODEC) == "json":
+            pkt = encode_snapshot(state, tick, "json")
+            self.keyframes_sent += 1
+            self.bytes_sent += len(pkt)
+            return pkt
+
+        if flat is None:
+            flat = flatten_snapshot(state)
+        self.ring[tick % len(self.ring)] = (tick, flat)
+
+        base = self.baseline()
+        # (a last keyframe "in the future" means ticks restarted)
+        due = self.last_keyframe is None or not 0 <= tick - self.last_keyframe < self.keyframe_interval
+        if base is None or due:
+            pkt = encode_binary(state, tick)
+            self.last_keyframe = tick
+            self.keyframes_sent += 1
+        else:
+            pkt = encode_delta(tick, flat, base[0], base[1])
+            self.deltas_sent += 1
+        self.bytes_sent += len(pkt)
+        return pkt
+
+class SnapshotReceiver:
+    """Client side of SnapshotSender: keeps decoded baselines and the tick to ack."""
+    def __init__(self, ring_size: int = SNAPSHOT_RING):
+        self.ring_size = ring_size
+        self.baselines = {}
+        self.last_tick = None
+        self.missing_baseline = 0
+
+    def decode(self, data: bytes) -> dict:
+        """Decode a keyframe or delta; return {} if it can't be reconstructed."""
+        if data[:1] == b"{":
+            return decode(data)
+        if len(data) > 2 and data[2] & SF_DELTA:
+            s, flat = decode_delta(data, self.baselines)
+            if not s:
+                self.missing_baseline += 1
+                return {}
+        else:
+            s = decode_binary(data)
+            if not s:
+                return {}
+            flat = flatten_snapshot(s)
+
+        tick = s["tick"]
+        if self.last_tick is not None and tick < self.last_tick - self.ring_size:
+            # Ticks went back further than any reordering: the server restarted the room
+            self.baselines.clear()
+            self.last_tick = None
+        self.baselines[tick] = flat
+        while len(self.baselines) > self.ring_size:
+            del self.baselines[min(self.baselines)]
+        if self.last_tick is None or tick > self.last_tick:
+            self.last_tick = tick
+        return s
+
+# ---------------- Input packets ----------------
+# Client -> server. Each packet carries the sender's input sequence number,
+# the snapshot tick it acks, and its last INPUT_HISTORY button frames packed
+# at 6 bits per frame (newest first), so a lost packet is covered by the next.
+INPUT_MAGIC = 0xB2
+INPUT_VERSION = 1
+INPUT_HISTORY = 8
+INPUT_RATE = 60     # input frames per second a client sends
+INPUT_BUTTONS = ("left", "right", "jump", "attack", "block", "special")
+NO_ACK = 0xFFFFFFFF
+
+# magic, version, player, seq, ack, frame count
+INPUT_HEADER = struct.Struct("<BBBIIB")
+
+def pack_buttons(inputs: dict) -> int:
+    """Buttons dict -> 6-bit int (bit order follows INPUT_BUTTONS)."""
+    bits = 0
+    for i, k in enumerate(INPUT_BUTTONS):
+        if inputs.get(k):
+            bits |= 1 << i
+    return bits
+
+def unpack_buttons(bits: int) -> dict:
+    """6-bit int -> buttons dict of 0/1."""
+    return {k: (bits >> i) & 1 for i, k in enumerate(INPUT_BUTTONS)}
+
+def encode_inputs(player: int, seq: int, frames, ack=None) -> bytes:
+    """Pack the newest-first list of button bitmasks `frames` (frames[0] is `seq`)."""
+    frames = list(frames)[:INPUT_HISTORY]
+    packed = 0
+    for k, bits in enumerate(frames):
+        packed |= (bits & 0x3F) << (6 * k)
+    ack = NO_ACK if ack is None else ack & 0xFFFFFFFF
+    head = INPUT_HEADER.pack(INPUT_MAGIC, INPUT_VERSION, player, seq & 0xFFFFFFFF, ack, len(frames))
+    return head + packed.to_bytes((6 * len(frames) + 7) // 8, "little")
+
+def decode_inputs(data: bytes) -> dict:
+    """Inverse of encode_inputs(); return {} on a bad packet."""
+    try:
+        magic, version, player, seq, ack, count = INPUT_HEADER.unpack_from(data, 0)
+    except struct.error:
+        return {}
+    nbytes = (6 * count + 7) // 8
+    if magic != INPUT_MAGIC or version != INPUT_VERSION or len(data) < INPUT_HEADER.size + nbytes:
+        return {}
+    packed = int.from_bytes(data[INPUT_HEADER.size:INPUT_HEADER.size + nbytes], "little")
+    return {
+        "player": player,
+        "seq": seq,
+        "ack": None if ack == NO_ACK else ack,
+        "frames": [(packed >> (6 * k)) & 0x3F for k in range(count)],
+    }
+
+class InputBuffer:
+    """Server-side jitter buffer: reorders, de-duplicates and fills gaps in one player's inputs.
+
+    The simulation consumes one frame per tick with next_frame(). A frame that has
+    not arrived yet holds the previous buttons; if the backlog grows past
+    max_pending the oldest frames are skipped so input latency stays bounded.
+    A packet more than max_ahead frames past the next one due is dropped, so
+    a forged seq can't make pending (or the skip) arbitrarily large; only
+    max_pending of those in a row, a client that really has moved on (after
+    an outage), restart the buffer at the new seq.
+    """
+    def __init__(self, max_pending: int = 4, max_ahead: int = 32):
+        self.max_pending = max_pending
+        self.max_ahead = max_ahead
+        self.pending = {}          # seq -> button bits
+        self.next_seq = None
+        self.highest_seq = None
+        self.current = 0
+        self.applied_seq = 0       # seq of the last frame handed out (acked back in snapshots)
+        self.late = 0              # frames that arrived after their tick was consumed
+        self.recovered = 0         # frames only received through a later packet's history
+        self.skipped = 0           # frames dropped to catch up with a backlog
+        self.too_far = 0           # packets dropped for a seq beyond max_ahead
+        self.far_run = 0           # ... of them in a row
+
+    def add(self, seq: int, frames):
+        """Store the frames of one input packet (frames[k] belongs to seq - k)."""
+        if self.next_seq is None:
+            self.next_seq = seq
+        elif seq - self.next_seq > self.max_ahead:
+            self.far_run += 1
+            if self.far_run < self.max_pending:
+                self.too_far += 1
+                return
+            self.pending.clear()
+            self.next_seq = self.highest_seq = seq
+        self.far_run = 0
+        if self.highest_seq is None or seq > self.highest_seq:
+            self.highest_seq = seq
+        for k, bits in enumerate(frames):
+            s = seq - k
+            if self.next_seq is not None and s < self.next_seq:
+                if k == 0:
+                    self.late += 1
+                break
+            if s in self.pending:
+                continue
+            self.pending[s] = bits
+            if k > 0:
+                self.recovered += 1
+
+    def next_frame(self) -> int:
+        """Button bits to apply this tick."""
+        if self.next_seq is None:
+            return self.current
+
+        backlog = self.highest_seq - self.next_seq + 1
+        if backlog > self.max_pending:
+            skip_to = self.highest_seq - self.max_pending + 1
+            for s in [s for s in self.pending if s < skip_to]:
+                del self.pending[s]
+                self.skipped += 1
+            self.next_seq = skip_to
+
+        bits = self.pending.pop(self.next_seq, None)
+        if bits is not None:
+            self.current = bits
+            self.applied_seq = self.next_seq
+            self.next_seq += 1
+        return self.current
+
+# ---------------- State hash packets ----------------
+# Peer <-> peer. The sender's newest HASH_HISTORY rolling state hashes
+# (desync.DesyncDetector), newest first, so a lost packet is covered by the next.
+HASH_MAGIC = 0xB3
+HASH_VERSION = 1
+HASH_HISTORY = 8
+
+# magic, version, player, newest tick, hash count
+HASH_HEADER = struct.Struct("<BBBIB")
+
+def encode_hashes(player: int, tick: int, hashes) -> bytes:
+    hashes = list(hashes)[:HASH_HISTORY]
+    head = HASH_HEADER.pack(HASH_MAGIC, HASH_VERSION, player, tick & 0xFFFFFFFF, len(hashes))
+    return head + struct.pack(f"<{len(hashes)}I", *hashes)
+
+def decode_hashes(data: bytes) -> dict:
+    """Inverse of encode_hashes(); return {} on a bad packet."""
+    try:
+        magic, version, player, tick, count = HASH_HEADER.unpack_from(data, 0)
+        if magic != HASH_MAGIC or version != HASH_VERSION:
+            return {}
+        hashes = struct.unpack_from(f"<{count}I", data, HASH_HEADER.size)
+    except struct.error:
+        return {}
+    return {"player": player, "tick": tick, "hashes": list(hashes)}
+
+def encode_snapshot(state: dict, tick: int = 0, codec: str = None) -> bytes:
+    """Encode a snapshot with the configured codec (binary unless debugging)."""
+    if (codec or SNAPSHOT_CODEC) == "json":
+        return encode(dict(state, tick=tick))
+    return encode_binary(state, tick)
+
+def decode_snapshot(data: bytes) -> dict:
+    """Decode either snapshot codec; return {} on failure."""
+    if data[:1] == b"{":
+        return decode(data)
+    return decode_binary(data)
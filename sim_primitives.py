@@ -0,0 +1,178 @@
+# sim_primitives.py
+"""Pygame-free Rect, Sprite and Group: just enough for game_sim to run headless.
+
+They follow pygame's semantics where the simulation depends on them, so
+results match what the pygame-based simulation produced:
+  - Rect() truncates float arguments; assigning a float to an attribute
+    rounds half away from zero.
+  - colliderect() never matches a rect with zero width or height.
+  - Groups iterate in insertion order over a copy.
+"""
+
+def _round(v):
+    if type(v) is int:
+        return v
+    return int(v + 0.5) if v >= 0 else -int(-v + 0.5)
+
+class Rect:
+    __slots__ = ("_x", "_y", "_w", "_h")
+
+    def __init__(self, x, y=None, w=None, h=None):
+        if y is None:
+            x, y, w, h = x
+        self._x, self._y, self._w, self._h = int(x), int(y), int(w), int(h)
+
+    # Position / size
+    @property
+    def x(self): return self._x
+    @x.setter
+    def x(self, v): self._x = _round(v)
+
+    @property
+    def y(self): return self._y
+    @y.setter
+    def y(self, v): self._y = _round(v)
+
+    @property
+    def width(self): return self._w
+    @width.setter
+    def width(self, v): self._w = _round(v)
+
+    @property
+    def height(self): return self._h
+    @height.setter
+    def height(self, v): self._h = _round(v)
+
+    w = width
+    h = height
+
+    # Edges
+    left = x
+
+    @property
+    def top(self): return self._y
+    @top.setter
+    def top(self, v): self._y = _round(v)
+
+    @property
+    def right(self): return self._x + self._w
+    @right.setter
+    def right(self, v): self._x = _round(v) - self._w
+
+    @property
+    def bottom(self): return self._y + self._h
+    @bottom.setter
+    def bottom(self, v): self._y = _round(v) - self._h
+
+    # Centers
+    @property
+    def centerx(self): return self._x + self._w // 2
+    @centerx.setter
+    def centerx(self, v): self._x = _round(v) - self._w // 2
+
+    @property
+    def centery(self): return self._y + self._h // 2
+    @centery.setter
+    def centery(self, v): self._y = _round(v) - self._h // 2
+
+    @property
+    def center(self): return (self.centerx, self.centery)
+    @center.setter
+    def center(self, v): self.centerx, self.centery = v
+
+    @property
+    def midbottom(self): return (self.centerx, self.bottom)
+    @midbottom.setter
+    def midbottom(self, v): self.centerx, self.bottom = v
+
+    def update(self, x, y=None, w=None, h=None):
+        if y is None:
+            x, y, w, h = x
+        self._x, self._y, self._w, self._h = int(x), int(y), int(w), int(h)
+
+    def copy(self):
+        return Rect(self._x, self._y, self._w, self._h)
+
+    def colliderect(self, other) -> bool:
+        if not (self._w and self._h and other._w and other._h):
+            return False
+        return (self._x < other._x + other._w and other._x < self._x + self._w and
+                self._y < other._y + other._h and other._y < self._y + self._h)
+
+    def __iter__(self):
+        return iter((self._x, self._y, self._w, self._h))
+
+    def __len__(self):
+        return 4
+
+    def __getitem__(self, i):
+        return (self._x, self._y, self._w, self._h)[i]
+
+    def __eq__(self, other):
+        try:
+            return tuple(self) == tuple(other)
+        except TypeError:
+            return NotImplemented
+
+    def __repr__(self):
+        return f"<rect({self._x}, {self._y}, {self._w}, {self._h})>"
+
+class Sprite:
+    """Base class for anything kept in a Group; kill() removes it from all of them."""
+    def __init__(self, *groups):
+        self._groups = {}
+        for g in groups:
+            g.add(self)
+
+    def update(self, *args, **kwargs):
+        pass
+
+    def kill(self):
+        for g in list(self._groups):
+            g.remove(self)
+
+    def alive(self) -> bool:
+        return bool(self._groups)
+
+    def groups(self):
+        return list(self._groups)
+
+class Group:
+    """Ordered set of sprites."""
+    def __init__(self, *sprites):
+        self._sprites = {}
+        self.add(*sprites)
+
+    def add(self, *sprites):
+        for s in sprites:
+            if s not in self._sprites:
+                self._sprites[s] = None
+                s._groups[self] = None
+
+    def remove(self, *sprites):
+        for s in sprites:
+            if s in self._sprites:
+                del self._sprites[s]
+                del s._groups[self]
+
+    def sprites(self):
+        return list(self._sprites)
+
+    def empty(self):
+        self.remove(*list(self._sprites))
+
+    def update(self, *args, **kwargs):
+        for s in self.sprites():
+            s.update(*args, **kwargs)
+
+    def __iter__(self):
+        return iter(self.sprites())
+
+    def __len__(self):
+        return len(self._sprites)
+
+    def __contains__(self, s):
+        return s in self._sprites
+
+    def __bool__(self):
+        return bool(self._sprites)
@@ -0,0 +1,113 @@
+# spectate_client.py
+"""Watch a match: no inputs, both fighters interpolated from the spectator stream."""
+import sys
+import socket
+import time
+import pygame as pg
+from shared_protocol import encode, decode, SnapshotReceiver
+from interpolation import SnapshotBuffer
+from game_sim import SIM_RATE
+from client_render import draw_state, DirtyRenderer
+from render_cache import resources
+
+SERVER_IP = input("Enter server IP: ").strip()
+SERVER_PORT = 5000
+if ":" in SERVER_IP:    # host:port, e.g. a netem.py proxy
+    SERVER_IP, port = SERVER_IP.rsplit(":", 1)
+    SERVER_PORT = int(port)
+room_id = input("Room [default]: ").strip() or "default"
+# `--sim-rate N` when the server runs with the same flag
+sim_rate = int(sys.argv[sys.argv.index("--sim-rate") + 1]) if "--sim-rate" in sys.argv else SIM_RATE
+
+# The server drops spectators it hasn't heard from in a while
+SPECTATE_KEEPALIVE = 2.0
+# Spectator frames come every few ticks, so render a bit further in the past than players do
+SPECTATE_INTERP_DELAY = 0.12
+MAX_PACKET = 8192
+
+sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+sock.setblocking(False)
+
+pg.init()
+display_flags = pg.RESIZABLE | pg.DOUBLEBUF
+screen = pg.display.set_mode((800, 500), display_flags)
+pg.display.set_caption(f"Fighter Spectator - Room {room_id}")
+clock = pg.time.Clock()
+
+CLIENT_HEARTBEAT_MS = 2000
+DEBUG_CLIENT = True
+# `--dirty-rects`: present only what changed; see client_render.DirtyRenderer
+dirty_renderer = DirtyRenderer() if "--dirty-rects" in sys.argv else None
+
+snapshots = SnapshotReceiver()
+interp = [SnapshotBuffer(key, tick_rate=sim_rate, delay=SPECTATE_INTERP_DELAY) for key in ("p1", "p2")]
+state = None
+
+running = True
+last_keepalive = 0.0
+token = None    # the server streams only to an address that echoes the token it sent there
+last_heartbeat = 0
+received = 0
+while running:
+    clock.tick(60)
+    now = time.perf_counter()
+    if now - last_keepalive > SPECTATE_KEEPALIVE:
+        try:
+            sock.sendto(encode({"spectate": 1, "room": room_id, "token": token}), (SERVER_IP, SERVER_PORT))
+        except Exception:
+            pass
+        last_keepalive = now
+
+    now_ms = pg.time.get_ticks()
+    if DEBUG_CLIENT and now_ms - last_heartbeat > CLIENT_HEARTBEAT_MS:
+        print(f"[SPECTATOR] snapshots={received} last_tick={snapshots.last_tick} "
+              f"interp depth={interp[0].depth} underruns={interp[0].underruns} starved={interp[0].starved}")
+        last_heartbeat = now_ms
+
+    for event in pg.event.get():
+        if event.type == pg.QUIT:
+            running = False
+        elif event.type == pg.VIDEORESIZE:
+            screen = pg.display.set_mode((event.w, event.h), display_flags)
+            resources.invalidate()
+            if dirty_renderer:
+                dirty_renderer.invalidate()
+
+    while True:
+        try:
+            data, _ = sock.recvfrom(MAX_PACKET)
+        except BlockingIOError:
+            break
+        except Exception:
+            break
+        if data[:1] == b"{":
+            msg = decode(data)
+            if isinstance(msg, dict) and "token" in msg:
+                token = msg["token"]
+                last_keepalive = 0.0    # ask again with it right away
+                continue
+        s = snapshots.decode(data)
+        if s:
+            received += 1
+            state = s
+            for buf in interp:
+                buf.push(s, now)
+
+    rects = None
+    if state is None:
+        screen.fill((30, 30, 30))
+    else:
+        s = dict(state)
+        for buf in interp:
+            buf.apply(s, now)
+        if dirty_renderer:
+            rects = dirty_renderer.draw(screen, s)
+        else:
+            draw_state(screen, s)
+    if rects is None:
+        pg.display.flip()
+    else:
+        pg.display.update(rects)
+
+sock.close()
+pg.quit()
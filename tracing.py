@@ -0,0 +1,123 @@
+# tracing.py
+"""Opt-in span tracing into a ring buffer, dumped as Chrome trace JSON (chrome://tracing, ui.perfetto.dev).
+
+Nothing is recorded unless enable() was called: call sites read the module
+global `tracer` and skip the work when it is None, which costs one global
+lookup. With tracing on, each span is one tuple appended to a deque; the
+JSON is only built when a dump is asked for.
+
+    tr = tracing.tracer
+    if tr:
+        t0 = time.perf_counter()
+    ...
+    if tr:
+        tr.add("pack", t0, time.perf_counter(), tr.track(room_id))
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+TRACE_RING = 200_000        # spans kept (~a minute of a busy server)
+DUMP_COOLDOWN = 5.0         # s between automatic (slow-tick) dumps
+
+tracer = None
+
+class Tracer:
+    """Ring buffer of (name, track, start, end, args) with perf_counter() times."""
+    def __init__(self, process_name: str, capacity: int = TRACE_RING, out_dir: str = "traces"):
+        self.process_name = process_name
+        self.events = deque(maxlen=capacity)
+        self.out_dir = out_dir
+        self.tracks = {}            # track name -> tid
+        self.last_auto_dump = -DUMP_COOLDOWN
+        self.dumps = 0
+
+    def track(self, name) -> int:
+        """Small int id for a named row in the viewer (a room, a thread)."""
+        tid = self.tracks.get(name)
+        if tid is None:
+            tid = self.tracks[name] = len(self.tracks) + 1
+        return tid
+
+    def add(self, name: str, start: float, end: float, tid: int = 0, args: dict = None):
+        self.events.append((name, tid, start, end, args))
+
+    def instant(self, name: str, tid: int = 0, args: dict = None):
+        t = time.perf_counter()
+        self.events.append((name, tid, t, None, args))
+
+    def span(self, name: str, tid: int = 0):
+        """Context manager form, for code outside the hot loops."""
+        return _Span(self, name, tid)
+
+    def chrome_trace(self, events=None) -> dict:
+        pid = os.getpid()
+        out = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": self.process_name}}]
+        for name, tid in list(self.tracks.items()):
+            out.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": str(name)}})
+        for name, tid, start, end, args in self.events if events is None else events:
+            ev = {"name": name, "pid": pid, "tid": tid, "ts": round(start * 1e6, 3)}
+            if end is None:
+                ev.update(ph="i", s="t")
+            else:
+                ev.update(ph="X", dur=round((end - start) * 1e6, 3))
+            if args:
+                ev["args"] = args
+            out.append(ev)
+        return {"traceEvents": out, "displayTimeUnit": "ms"}
+
+    def dump(self, reason: str = "manual", background: bool = True) -> str:
+        """Write the ring to out_dir; the JSON is built off-thread unless background=False.
+
+        The writer thread still shares the GIL with the loop being traced, so
+        ticks during a dump run slow; any dump restarts the auto_dump cooldown
+        so that slowdown doesn't trigger another one.
+        """
+        events = list(self.events)      # cheap copy; the ring keeps filling meanwhile
+        self.last_auto_dump = time.perf_counter()
+        os.makedirs(self.out_dir, exist_ok=True)
+        tag = "".join(c if c.isalnum() or c in "-_" else "_" for c in self.process_name)
+        path = os.path.join(self.out_dir, f"trace-{time.strftime('%Y%m%d-%H%M%S')}-{tag}-{self.dumps}-{reason}.json")
+        self.dumps += 1
+
+        def write():
+            with open(path, "w") as f:
+                json.dump(self.chrome_trace(events), f, separators=(",", ":"))
+            print(f"[TRACE] {len(events)} spans -> {path}")
+
+        if background:
+            threading.Thread(target=write, daemon=True).start()
+        else:
+            write()
+        return path
+
+    def auto_dump(self, reason: str, now: float) -> bool:
+        """dump() for automatic triggers, at most once per DUMP_COOLDOWN."""
+        if now - self.last_auto_dump < DUMP_COOLDOWN:
+            return False
+        self.dump(reason)
+        return True
+
+class _Span:
+    __slots__ = ("tracer", "name", "tid", "start")
+
+    def __init__(self, tracer, name, tid):
+        self.tracer, self.name, self.tid = tracer, name, tid
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.add(self.name, self.start, time.perf_counter(), self.tid)
+
+def enable(process_name: str, out_dir: str = "traces", capacity: int = TRACE_RING) -> Tracer:
+    global tracer
+    tracer = Tracer(process_name, capacity, out_dir)
+    return tracer
+
+def disable():
+    global tracer
+    tracer = None